@@ -0,0 +1,496 @@
+"""
+ベンチマーク用に、EDINET形式の合成XBRLデータを作成する
+
+【備考】
+- 実際のEDINETタクソノミは使用せず、同じ名前空間・URLの最小限のタクソノミを作成する
+  - タクソノミは Arelle のWebキャッシュと同じディレクトリ構成で出力し、オフラインで読み込めるようにする
+- 提出書類は EDINET からダウンロードしたzipファイルと同じ構成（XBRL/PublicDoc 配下）で出力する
+  - 提出者別タクソノミ（スキーマ、表示リンク、ラベルリンク）、インスタンス
+- 各項目の数は引数で指定する
+- 【注意】タクソノミはEDINETタクソノミと同じURLで出力するため、
+  実際のEDINETタクソノミを配置したWebキャッシュとは別のディレクトリを指定すること
+"""
+
+import argparse
+import os
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+# ----- タクソノミ -----
+TAXONOMY_HOST = "disclosure.edinet-fsa.go.jp"
+TAXONOMY_DATE = "2019-11-01"
+DEI_TAXONOMY_DATE = "2013-08-31"
+TAXONOMY_BASE_URL = f"http://{TAXONOMY_HOST}/taxonomy"
+NS_JPPFS = f"{TAXONOMY_BASE_URL}/jppfs/{TAXONOMY_DATE}/jppfs_cor"
+NS_JPCRP = f"{TAXONOMY_BASE_URL}/jpcrp/{TAXONOMY_DATE}/jpcrp_cor"
+NS_JPDEI = f"{TAXONOMY_BASE_URL}/jpdei/{DEI_TAXONOMY_DATE}/jpdei_cor"
+SCHEMA_URLS = {
+    "jppfs_cor": f"{TAXONOMY_BASE_URL}/jppfs/{TAXONOMY_DATE}/jppfs_cor_{TAXONOMY_DATE}.xsd",
+    "jpcrp_cor": f"{TAXONOMY_BASE_URL}/jpcrp/{TAXONOMY_DATE}/jpcrp_cor_{TAXONOMY_DATE}.xsd",
+    "jpdei_cor": f"{TAXONOMY_BASE_URL}/jpdei/{DEI_TAXONOMY_DATE}/jpdei_cor_{DEI_TAXONOMY_DATE}.xsd",
+}
+NAMESPACES = {
+    "jppfs_cor": NS_JPPFS,
+    "jpcrp_cor": NS_JPCRP,
+    "jpdei_cor": NS_JPDEI,
+}
+ROLE_BASE = f"http://{TAXONOMY_HOST}/role/jppfs"
+LABEL_ROLE = "http://www.xbrl.org/2003/role/label"
+VERBOSE_LABEL_ROLE = "http://www.xbrl.org/2003/role/verboseLabel"
+TOTAL_LABEL_ROLE = "http://www.xbrl.org/2003/role/totalLabel"
+
+# DEI要素（要素名, 型, 値）
+DEI_ELEMENTS = [
+    ("AccountingStandardsDEI", "string", "会計基準"),
+    ("DocumentTypeDEI", "string", "様式"),
+    ("EDINETCodeDEI", "string", "ＥＤＩＮＥＴコード"),
+    ("WhetherConsolidatedFinancialStatementsArePreparedDEI", "boolean", "連結決算の有無"),
+    ("SecurityCodeDEI", "string", "証券コード"),
+    ("FilerNameInJapaneseDEI", "string", "提出者名"),
+    ("CurrentFiscalYearStartDateDEI", "date", "当事業年度開始日"),
+    ("TypeOfCurrentPeriodDEI", "string", "当会計期間の種類"),
+    ("CurrentPeriodEndDateDEI", "date", "当会計期間終了日"),
+    ("CurrentFiscalYearEndDateDEI", "date", "当事業年度終了日"),
+    ("AmendmentFlagDEI", "boolean", "訂正の有無"),
+]
+
+XSD_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<xsd:schema targetNamespace="{ns}" elementFormDefault="qualified"
+  xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+  xmlns:xbrli="http://www.xbrl.org/2003/instance"
+  xmlns:link="http://www.xbrl.org/2003/linkbase"
+  xmlns:xlink="http://www.w3.org/1999/xlink"
+  xmlns:xbrldt="http://xbrl.org/2005/xbrldt"
+  xmlns:nonnum="http://www.xbrl.org/dtr/type/non-numeric"{extra_ns}>
+<xsd:annotation><xsd:appinfo>
+{appinfo}
+</xsd:appinfo></xsd:annotation>
+<xsd:import namespace="http://www.xbrl.org/2003/instance" schemaLocation="http://www.xbrl.org/2003/xbrl-instance-2003-12-31.xsd"/>
+<xsd:import namespace="http://xbrl.org/2005/xbrldt" schemaLocation="http://www.xbrl.org/2005/xbrldt-2005.xsd"/>
+{imports}
+"""
+
+LINKBASE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<link:linkbase xmlns:link="http://www.xbrl.org/2003/linkbase"
+  xmlns:xlink="http://www.w3.org/1999/xlink"
+  xmlns:xml="http://www.w3.org/XML/1998/namespace">
+"""
+
+
+def element_xsd(name, type_name, period_type, abstract=False, substitution_group="xbrli:item"):
+    """スキーマの要素定義"""
+
+    return (
+        f'<xsd:element name="{name}" id="{{prefix}}_{name}" type="{type_name}" '
+        f'substitutionGroup="{substitution_group}" abstract="{str(abstract).lower()}" '
+        f'nillable="true" xbrli:periodType="{period_type}"/>'
+    )
+
+
+def label_linkbase(prefix, schema_href, labels):
+    """ラベルリンクベース（labels: (要素名, ロール, 言語, ラベル) のリスト）"""
+
+    lines = [LINKBASE_HEADER, '<link:labelLink xlink:type="extended" xlink:role="http://www.xbrl.org/2003/role/link">']
+    locs = set()
+    for index, (name, role, lang, text) in enumerate(labels):
+        if name not in locs:
+            lines.append(
+                f'<link:loc xlink:type="locator" xlink:href="{schema_href}#{prefix}_{name}" xlink:label="{name}"/>')
+            locs.add(name)
+        lines.append(
+            f'<link:label xlink:type="resource" xlink:label="label_{name}_{index}" xlink:role="{role}" '
+            f'xml:lang="{lang}">{escape(text)}</link:label>')
+        lines.append(
+            f'<link:labelArc xlink:type="arc" xlink:arcrole="http://www.xbrl.org/2003/arcrole/concept-label" '
+            f'xlink:from="{name}" xlink:to="label_{name}_{index}"/>')
+    lines.append("</link:labelLink>\n</link:linkbase>\n")
+    return "\n".join(lines)
+
+
+def write_file(path, text):
+    """UTF-8 でファイルを出力する（ディレクトリがない場合、作成する）"""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def url_to_cache_path(cache_dir, url):
+    """URLに対応する Arelle のWebキャッシュ上のパス"""
+
+    scheme, rest = url.split("://", 1)
+    return os.path.join(cache_dir, scheme, *rest.split("/"))
+
+
+class TaxonomySpec:
+    """合成タクソノミの勘定科目構成"""
+
+    def __init__(self, bs_level1=2, bs_level2=3, bs_level3=8, pl_items=15, title_children=3, seed=0):
+        rnd = random.Random(seed)
+        self.bs_level1 = bs_level1
+        self.bs_level2 = bs_level2
+        self.bs_level3 = bs_level3
+        self.pl_items = pl_items
+        self.title_children = title_children
+        # 貸借対照表: 第一階層（タイトル）> 第二階層（タイトル）> 第三階層（科目 or タイトル+内訳）
+        self.bs_tree = []
+        for i in range(bs_level1):
+            level2 = []
+            for j in range(bs_level2):
+                level3 = []
+                for k in range(bs_level3):
+                    name = f"BsItem{i}x{j}x{k}"
+                    if rnd.random() < 0.2:
+                        children = [f"{name}Detail{n}" for n in range(title_children - 1)] + [f"{name}Total"]
+                        level3.append((f"{name}Abstract", children))
+                    else:
+                        level3.append((name, None))
+                level2.append((f"BsGroup{i}x{j}Abstract", level3))
+            self.bs_tree.append((f"BsSection{i}Abstract", level2, f"BsSection{i}Total"))
+        # 損益計算書: 第一階層（科目 or タイトル+内訳）
+        self.pl_items_tree = []
+        for i in range(pl_items):
+            name = f"PlItem{i}"
+            if rnd.random() < 0.2:
+                children = [f"{name}Detail{n}" for n in range(title_children - 1)] + [f"{name}Total"]
+                self.pl_items_tree.append((f"{name}Abstract", children))
+            else:
+                self.pl_items_tree.append((name, None))
+
+    def bs_items(self):
+        """貸借対照表の（要素名, abstract）"""
+
+        for section, level2, total in self.bs_tree:
+            yield section, True
+            yield total, False
+            for group, level3 in level2:
+                yield group, True
+                for name, children in level3:
+                    yield name, children is not None
+                    for child in children or []:
+                        yield child, False
+
+    def pl_items_all(self):
+        """損益計算書の（要素名, abstract）"""
+
+        for name, children in self.pl_items_tree:
+            yield name, children is not None
+            for child in children or []:
+                yield child, False
+
+
+def write_taxonomy(cache_dir, spec, segment_items):
+    """合成したEDINETタクソノミ（jppfs, jpcrp, jpdei）を出力する"""
+
+    # jpdei
+    dei_elements = [
+        element_xsd(name, "xbrli:booleanItemType" if type_name == "boolean" else
+                    "xbrli:dateItemType" if type_name == "date" else "xbrli:stringItemType", "duration")
+        for name, type_name, _ in DEI_ELEMENTS
+    ]
+    # jppfs
+    pfs_elements = [
+        element_xsd("BalanceSheetLineItems", "xbrli:stringItemType", "duration", abstract=True),
+        element_xsd("StatementOfIncomeLineItems", "xbrli:stringItemType", "duration", abstract=True),
+        element_xsd("ConsolidatedOrNonConsolidatedAxis", "xbrli:stringItemType", "duration",
+                    abstract=True, substitution_group="xbrldt:dimensionItem"),
+        element_xsd("NonConsolidatedMember", "nonnum:domainItemType", "duration", abstract=True),
+    ]
+    for name, abstract in spec.bs_items():
+        pfs_elements.append(element_xsd(
+            name, "xbrli:stringItemType" if abstract else "xbrli:monetaryItemType", "instant", abstract=abstract))
+    for name, abstract in spec.pl_items_all():
+        pfs_elements.append(element_xsd(
+            name, "xbrli:stringItemType" if abstract else "xbrli:monetaryItemType", "duration", abstract=abstract))
+    # jpcrp
+    crp_elements = [
+        element_xsd("OperatingSegmentsAxis", "xbrli:stringItemType", "duration",
+                    abstract=True, substitution_group="xbrldt:dimensionItem"),
+        element_xsd("ReportableSegmentsMember", "nonnum:domainItemType", "duration", abstract=True),
+    ]
+    for name in segment_items:
+        crp_elements.append(element_xsd(name, "xbrli:monetaryItemType", "duration"))
+
+    for prefix, elements in [("jpdei_cor", dei_elements), ("jppfs_cor", pfs_elements), ("jpcrp_cor", crp_elements)]:
+        schema_url = SCHEMA_URLS[prefix]
+        schema_file = schema_url.rsplit("/", 1)[1]
+        base = schema_file[:-len(".xsd")]
+        lab_files = [f"label/{base}_lab.xml", f"label/{base}_lab-en.xml"]
+        appinfo = "\n".join(
+            f'<link:linkbaseRef xlink:type="simple" xlink:href="{lab}" '
+            f'xlink:role="http://www.xbrl.org/2003/role/labelLinkbaseRef" '
+            f'xlink:arcrole="http://www.w3.org/1999/xlink/properties/linkbase"/>'
+            for lab in lab_files
+        )
+        text = XSD_HEADER.format(
+            ns=NAMESPACES[prefix], extra_ns="", appinfo=appinfo,
+            imports='<xsd:import namespace="http://www.xbrl.org/dtr/type/non-numeric" '
+                    'schemaLocation="http://www.xbrl.org/dtr/type/nonNumeric-2009-12-16.xsd"/>'
+        )
+        text += "\n".join(e.replace("{prefix}", prefix) for e in elements) + "\n</xsd:schema>\n"
+        schema_dir = os.path.dirname(url_to_cache_path(cache_dir, schema_url))
+        write_file(os.path.join(schema_dir, schema_file), text)
+        # ラベル（日本語・英語、標準・冗長）
+        names = [e.split('name="', 1)[1].split('"', 1)[0] for e in elements]
+        dei_labels = {name: label for name, _, label in DEI_ELEMENTS}
+        labels_ja, labels_en = [], []
+        for name in names:
+            ja = dei_labels.get(name, f"{name}（ラベル）")
+            labels_ja.append((name, LABEL_ROLE, "ja", ja))
+            labels_ja.append((name, VERBOSE_LABEL_ROLE, "ja", f"{ja}（冗長）"))
+            labels_en.append((name, LABEL_ROLE, "en", name))
+            labels_en.append((name, VERBOSE_LABEL_ROLE, "en", f"{name} (verbose)"))
+        write_file(os.path.join(schema_dir, lab_files[0]), label_linkbase(prefix, f"../{schema_file}", labels_ja))
+        write_file(os.path.join(schema_dir, lab_files[1]), label_linkbase(prefix, f"../{schema_file}", labels_en))
+
+
+def presentation_link(role, arcs):
+    """表示リンク（arcs: (親のhref, 親のラベル, 子のhref, 子のラベル, 順序) のリスト）"""
+
+    lines = [f'<link:presentationLink xlink:type="extended" xlink:role="{role}">']
+    locs = set()
+    for parent_href, parent, child_href, child, order in arcs:
+        for href, label in [(parent_href, parent), (child_href, child)]:
+            if label not in locs:
+                lines.append(f'<link:loc xlink:type="locator" xlink:href="{href}" xlink:label="{label}"/>')
+                locs.add(label)
+        lines.append(
+            f'<link:presentationArc xlink:type="arc" xlink:arcrole="http://www.xbrl.org/2003/arcrole/parent-child" '
+            f'xlink:from="{parent}" xlink:to="{child}" order="{order}"/>')
+    lines.append("</link:presentationLink>")
+    return "\n".join(lines)
+
+
+def href(prefix, name):
+    """EDINETタクソノミの要素へのhref"""
+
+    return f"{SCHEMA_URLS[prefix]}#{prefix}_{name}"
+
+
+def bs_arcs(spec):
+    """貸借対照表の表示リンクのアーク"""
+
+    arcs = []
+    root = ("jppfs_cor", "BalanceSheetLineItems")
+    for order1, (section, level2, total) in enumerate(spec.bs_tree, 1):
+        arcs.append((href(*root), root[1], href("jppfs_cor", section), section, order1 * 2 - 1))
+        for order2, (group, level3) in enumerate(level2, 1):
+            arcs.append((href("jppfs_cor", section), section, href("jppfs_cor", group), group, order2))
+            for order3, (name, children) in enumerate(level3, 1):
+                arcs.append((href("jppfs_cor", group), group, href("jppfs_cor", name), name, order3))
+                for order4, child in enumerate(children or [], 1):
+                    arcs.append((href("jppfs_cor", name), name, href("jppfs_cor", child), child, order4))
+        arcs.append((href(*root), root[1], href("jppfs_cor", total), total, order1 * 2))
+    return arcs
+
+
+def pl_arcs(spec):
+    """損益計算書の表示リンクのアーク"""
+
+    arcs = []
+    root = ("jppfs_cor", "StatementOfIncomeLineItems")
+    for order1, (name, children) in enumerate(spec.pl_items_tree, 1):
+        arcs.append((href(*root), root[1], href("jppfs_cor", name), name, order1))
+        for order2, child in enumerate(children or [], 1):
+            arcs.append((href("jppfs_cor", name), name, href("jppfs_cor", child), child, order2))
+    return arcs
+
+
+def context_xml(context_id, edinetcd, period, dims=()):
+    """コンテキスト（dims: (軸のQName, メンバーのQName) のリスト）"""
+
+    if len(period) == 1:
+        period_xml = f"<xbrli:instant>{period[0]}</xbrli:instant>"
+    else:
+        period_xml = f"<xbrli:startDate>{period[0]}</xbrli:startDate><xbrli:endDate>{period[1]}</xbrli:endDate>"
+    scenario = ""
+    if dims:
+        scenario = "<xbrli:scenario>" + "".join(
+            f'<xbrldi:explicitMember dimension="{dim}">{mem}</xbrldi:explicitMember>' for dim, mem in dims
+        ) + "</xbrli:scenario>"
+    return (
+        f'<xbrli:context id="{context_id}"><xbrli:entity>'
+        f'<xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">{edinetcd}-000</xbrli:identifier>'
+        f'</xbrli:entity><xbrli:period>{period_xml}</xbrli:period>{scenario}</xbrli:context>'
+    )
+
+
+def make_filing(out_dir, spec, index, segment_items, segments=4, periods=2,
+                accounting_std="Japan GAAP", doc_type="第三号様式", has_consolidated=True, seed=0):
+    """提出書類1件分のzipファイルを作成し、パスを返す"""
+
+    rnd = random.Random(seed * 100003 + index)
+    edinetcd = f"E{10000 + index:05d}"
+    docid = f"S100{index:04X}"
+    year = 2020
+    period_end = f"{year}-03-31"
+    fy_start = f"{year - 1}-04-01"
+    base = f"jpcrp030000-asr-001_{edinetcd}-000_{period_end}_01_{year}-06-25"
+    filer_ns = f"http://disclosure.edinet-fsa.go.jp/jpcrp030000/asr/001/{edinetcd}-000/{period_end}/01/{year}-06-25"
+    filer_prefix = "jpcrp030000-asr_" + edinetcd + "-000"
+    member_names = [f"Segment{n}ReportableSegmentMember" for n in range(segments)]
+
+    # 提出者別タクソノミ
+    appinfo = "\n".join([
+        f'<link:linkbaseRef xlink:type="simple" xlink:href="{base}_pre.xml" '
+        f'xlink:role="http://www.xbrl.org/2003/role/presentationLinkbaseRef" '
+        f'xlink:arcrole="http://www.w3.org/1999/xlink/properties/linkbase"/>',
+        f'<link:linkbaseRef xlink:type="simple" xlink:href="{base}_lab.xml" '
+        f'xlink:role="http://www.xbrl.org/2003/role/labelLinkbaseRef" '
+        f'xlink:arcrole="http://www.w3.org/1999/xlink/properties/linkbase"/>',
+    ])
+    imports = "\n".join(
+        f'<xsd:import namespace="{NAMESPACES[prefix]}" schemaLocation="{SCHEMA_URLS[prefix]}"/>'
+        for prefix in ["jpdei_cor", "jppfs_cor", "jpcrp_cor"]
+    ) + '\n<xsd:import namespace="http://www.xbrl.org/dtr/type/non-numeric" ' \
+        'schemaLocation="http://www.xbrl.org/dtr/type/nonNumeric-2009-12-16.xsd"/>'
+    schema = XSD_HEADER.format(ns=filer_ns, extra_ns="", appinfo=appinfo, imports=imports)
+    schema += "\n".join(
+        element_xsd(name, "nonnum:domainItemType", "duration", abstract=True).replace("{prefix}", filer_prefix)
+        for name in member_names
+    ) + "\n</xsd:schema>\n"
+    filer_labels = [(name, LABEL_ROLE, "ja", f"セグメント{n}") for n, name in enumerate(member_names)] + \
+        [(name, LABEL_ROLE, "en", f"Segment {n}") for n, name in enumerate(member_names)]
+    lab = label_linkbase(filer_prefix, f"{base}.xsd", filer_labels)
+    pre_links = []
+    for consolidated in ([True, False] if has_consolidated else [False]):
+        prefix_role = "Consolidated" if consolidated else ""
+        pre_links.append(presentation_link(f"{ROLE_BASE}/rol_{prefix_role}BalanceSheet", bs_arcs(spec)))
+        pre_links.append(presentation_link(f"{ROLE_BASE}/rol_{prefix_role}StatementOfIncome", pl_arcs(spec)))
+    pre = LINKBASE_HEADER + "\n".join(pre_links) + "\n</link:linkbase>\n"
+
+    # インスタンス
+    contexts = [context_xml("FilingDateInstant", edinetcd, (f"{year}-06-25",))]
+    facts = []
+    dei_values = {
+        "AccountingStandardsDEI": accounting_std,
+        "DocumentTypeDEI": doc_type,
+        "EDINETCodeDEI": edinetcd,
+        "WhetherConsolidatedFinancialStatementsArePreparedDEI": "true" if has_consolidated else "false",
+        "SecurityCodeDEI": f"{10000 + index}",
+        "FilerNameInJapaneseDEI": f"株式会社テスト{index}",
+        "CurrentFiscalYearStartDateDEI": fy_start,
+        "TypeOfCurrentPeriodDEI": "FY",
+        "CurrentPeriodEndDateDEI": period_end,
+        "CurrentFiscalYearEndDateDEI": period_end,
+        "AmendmentFlagDEI": "false",
+    }
+    for name, _, _ in DEI_ELEMENTS:
+        facts.append(f'<jpdei_cor:{name} contextRef="FilingDateInstant">{escape(dei_values[name])}</jpdei_cor:{name}>')
+    non_consolidated_dim = [("jppfs_cor:ConsolidatedOrNonConsolidatedAxis", "jppfs_cor:NonConsolidatedMember")]
+    period_names = ["CurrentYear"] + [f"Prior{n}Year" for n in range(1, periods)]
+    for n, period_name in enumerate(period_names):
+        end = f"{year - n}-03-31"
+        start = f"{year - n - 1}-04-01"
+        for consolidated in ([True, False] if has_consolidated else [False]):
+            suffix = "" if consolidated else "_NonConsolidatedMember"
+            dims = () if consolidated else non_consolidated_dim
+            contexts.append(context_xml(f"{period_name}Instant{suffix}", edinetcd, (end,), dims))
+            contexts.append(context_xml(f"{period_name}Duration{suffix}", edinetcd, (start, end), dims))
+            for name, abstract in spec.bs_items():
+                if not abstract:
+                    facts.append(
+                        f'<jppfs_cor:{name} contextRef="{period_name}Instant{suffix}" unitRef="JPY" decimals="-6">'
+                        f'{rnd.randint(1, 10 ** 6) * 10 ** 6}</jppfs_cor:{name}>')
+            for name, abstract in spec.pl_items_all():
+                if not abstract:
+                    facts.append(
+                        f'<jppfs_cor:{name} contextRef="{period_name}Duration{suffix}" unitRef="JPY" decimals="-6">'
+                        f'{rnd.randint(-10 ** 5, 10 ** 6) * 10 ** 6}</jppfs_cor:{name}>')
+        for member in member_names + ["ReportableSegmentsMember"]:
+            member_qname = f"jpcrp_cor:{member}" if member == "ReportableSegmentsMember" else f"{filer_prefix}:{member}"
+            context_id = f"{period_name}Duration_{member}"
+            contexts.append(context_xml(
+                context_id, edinetcd, (start, end), [("jpcrp_cor:OperatingSegmentsAxis", member_qname)]))
+            for name in segment_items:
+                facts.append(
+                    f'<jpcrp_cor:{name} contextRef="{context_id}" unitRef="JPY" decimals="-6">'
+                    f'{rnd.randint(1, 10 ** 5) * 10 ** 6}</jpcrp_cor:{name}>')
+    instance = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance" '
+        'xmlns:link="http://www.xbrl.org/2003/linkbase" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        'xmlns:iso4217="http://www.xbrl.org/2003/iso4217" xmlns:xbrldi="http://xbrl.org/2006/xbrldi" '
+        + "".join(f'xmlns:{prefix}="{ns}" ' for prefix, ns in NAMESPACES.items())
+        + f'xmlns:{filer_prefix}="{filer_ns}">\n'
+        f'<link:schemaRef xlink:type="simple" xlink:href="{base}.xsd"/>\n'
+        + "\n".join(contexts)
+        + '\n<xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>\n'
+        + "\n".join(facts)
+        + "\n</xbrli:xbrl>\n"
+    )
+
+    zip_path = os.path.join(out_dir, f"サービス業_120_{edinetcd}_{docid}.zip")
+    os.makedirs(out_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"XBRL/PublicDoc/{base}.xsd", schema)
+        zf.writestr(f"XBRL/PublicDoc/{base}_pre.xml", pre)
+        zf.writestr(f"XBRL/PublicDoc/{base}_lab.xml", lab)
+        zf.writestr(f"XBRL/PublicDoc/{base}.xbrl", instance)
+    return zip_path
+
+
+def write_edinetcd_list(path, filings):
+    """
+    合成した提出書類の提出者のEDINETコードリストを出力する（edinetcd_info.EDINETCD_LOCAL_FILE 用）
+    【備考】EDINETサイトからダウンロードしたファイルと同じく、cp932で1行目は見出しの前の説明行
+    """
+
+    lines = [
+        "ダウンロード実行日,2020年07月01日現在,件数,{}件".format(filings),
+        "ＥＤＩＮＥＴコード,提出者種別,上場区分,提出者業種,提出者名",
+    ]
+    for index in range(filings):
+        lines.append(f"E{10000 + index:05d},内国法人・組合,上場,サービス業,株式会社テスト{index}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="cp932", newline="") as f:
+        f.write("\r\n".join(lines) + "\r\n")
+
+
+def generate(out_dir, cache_dir, filings=10, segments=4, periods=2, segment_items_num=5,
+             doc_type="第三号様式", non_jgaap_ratio=0.0, seed=0, **spec_kwargs):
+    """合成タクソノミと提出書類を出力し、zipファイルのパスのリストを返す"""
+
+    spec = TaxonomySpec(seed=seed, **spec_kwargs)
+    segment_items = [f"SegmentItem{n}" for n in range(segment_items_num)]
+    write_taxonomy(cache_dir, spec, segment_items)
+    rnd = random.Random(seed)
+    zip_paths = []
+    for index in range(filings):
+        accounting_std = "IFRS" if rnd.random() < non_jgaap_ratio else "Japan GAAP"
+        zip_paths.append(make_filing(
+            out_dir, spec, index, segment_items, segments=segments, periods=periods,
+            accounting_std=accounting_std, doc_type=doc_type, seed=seed))
+    return zip_paths
+
+
+def main():
+    """コマンドライン引数で指定した件数・構成の提出書類を作成する"""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir", help="zipファイルの出力先")
+    parser.add_argument("cache_dir", help="タクソノミの出力先（ArelleのWebキャッシュのディレクトリ）")
+    parser.add_argument("--filings", type=int, default=10)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--periods", type=int, default=2)
+    parser.add_argument("--bs-level3", type=int, default=8)
+    parser.add_argument("--pl-items", type=int, default=15)
+    parser.add_argument("--doc-type", default="第三号様式")
+    parser.add_argument("--segment-items", type=int, default=5)
+    parser.add_argument("--non-jgaap-ratio", type=float, default=0.0, help="日本基準以外（IFRS）の書類の割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--edinetcd-list", default=None, help="EDINETコードリストの出力先（省略時は出力しない）")
+    args = parser.parse_args()
+    zip_paths = generate(
+        args.out_dir, args.cache_dir, filings=args.filings, segments=args.segments,
+        periods=args.periods, segment_items_num=args.segment_items, doc_type=args.doc_type,
+        non_jgaap_ratio=args.non_jgaap_ratio, seed=args.seed,
+        bs_level3=args.bs_level3, pl_items=args.pl_items)
+    print(f"{len(zip_paths)}件のzipファイルを作成しました: {args.out_dir}")
+    if args.edinetcd_list is not None:
+        write_edinetcd_list(args.edinetcd_list, args.filings)
+
+
+if __name__ == "__main__":
+    main()
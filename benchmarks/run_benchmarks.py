@@ -0,0 +1,270 @@
+"""
+XBRL解析のベンチマーク
+
+合成したEDINET形式の提出書類（generate_filings.py）を使い、取得処理の所要時間を計測して
+結果をJSONで出力する
+
+【備考】
+- ネットワークに接続せずに実行できる
+  - 合成タクソノミは作業ディレクトリ配下の専用のWebキャッシュに出力し、オフラインで読み込む
+    （実際のEDINETタクソノミを配置したWebキャッシュは使わない・上書きしない）
+  - EDINETコードリストも合成したものを使う
+- 計測するシナリオ
+  - 関数単位（function）: 提出書類ごとに1度読み込み、各取得関数を指定回数実行する
+    - 読み込み（model_manager.load）、get_dei_facts、FactIndex の作成、
+      get_bs_facts、get_pl_facts、get_segments_facts
+  - 処理全体（main）: 各スクリプトの main() を、プロセス数ごとに実行する
+    - xbrl_parser_for_bs / pl / segment、xbrl_parser_pipeline
+- 各スクリプトの設定（モジュール変数）はベンチマーク用に書き換える
+  - 2プロセス以上の main() は、ワーカープロセスに書き換えた設定を引き継ぐため fork（Linux）を前提とする
+- 結果のJSONには実行環境・パラメータ・シナリオごとの所要時間を含む
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# リポジトリ直下のモジュールを読み込めるようにする
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import generate_filings  # noqa: E402
+
+# 作業ディレクトリ（合成データ・出力ファイルの保存先）
+BENCHMARK_WORK_DIR = os.path.join(tempfile.gettempdir(), "xbrl_parser_benchmark")
+# 結果の出力先
+BENCHMARK_RESULT_FILE = "benchmark_results.json"
+# 合成する提出書類の件数
+BENCHMARK_FILINGS = 20
+# 関数単位のシナリオで、提出書類ごとに各関数を実行する回数
+BENCHMARK_REPEAT = 5
+# 処理全体のシナリオで使用するプロセス数のリスト
+BENCHMARK_WORKERS = [1, 2]
+# 合成データの乱数シード（同じシードでは同じデータを作成する）
+BENCHMARK_SEED = 0
+# 合成する書類の様式（セグメント情報の処理対象の様式にも設定する）
+BENCHMARK_DOC_TYPE = "第三号様式"
+# 処理全体のシナリオで計測するモジュール
+MAIN_MODULES = ["xbrl_parser_for_bs", "xbrl_parser_for_pl", "xbrl_parser_for_segment", "xbrl_parser_pipeline"]
+
+
+def prepare_data(work_dir, filings, seed, **generate_kwargs):
+    """
+    合成データ（提出書類のzipファイル・タクソノミ・EDINETコードリスト）を作成する
+    戻り値: (XBRLファイルのルートディレクトリ, Webキャッシュのディレクトリ, EDINETコードリストのパス)
+    """
+
+    data_dir = os.path.join(work_dir, "data")
+    cache_dir = os.path.join(work_dir, "cache")
+    # 【備考】件数・構成を変えて再実行した場合に前回のファイルが残らないよう、作り直す
+    for dir_path in [data_dir, cache_dir]:
+        if os.path.exists(dir_path):
+            shutil.rmtree(dir_path)
+    generate_filings.generate(
+        os.path.join(data_dir, "zip"), cache_dir, filings=filings, seed=seed, **generate_kwargs)
+    edinetcd_list = os.path.join(work_dir, "EdinetcodeDlInfo.csv")
+    generate_filings.write_edinetcd_list(edinetcd_list, filings)
+    return data_dir, cache_dir, edinetcd_list
+
+
+def configure_modules(data_dir, cache_dir, edinetcd_list, doc_type):
+    """各スクリプトの設定をベンチマーク用に書き換える"""
+
+    import edinetcd_info
+    import taxonomy_cache
+
+    taxonomy_cache.TAXONOMY_CACHE_DIR = cache_dir
+    taxonomy_cache.TAXONOMY_WORK_OFFLINE = True
+    taxonomy_cache.EDINET_TAXONOMY_DIR = None
+    taxonomy_cache.TAXONOMY_PACKAGE_FILES = []
+    edinetcd_info.EDINETCD_LOCAL_FILE = edinetcd_list
+    edinetcd_info.EDINETCD_CACHE_FILE = os.path.join(os.path.dirname(edinetcd_list), "EdinetcodeDlInfo.pkl")
+    for module_name in MAIN_MODULES:
+        module = __import__(module_name)
+        module.EDINET_ROOT_DIR = data_dir
+        module.READ_FROM_ZIP = True
+        module.INCREMENTAL = False
+        module.OUTPUT_FORMAT = "csv"
+        if hasattr(module, "TGT_DOC_TYPE"):
+            module.TGT_DOC_TYPE = doc_type
+
+
+def summarize(durations):
+    """所要時間（秒）のリストを集計する"""
+
+    return {
+        "calls": len(durations),
+        "total_sec": sum(durations),
+        "mean_sec": statistics.mean(durations),
+        "median_sec": statistics.median(durations),
+        "min_sec": min(durations),
+        "max_sec": max(durations),
+    }
+
+
+def timed(durations, func, *args):
+    """関数を実行し、所要時間を durations に追加して戻り値を返す"""
+
+    start = time.perf_counter()
+    result = func(*args)
+    durations.append(time.perf_counter() - start)
+    return result
+
+
+def run_function_scenarios(xbrl_files, repeat):
+    """関数単位のシナリオを実行し、シナリオごとの集計結果のリストを返す"""
+
+    import xbrl_parser_for_bs as bs
+    import xbrl_parser_for_pl as pl
+    import xbrl_parser_for_segment as segment
+    from fact_index import FactIndex
+    from xbrl_batch import create_model_manager
+
+    model_manager = create_model_manager()
+    durations = {name: [] for name in [
+        "load",
+        "xbrl_parser_for_bs.get_dei_facts",
+        "FactIndex",
+        "xbrl_parser_for_bs.get_bs_facts",
+        "xbrl_parser_for_pl.get_dei_facts",
+        "xbrl_parser_for_pl.get_pl_facts",
+        "xbrl_parser_for_segment.get_dei_facts",
+        "xbrl_parser_for_segment.get_segments_facts",
+    ]}
+    # 【備考】取得関数の出力（処理対象外の書類の通知など）は計測の妨げになるため破棄する
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for xbrl_file in xbrl_files:
+            model_xbrl = timed(durations["load"], model_manager.load, xbrl_file)
+            for _ in range(repeat):
+                dei_facts, has_consolidated, type_of_period = timed(
+                    durations["xbrl_parser_for_bs.get_dei_facts"], bs.get_dei_facts, model_xbrl)
+                timed(durations["xbrl_parser_for_pl.get_dei_facts"], pl.get_dei_facts, model_xbrl)
+                timed(durations["xbrl_parser_for_segment.get_dei_facts"], segment.get_dei_facts, model_xbrl)
+                if dei_facts is not None:
+                    fact_index = timed(durations["FactIndex"], FactIndex, model_xbrl, type_of_period)
+                    for is_consolidated in ([False, True] if has_consolidated else [False]):
+                        timed(durations["xbrl_parser_for_bs.get_bs_facts"], bs.get_bs_facts,
+                              model_xbrl, fact_index, is_consolidated, type_of_period)
+                        timed(durations["xbrl_parser_for_pl.get_pl_facts"], pl.get_pl_facts,
+                              model_xbrl, fact_index, is_consolidated)
+                timed(durations["xbrl_parser_for_segment.get_segments_facts"],
+                      segment.get_segments_facts, model_xbrl)
+            model_manager.close()
+    return [
+        {"name": name, "kind": "function", **summarize(values)}
+        for name, values in durations.items() if values
+    ]
+
+
+def run_main_scenarios(data_dir, filings, workers_list):
+    """処理全体のシナリオを実行し、シナリオごとの結果のリストを返す"""
+
+    results = []
+    for module_name in MAIN_MODULES:
+        module = __import__(module_name)
+        for workers in workers_list:
+            module.PARSE_MAX_WORKERS = workers
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                module.main()
+                elapsed = time.perf_counter() - start
+            results.append({
+                "name": f"{module_name}.main",
+                "kind": "main",
+                "workers": workers,
+                "filings": filings,
+                "elapsed_sec": elapsed,
+                "filings_per_sec": filings / elapsed if elapsed > 0 else None,
+            })
+            print(f"{module_name}.main（{workers}プロセス）: {elapsed:.2f}秒")
+    return results
+
+
+def get_environment():
+    """実行環境の情報を取得する"""
+
+    import pandas as pd
+    from arelle import Version
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "arelle": Version.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def main():
+    """合成データを作成し、ベンチマークを実行して結果をJSONで出力する"""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--work-dir", default=BENCHMARK_WORK_DIR, help="作業ディレクトリ")
+    parser.add_argument("--output", default=None, help=f"結果の出力先（省略時は作業ディレクトリの{BENCHMARK_RESULT_FILE}）")
+    parser.add_argument("--filings", type=int, default=BENCHMARK_FILINGS)
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--workers", type=int, nargs="+", default=BENCHMARK_WORKERS)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--periods", type=int, default=2)
+    parser.add_argument("--bs-level3", type=int, default=8)
+    parser.add_argument("--pl-items", type=int, default=15)
+    parser.add_argument("--segment-items", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    parser.add_argument("--skip-main", action="store_true", help="処理全体のシナリオを実行しない")
+    args = parser.parse_args()
+
+    generate_kwargs = {
+        "segments": args.segments,
+        "periods": args.periods,
+        "segment_items_num": args.segment_items,
+        "doc_type": BENCHMARK_DOC_TYPE,
+        "bs_level3": args.bs_level3,
+        "pl_items": args.pl_items,
+    }
+    data_dir, cache_dir, edinetcd_list = prepare_data(
+        args.work_dir, args.filings, args.seed, **generate_kwargs)
+    configure_modules(data_dir, cache_dir, edinetcd_list, BENCHMARK_DOC_TYPE)
+
+    from utils import get_xbrl_files_in_zips
+    import xbrl_parser_for_bs
+
+    xbrl_files = get_xbrl_files_in_zips(
+        os.path.join(data_dir, "zip"), xbrl_parser_for_bs.EDINET_XBRL_MEMBER_REGREX)
+    print(f"合成データ: {len(xbrl_files)}件　{data_dir}")
+
+    scenarios = run_function_scenarios(xbrl_files, args.repeat)
+    for scenario in scenarios:
+        print(f"{scenario['name']}: 平均 {scenario['mean_sec'] * 1000:.2f}ミリ秒（{scenario['calls']}回）")
+    if not args.skip_main:
+        scenarios += run_main_scenarios(data_dir, len(xbrl_files), args.workers)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": get_environment(),
+        "parameters": {
+            "filings": len(xbrl_files),
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "seed": args.seed,
+            **generate_kwargs,
+        },
+        "scenarios": scenarios,
+    }
+    output_path = args.output or os.path.join(args.work_dir, BENCHMARK_RESULT_FILE)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"ベンチマーク結果を出力しました: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
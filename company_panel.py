@@ -0,0 +1,401 @@
+"""
+企業ごと・会計期間ごとの財務情報（パネルデータ）を蓄積し、企業・要素で絞り込んで取得する
+
+【備考】
+- 貸借対照表・損益計算書の出力ファイルは実行ごとに1つ（1提出書類・連結/個別ごとに1行の横持ち）のため、
+  企業ごとの時系列を作るには過去の出力ファイルを全て読み込み直して結合する必要がある
+- このモジュールでは取得結果を、(EDINETコード, 当会計期間終了日, 連結/個別, 要素のQName) をキーとする
+  1行1項目の縦持ちの表に変換し、企業ごとのファイル（PANEL_DIR_NAME 配下の「EDINETコード.csv」など）にマージする
+  - 解析の完了したファイルの取得結果を一定件数ごとにマージし、該当する企業のファイルのみ書き換える
+  - 企業での絞り込みは該当企業のファイルのみ読み込む
+  - 要素での絞り込みは、Parquet の場合は要素の列で絞り込みながら読み込む（CSVの場合は読み込み後に絞り込む）
+  - 要素は列名（ラベル）ではなくQNameで識別する（ラベルは年度・企業により異なり得るため）
+    【備考】QNameは取得結果の値（FactValue）から取得する（横持ちの出力ファイルはラベルのみのため使わない）
+- 訂正報告書の取得結果は、訂正元の提出書類の取得結果を置き換える
+  - 同じ (当会計期間終了日, 取得処理) の取得結果は、提出書類単位で最も新しいもののみ残す
+    （訂正で削除された項目が、訂正元の値のまま残らないようにするため）
+  - 新旧は「訂正の有無（AmendmentFlagDEI）, 報告書提出回数, 報告書提出日」の順で判定する
+    （提出回数・提出日はXBRLファイル名から取得する。訂正の有無を取得していない場合、提出回数が2以上を訂正とする）
+  - 訂正報告書を取り込んだ後に訂正元を取り込んだ場合も、訂正報告書の取得結果が残る
+  - 同じ提出書類を解析し直した場合、既存の取得結果を置き換える
+- 差分解析（INCREMENTAL = True）の場合、パネルデータにマージされるのは今回解析したファイルのみ
+  既存の出力ファイル分のパネルデータを作成する場合、1度 INCREMENTAL = False で実行する
+"""
+
+import glob
+import os
+import re
+
+import pandas as pd
+
+from output_writer import OUTPUT_CHUNK_SIZE, OUTPUT_FORMAT_EXTENSIONS, SOURCE_FILE_COL, FactValue
+from parse_manifest import get_docid
+
+# パス関連
+EDINET_ROOT_DIR = "D:\\EDINET\\120_yuho_test"
+# パネルデータのディレクトリ名（EDINET_ROOT_DIR 配下に作成）
+PANEL_DIR_NAME = "panel"
+# パネルデータの形式（"csv": cp932のCSV, "parquet": Parquet。pyarrowが必要。要素での絞り込みが速い）
+PANEL_FORMAT = "csv"
+
+# ----- main() で出力する時系列の表 -----
+# 取得対象の企業（EDINETコードのリスト。Noneの場合、全企業）
+QUERY_EDINETCDS = None
+# 取得対象の要素（QNameのリスト。Noneの場合、全要素）
+QUERY_CONCEPTS = [
+    "jppfs_cor:NetSales",
+    "jppfs_cor:OperatingIncome",
+    "jppfs_cor:Assets",
+]
+# 出力ファイル名（行: 企業・当会計期間終了日・連結/個別、列: 要素のQName）
+QUERY_OUTPUT_FILE_NAME = "panel_time_series.csv"
+
+# ----- 取得結果から読み取るDEI -----
+# DEIの名前空間接頭辞
+DEI_QNAME_PREFIX = "jpdei_cor"
+# EDINETコードを示す要素
+EDINET_CD_ELM_NAME = "EDINETCodeDEI"
+# 当会計期間終了日を示す要素
+PERIOD_END_ELM_NAME = "CurrentPeriodEndDateDEI"
+# 訂正の有無を示す要素
+AMENDMENT_FLAG_ELM_NAME = "AmendmentFlagDEI"
+
+# XBRLファイル名の報告書提出回数・報告書提出日（…_{提出回数}_{提出日}.xbrl）
+SUBMISSION_REGREX = r"_(\d{2,3})_(\d{4}-\d{2}-\d{2})\.xbrl$"
+
+# ----- パネルデータの列 -----
+EDINETCD_COL = "ＥＤＩＮＥＴコード"
+PERIOD_END_COL = "当会計期間終了日"
+CONSOLIDATED_OR_NONCONSOLIDATED_COL = "連結/個別"
+CONCEPT_COL = "要素"
+ITEM_COL = "項目"
+VALUE_COL = "値"
+NUMERIC_VALUE_COL = "数値"
+STATEMENT_COL = "取得処理"
+AMENDMENT_COL = "訂正の有無"
+SUBMISSION_NUMBER_COL = "提出回数"
+SUBMISSION_DATE_COL = "提出日"
+DOCID_COL = "書類管理番号"
+PANEL_COLS = [
+    EDINETCD_COL,
+    PERIOD_END_COL,
+    CONSOLIDATED_OR_NONCONSOLIDATED_COL,
+    CONCEPT_COL,
+    ITEM_COL,
+    VALUE_COL,
+    NUMERIC_VALUE_COL,
+    STATEMENT_COL,
+    AMENDMENT_COL,
+    SUBMISSION_NUMBER_COL,
+    SUBMISSION_DATE_COL,
+    DOCID_COL,
+    SOURCE_FILE_COL,
+]
+# パネルデータのキー
+PANEL_KEY_COLS = [EDINETCD_COL, PERIOD_END_COL, CONSOLIDATED_OR_NONCONSOLIDATED_COL, CONCEPT_COL]
+# 提出書類の新旧の判定に使う列（後の列ほど優先度が低い）
+FILING_ORDER_COLS = [AMENDMENT_COL, SUBMISSION_NUMBER_COL, SUBMISSION_DATE_COL]
+
+
+def get_submission_info(xbrl_file):
+    """
+    XBRLファイル名から報告書提出回数・報告書提出日を取得する
+    戻り値: (提出回数, 提出日)（取得できない場合、(0, "")）
+    """
+
+    match = re.search(SUBMISSION_REGREX, xbrl_file or "")
+    if match is None:
+        return 0, ""
+    return int(match.group(1)), match.group(2)
+
+
+def to_number(value):
+    """factの値を数値に変換する（数値でない場合、NaN）"""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def get_panel_rows(facts, source, statement):
+    """
+    1ファイル分の取得結果（横持ちの辞書のリスト）を、パネルデータの行のリストに変換する
+    statement: 取得処理名（"bs", "pl" など）
+    【備考】要素のQNameを持つ値（FactValue）の列のみ対象とし、DEIの列はキー・訂正の有無に使う
+    """
+
+    if not facts:
+        return []
+    if isinstance(facts, pd.DataFrame):
+        facts = facts.to_dict("records")
+    submission_number, submission_date = get_submission_info(source)
+    docid = get_docid(source) if source is not None else None
+    rows = []
+    for dict_facts in facts:
+        dei_values = {}
+        items = []
+        for col, value in dict_facts.items():
+            if (not isinstance(value, FactValue)) or (not value.qname):
+                continue
+            prefix, _, localname = value.qname.partition(":")
+            if prefix == DEI_QNAME_PREFIX:
+                dei_values[localname] = value
+            else:
+                items.append((col, value))
+        edinetcd = dei_values.get(EDINET_CD_ELM_NAME)
+        period_end = dei_values.get(PERIOD_END_ELM_NAME)
+        if (not edinetcd) or (not period_end):
+            print(f"EDINETコード・当会計期間終了日を取得できないため、パネルデータに追加しません: {source}")
+            continue
+        if AMENDMENT_FLAG_ELM_NAME in dei_values:
+            is_amendment = dei_values[AMENDMENT_FLAG_ELM_NAME] == "true"
+        else:
+            is_amendment = submission_number > 1
+        for col, value in items:
+            rows.append({
+                EDINETCD_COL: str(edinetcd),
+                PERIOD_END_COL: str(period_end),
+                CONSOLIDATED_OR_NONCONSOLIDATED_COL: dict_facts.get(CONSOLIDATED_OR_NONCONSOLIDATED_COL, ""),
+                CONCEPT_COL: value.qname,
+                ITEM_COL: col,
+                VALUE_COL: str(value),
+                NUMERIC_VALUE_COL: to_number(value),
+                STATEMENT_COL: statement,
+                AMENDMENT_COL: is_amendment,
+                SUBMISSION_NUMBER_COL: submission_number,
+                SUBMISSION_DATE_COL: submission_date,
+                DOCID_COL: docid or "",
+                SOURCE_FILE_COL: source or "",
+            })
+    return rows
+
+
+def normalize_panel(df_panel):
+    """パネルデータの列・型を揃える（CSVから読み込んだ場合、値は文字列のため変換する）"""
+
+    df_panel = df_panel.reindex(columns=PANEL_COLS)
+    for col in PANEL_COLS:
+        if col == NUMERIC_VALUE_COL:
+            df_panel[col] = pd.to_numeric(df_panel[col], errors="coerce").astype("float64")
+        elif col == SUBMISSION_NUMBER_COL:
+            df_panel[col] = pd.to_numeric(df_panel[col], errors="coerce").fillna(0).astype("int64")
+        elif col == AMENDMENT_COL:
+            df_panel[col] = df_panel[col].map(
+                lambda value: value if isinstance(value, bool) else str(value) in ("True", "true"))
+            df_panel[col] = df_panel[col].astype(bool)
+        else:
+            df_panel[col] = df_panel[col].fillna("").astype(str)
+    return df_panel
+
+
+def select_latest_filings(df_panel):
+    """
+    (当会計期間終了日, 取得処理) ごとに最も新しい提出書類の行のみ残す
+    【備考】新旧が同じ場合（同じ提出書類の取得結果など）、後の行を新しいものとする
+    """
+
+    if df_panel.empty:
+        return df_panel
+    df_panel = df_panel.reset_index(drop=True)
+    group_cols = [EDINETCD_COL, PERIOD_END_COL, STATEMENT_COL]
+    df_latest = df_panel.sort_values(FILING_ORDER_COLS, kind="stable").drop_duplicates(
+        group_cols, keep="last")[group_cols + [SOURCE_FILE_COL]]
+    is_latest = pd.MultiIndex.from_frame(df_panel[group_cols + [SOURCE_FILE_COL]]).isin(
+        pd.MultiIndex.from_frame(df_latest))
+    df_panel = df_panel[is_latest]
+    # 【備考】同じ提出書類に同じ要素が複数ある場合も、キーごとに1行とする
+    df_panel = df_panel.drop_duplicates(PANEL_KEY_COLS, keep="last")
+    # 当会計期間終了日の順に並べる（同じ会計期間内は取得結果の順序を保つ）
+    return df_panel.sort_values(
+        [PERIOD_END_COL, STATEMENT_COL, CONSOLIDATED_OR_NONCONSOLIDATED_COL], kind="stable"
+    ).reset_index(drop=True)
+
+
+def get_partition_path(panel_dir, edinetcd, panel_format):
+    """企業ごとのパネルデータのファイルのパス"""
+
+    return os.path.join(panel_dir, edinetcd + OUTPUT_FORMAT_EXTENSIONS[panel_format])
+
+
+def read_partition(partition_path, panel_format):
+    """企業ごとのパネルデータのファイルを読み込む"""
+
+    if panel_format == "parquet":
+        df_panel = pd.read_parquet(partition_path)
+    else:
+        df_panel = pd.read_csv(partition_path, dtype=str, keep_default_na=False, encoding="cp932")
+    return normalize_panel(df_panel)
+
+
+def write_partition(df_panel, partition_path, panel_format):
+    """企業ごとのパネルデータのファイルを書き出す（書き出し途中で止まった場合も、既存のファイルは壊さない）"""
+
+    tmp_path = partition_path + ".tmp"
+    if panel_format == "parquet":
+        df_panel.to_parquet(tmp_path, index=False)
+    else:
+        df_panel.to_csv(tmp_path, index=False, encoding="cp932")
+    os.replace(tmp_path, partition_path)
+
+
+def merge_partition(panel_dir, edinetcd, new_rows, panel_format):
+    """
+    企業ごとのパネルデータのファイルに、新しい取得結果をマージする
+    戻り値: マージ後の行数
+    """
+
+    df_new = normalize_panel(pd.DataFrame(new_rows))
+    partition_path = get_partition_path(panel_dir, edinetcd, panel_format)
+    if os.path.exists(partition_path):
+        df_existing = read_partition(partition_path, panel_format)
+        # 同じ取得処理・同じ提出書類（同じXBRLファイル・docID）の既存の行は、新しい取得結果で置き換える
+        # 【備考】他の取得処理の行（損益計算書のみ解析し直した場合の貸借対照表など）は残す
+        is_replaced = pd.Series(False, index=df_existing.index)
+        for col in [SOURCE_FILE_COL, DOCID_COL]:
+            new_keys = pd.MultiIndex.from_frame(df_new.loc[df_new[col] != "", [STATEMENT_COL, col]])
+            is_replaced |= pd.MultiIndex.from_frame(df_existing[[STATEMENT_COL, col]]).isin(new_keys)
+        df_existing = df_existing[~is_replaced]
+        df_panel = pd.concat([df_existing, df_new], axis=0, ignore_index=True)
+    else:
+        df_panel = df_new
+    df_panel = select_latest_filings(df_panel)
+    write_partition(df_panel, partition_path, panel_format)
+    return len(df_panel)
+
+
+class PanelWriter:
+    """
+    ファイルごとの取得結果を一定件数ごとに企業ごとのパネルデータにマージする
+    【備考】メインプロセスでのみ書き出す（ワーカープロセスは取得結果を返すのみ）
+    """
+
+    def __init__(self, panel_dir, panel_format=None, chunk_size=OUTPUT_CHUNK_SIZE):
+        """panel_format: パネルデータの形式（Noneの場合、PANEL_FORMAT）"""
+
+        if panel_format is None:
+            panel_format = PANEL_FORMAT
+        if panel_format not in OUTPUT_FORMAT_EXTENSIONS:
+            raise ValueError(
+                f"パネルデータの形式の指定が想定外です: {panel_format}  想定: {list(OUTPUT_FORMAT_EXTENSIONS)}")
+        if panel_format == "parquet":
+            # 【備考】pyarrow は Parquet を出力する場合のみ必要なため、ここで読み込めるか確認する
+            import pyarrow  # noqa: F401
+        self.panel_dir = panel_dir
+        self.panel_format = panel_format
+        self.chunk_size = chunk_size
+        # EDINETコードごとの、マージ前の行
+        self._buffer = {}
+        self._buffered_file_num = 0
+        # マージした企業
+        self.updated_edinetcds = set()
+
+    def write(self, facts, source, statement):
+        """1ファイル分の取得結果（横持ちの辞書のリスト）を追加する"""
+
+        rows = get_panel_rows(facts, source, statement)
+        if not rows:
+            return
+        for row in rows:
+            self._buffer.setdefault(row[EDINETCD_COL], []).append(row)
+        self._buffered_file_num += 1
+        if self._buffered_file_num >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """溜まっている取得結果を、企業ごとのパネルデータにマージする"""
+
+        if not self._buffer:
+            return
+        os.makedirs(self.panel_dir, exist_ok=True)
+        for edinetcd, rows in self._buffer.items():
+            # 【備考】EDINETコードをファイル名に使うため、想定外の文字を含む場合はマージしない
+            if not re.fullmatch(r"[0-9A-Za-z]+", edinetcd):
+                print(f"EDINETコードが想定外のため、パネルデータに追加しません: {edinetcd}")
+                continue
+            merge_partition(self.panel_dir, edinetcd, rows, self.panel_format)
+            self.updated_edinetcds.add(edinetcd)
+        self._buffer = {}
+        self._buffered_file_num = 0
+
+    def close(self):
+        """
+        溜まっている取得結果をマージする
+        戻り値: マージしたかどうか（取得結果がない場合、False）
+        """
+
+        self.flush()
+        if not self.updated_edinetcds:
+            return False
+        print(f"パネルデータを更新しました: {len(self.updated_edinetcds)}社 {self.panel_dir}")
+        return True
+
+
+def create_panel_writer(edinet_root_dir, panel_format=None):
+    """EDINET_ROOT_DIR 配下のパネルデータにマージするライターを作成する"""
+
+    return PanelWriter(os.path.join(edinet_root_dir, PANEL_DIR_NAME), panel_format)
+
+
+def load_panel(panel_dir, edinetcds=None, concepts=None, panel_format=None):
+    """
+    パネルデータを読み込む
+    edinetcds: 取得対象の企業（EDINETコードのリスト。Noneの場合、全企業）
+    concepts: 取得対象の要素（QNameのリスト。Noneの場合、全要素）
+    panel_format: パネルデータの形式（Noneの場合、PANEL_FORMAT）
+    """
+
+    if panel_format is None:
+        panel_format = PANEL_FORMAT
+
+    if edinetcds is None:
+        partition_paths = sorted(glob.glob(
+            os.path.join(panel_dir, "*" + OUTPUT_FORMAT_EXTENSIONS[panel_format])))
+    else:
+        partition_paths = [
+            partition_path for partition_path in (
+                get_partition_path(panel_dir, edinetcd, panel_format) for edinetcd in edinetcds)
+            if os.path.exists(partition_path)
+        ]
+    if not partition_paths:
+        return normalize_panel(pd.DataFrame(columns=PANEL_COLS))
+    if (panel_format == "parquet") and (concepts is not None):
+        # 【備考】要素の列で絞り込みながら読み込み、対象外の行はメモリに載せない
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(partition_paths, format="parquet")
+        df_panel = dataset.to_table(filter=ds.field(CONCEPT_COL).isin(list(concepts))).to_pandas()
+        return normalize_panel(df_panel)
+    list_df = []
+    for partition_path in partition_paths:
+        df_partition = read_partition(partition_path, panel_format)
+        if concepts is not None:
+            df_partition = df_partition[df_partition[CONCEPT_COL].isin(concepts)]
+        list_df.append(df_partition)
+    return pd.concat(list_df, axis=0, ignore_index=True)
+
+
+def to_time_series(df_panel, value_col=NUMERIC_VALUE_COL):
+    """パネルデータを、行: (企業, 当会計期間終了日, 連結/個別)、列: 要素のQName の表にする"""
+
+    return df_panel.pivot(
+        index=[EDINETCD_COL, PERIOD_END_COL, CONSOLIDATED_OR_NONCONSOLIDATED_COL],
+        columns=CONCEPT_COL,
+        values=value_col
+    ).sort_index()
+
+
+def main():
+    panel_dir = os.path.join(EDINET_ROOT_DIR, PANEL_DIR_NAME)
+    df_panel = load_panel(panel_dir, QUERY_EDINETCDS, QUERY_CONCEPTS, PANEL_FORMAT)
+    if df_panel.empty:
+        print("該当するパネルデータはありませんでした。")
+        return
+    output_path = os.path.join(EDINET_ROOT_DIR, QUERY_OUTPUT_FILE_NAME)
+    # 【備考】CSVには数値に変換する前の値（factの値の表記）を出力する
+    to_time_series(df_panel, VALUE_COL).to_csv(output_path, encoding="cp932")
+    print(f"出力: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+XBRLインスタンスからDEI（会社・書類情報）を高速に読み込む
+
+【備考】
+- DEI（jpdei_cor の要素）のfactはインスタンス文書に含まれるため、
+  タクソノミを読み込まずに（Arelle を使わずに） lxml.etree.iterparse で読み込める
+- 会計基準・様式などで処理対象外となるファイルを、Arelle で読み込む前に除外する（事前絞り込み）
+- DEIのみ取得する場合（xbrl_parser_pipeline.py の TGT_EXTRACTORS = ["dei"]）、
+  提出書類を Arelle で読み込まずに、このモジュールで読み込んだ値を出力する
+- 読み込む要素を指定した場合、全て読み込んだ時点でファイルの残りは読み込まない
+  （EDINETのインスタンス文書では、DEIのfactは先頭付近に出現する）
+"""
+
+from lxml import etree
+
+from utils import open_xbrl_file
+
+# DEIの名前空間（バージョンを表す日付部分より前）
+JPDEI_NS_PREFIX = "http://disclosure.edinet-fsa.go.jp/taxonomy/jpdei/"
+# nil を表す属性
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+
+def read_dei_values(xbrl_file, localnames=None):
+    """
+    XBRLインスタンスからDEIの値を読み込む
+    localnames: 読み込む要素名のリスト（None の場合、全てのDEI）
+    戻り値: {要素名: 値}（同じ要素のfactが複数ある場合、最初のfactの値。nil の場合、空文字）
+    """
+
+    _, dei_values = read_dei_facts(xbrl_file, localnames)
+    return dei_values
+
+
+def read_dei_facts(xbrl_file, localnames=None):
+    """
+    XBRLインスタンスからDEIの名前空間と値を読み込む
+    戻り値: (DEIの名前空間, {要素名: 値})（DEIのfactがない場合、名前空間は None）
+    """
+
+    namespace = None
+    dei_values = {}
+    with open_xbrl_file(xbrl_file) as f:
+        for _, elem in etree.iterparse(f, events=("end",)):
+            tag = elem.tag
+            if isinstance(tag, str) and tag.startswith("{" + JPDEI_NS_PREFIX):
+                tag_qname = etree.QName(tag)
+                localname = tag_qname.localname
+                namespace = namespace or tag_qname.namespace
+                if ((localnames is None) or (localname in localnames)) \
+                        and (localname not in dei_values):
+                    if elem.get(XSI_NIL) == "true":
+                        dei_values[localname] = ""
+                    else:
+                        dei_values[localname] = (elem.text or "").strip()
+                    if (localnames is not None) and (len(dei_values) == len(localnames)):
+                        break
+            # 【備考】読み込み済みの要素を破棄し、メモリ使用量を抑える
+            if elem.getparent() is not None and elem.getparent().getparent() is None:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    return namespace, dei_values
+
+
+def filter_xbrl_files(xbrl_files, is_target, localnames):
+    """
+    DEIの値で、処理対象のXBRLファイルを絞り込む
+    is_target: {要素名: 値} を受け取り、処理対象かどうかを返す関数
+    localnames: is_target の判定に使う要素名のリスト
+    【備考】読み込みに失敗したファイル・判定に使う要素がないファイルは処理対象とする
+    （Arelle での解析時に判定し、失敗した場合は隔離リストに記録される）
+    """
+
+    tgt_xbrl_files = []
+    for xbrl_file in xbrl_files:
+        try:
+            dei_values = read_dei_values(xbrl_file, localnames)
+        except (OSError, etree.XMLSyntaxError) as e:
+            print(f"DEIの読み込みに失敗しました: {xbrl_file} {type(e).__name__}: {e}")
+            tgt_xbrl_files.append(xbrl_file)
+            continue
+        missing_localnames = [localname for localname in localnames if localname not in dei_values]
+        if missing_localnames:
+            print(f"DEIに判定に使う要素がありません: {xbrl_file} {missing_localnames}")
+            tgt_xbrl_files.append(xbrl_file)
+            continue
+        if is_target(dei_values):
+            tgt_xbrl_files.append(xbrl_file)
+    print(f"DEIによる事前絞り込み: 対象 {len(tgt_xbrl_files)}件"
+          f"　対象外 {len(xbrl_files) - len(tgt_xbrl_files)}件")
+    return tgt_xbrl_files
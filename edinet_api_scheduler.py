@@ -0,0 +1,274 @@
+"""
+EDINET API へのリクエストを制御するスケジューラ
+
+【備考】
+- トークンバケットで1秒あたりのリクエスト数を上限以下に抑える
+- 一時的な失敗（HTTP 429/5xx、通信エラーなど）は指数バックオフ（ジッター付き）でリトライする
+- リトライ待ちのリクエストは優先度順のキューで管理する
+- エラー率・応答時間に応じて同時実行数とリクエストレートを増減させる
+  （成功時は少しずつ増やし、スロットリング時は半減させる）
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# リトライ対象のHTTPステータスコード
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# 過負荷を示すHTTPステータスコード（同時実行数・レートを下げる）
+THROTTLED_STATUS_CODES = (429, 503)
+# リトライ対象の通信エラー
+RETRYABLE_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# 過負荷時に同時実行数・レートに掛ける係数
+DECREASE_FACTOR = 0.5
+# 応答が遅い場合に同時実行数に掛ける係数
+SLOW_DECREASE_FACTOR = 0.9
+# エラー率・応答時間の移動平均の重み
+EWMA_ALPHA = 0.2
+
+
+class RetryableError(Exception):
+    """リトライ対象の一時的な失敗"""
+
+    def __init__(self, message, throttled=False, retry_after=None):
+        super().__init__(message)
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+def raise_for_retryable_status(res):
+    """レスポンスのステータスコードがリトライ対象の場合、RetryableErrorを送出する"""
+
+    if res.status_code not in RETRYABLE_STATUS_CODES:
+        return
+    retry_after = res.headers.get("Retry-After")
+    raise RetryableError(
+        f"HTTP {res.status_code}: {res.url}",
+        throttled=res.status_code in THROTTLED_STATUS_CODES,
+        retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+    )
+
+
+def create_session(pool_size):
+    """接続を使い回すためのHTTPセッションを作成する"""
+
+    # 【備考】Session は Keep-Alive で接続を再利用する。
+    # 同時実行数分の接続を保持できるよう、コネクションプールのサイズを指定する
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TokenBucket:
+    """トークンバケットにより、1秒あたりのリクエスト数を制御する"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate):
+        """レートを変更する"""
+
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def acquire(self):
+        """トークンを1つ取得できるまで待機する"""
+
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_sec = (1 - self._tokens) / self.rate
+            time.sleep(wait_sec)
+
+
+class AdaptiveConcurrency:
+    """
+    同時実行数の上限を、結果に応じて増減させる（AIMD）
+    - 成功時: 上限を 1/上限 ずつ増やす（おおよそ上限分の成功で+1）
+    - 過負荷時: 上限を半減させる
+    - 応答が閾値より遅い場合: 上限を少し下げる
+    """
+
+    def __init__(self, max_limit, min_limit=1, latency_threshold=None):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_threshold = latency_threshold
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.error_rate = 0.0
+        self.latency = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """実行中のリクエスト数が上限未満になるまで待機する"""
+
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, failed=False, throttled=False):
+        """リクエストの結果を反映し、上限を更新する"""
+
+        with self._cond:
+            self.in_flight -= 1
+            self.error_rate += EWMA_ALPHA * (float(failed) - self.error_rate)
+            self.latency += EWMA_ALPHA * (latency - self.latency)
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+            elif (self.latency_threshold is not None) and (latency > self.latency_threshold):
+                self.limit = max(self.min_limit, self.limit * SLOW_DECREASE_FACTOR)
+            elif not failed:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ApiScheduler:
+    """EDINET API へのリクエストを、レート制御・リトライ付きで並行実行する"""
+
+    def __init__(self, max_workers, requests_per_second=None, max_retries=5,
+                 backoff_base=1.0, backoff_max=60.0, latency_threshold=None):
+        self.max_workers = max_workers
+        self.max_rate = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = AdaptiveConcurrency(
+            max_workers, latency_threshold=latency_threshold)
+        if requests_per_second:
+            self.bucket = TokenBucket(requests_per_second)
+        else:
+            self.bucket = None
+
+    def backoff(self, attempt, retry_after=None):
+        """リトライまでの待機秒数（指数バックオフ、フルジッター）"""
+
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _adapt_rate(self, throttled):
+        """過負荷時はレートを下げ、成功時は上限まで少しずつ戻す"""
+
+        if self.bucket is None:
+            return
+        if throttled:
+            self.bucket.set_rate(max(0.1, self.bucket.rate * DECREASE_FACTOR))
+        elif self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(
+                min(self.max_rate, self.bucket.rate + 0.1 * self.max_rate))
+
+    def _execute(self, func):
+        """リクエストを1回実行し、(結果, 例外, リトライ可否, 過負荷か) を返す"""
+
+        self.concurrency.acquire()
+        if self.bucket is not None:
+            self.bucket.acquire()
+        start = time.monotonic()
+        result, error, retryable, throttled = None, None, False, False
+        try:
+            result = func()
+        except RetryableError as e:
+            error, retryable, throttled = e, True, e.throttled
+        except RETRYABLE_EXCEPTIONS as e:
+            error, retryable, throttled = e, True, isinstance(e, requests.Timeout)
+        except Exception as e:
+            error = e
+        self.concurrency.release(
+            time.monotonic() - start, failed=error is not None, throttled=throttled)
+        self._adapt_rate(throttled)
+        return result, error, retryable, throttled
+
+    def run(self, tasks):
+        """
+        複数のリクエストを実行する
+        tasks: (優先度, キー, 関数) のリスト。優先度の値が小さいものから実行する
+        戻り値: (キーごとの結果の辞書, キーごとの例外の辞書)
+        """
+
+        seq = itertools.count()
+        # 実行可能なリクエスト（優先度順）と、リトライ待ちのリクエスト（実行可能時刻順）
+        ready = [(priority, next(seq), key, func, 0) for priority, key, func in tasks]
+        heapq.heapify(ready)
+        delayed = []
+        pending = len(ready)
+        results, failures = {}, {}
+        cond = threading.Condition()
+
+        def next_task():
+            with cond:
+                while pending > 0:
+                    now = time.monotonic()
+                    while delayed and delayed[0][0] <= now:
+                        heapq.heappush(ready, heapq.heappop(delayed)[1])
+                    if ready:
+                        return heapq.heappop(ready)
+                    cond.wait(delayed[0][0] - now if delayed else None)
+                return None
+
+        def worker():
+            nonlocal pending
+            while True:
+                task = next_task()
+                if task is None:
+                    return
+                priority, _, key, func, attempt = task
+                result, error, retryable, _ = self._execute(func)
+                with cond:
+                    if error is None:
+                        results[key] = result
+                        pending -= 1
+                    elif retryable and attempt < self.max_retries:
+                        ready_at = time.monotonic() + self.backoff(
+                            attempt, getattr(error, "retry_after", None))
+                        heapq.heappush(
+                            delayed, (ready_at, (priority, next(seq), key, func, attempt + 1)))
+                    else:
+                        failures[key] = error
+                        pending -= 1
+                    cond.notify_all()
+
+        threads = [
+            threading.Thread(target=worker, daemon=True)
+            for _ in range(min(self.max_workers, max(pending, 1)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, failures
+
+    def call(self, func, priority=0):
+        """リクエストを1件実行し、結果を返す（リトライしても失敗した場合、例外を送出）"""
+
+        results, failures = self.run([(priority, None, func)])
+        if failures:
+            raise failures[None]
+        return results[None]
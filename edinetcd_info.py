@@ -4,16 +4,20 @@ import shutil
 import sys
 import time
 
-import chromedriver_binary
 import pandas as pd
-from selenium.webdriver import Chrome
-from selenium.webdriver.chrome.options import Options
 
 from utils import extract_files_from_zip
 
 CHROME_PATH = "C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe"
 EDINETCD_DOWNLOAD_PAGE_URL = "https://disclosure.edinet-fsa.go.jp/E01EW/BLMainController.jsp?uji.verb=W1E62071InitDisplay&uji.bean=ee.bean.W1E62071.EEW1E62071Bean&TID=W1E62071&PID=currentPage&SESSIONKEY=1594968624445&downloadFileName=&lgKbn=2&dflg=0&iflg=0&dispKbn=1"
 EDINETCD_DOWNLOAD_SAVE_DIR = "D:\\EDINET\\Edinetcode"
+# 読み込んだEDINETコードリストのキャッシュ（pickle形式）
+EDINETCD_CACHE_FILE = os.path.join(EDINETCD_DOWNLOAD_SAVE_DIR, "EdinetcodeDlInfo.pkl")
+# キャッシュの有効期間（時間）。期間を過ぎた場合、EDINETサイトから再取得する
+EDINETCD_CACHE_TTL_HOURS = 24
+# EDINETサイトから取得する代わりに使用するEDINETコードリスト（オフライン実行用）
+# Noneの場合、EDINETサイトから取得する
+EDINETCD_LOCAL_FILE = None
 
 
 def enable_headless_download(driver, edinetc_dl_tmp_dir):
@@ -44,6 +48,11 @@ def download_edinetcd_list():
         shutil.rmtree(edinetcd_dl_tmp_dir)
     os.mkdir(edinetcd_dl_tmp_dir)
     # ダウンロードリンクが動的であるため、Seleniumで取得
+    # 【備考】キャッシュやローカルファイルを使う場合はChrome不要のため、ここでimportする
+    import chromedriver_binary
+    from selenium.webdriver import Chrome
+    from selenium.webdriver.chrome.options import Options
+
     options = Options()
     options.binary_location = CHROME_PATH
     options.add_argument('--headless')
@@ -91,16 +100,81 @@ def download_edinetcd_list():
     return edinetcd_file_path
 
 
-def get_edinetcd_info(use_cols):
-    """EDINETコードリストから企業情報を取得する"""
+def is_edinetcd_cache_fresh():
+    """EDINETコードリストのキャッシュが有効期間内か判定する"""
+
+    if not os.path.exists(EDINETCD_CACHE_FILE):
+        return False
+    cache_mtime = os.path.getmtime(EDINETCD_CACHE_FILE)
+    # ローカルファイル指定時は、ファイルが更新されていればキャッシュを作り直す
+    if (EDINETCD_LOCAL_FILE is not None) \
+            and (os.path.getmtime(EDINETCD_LOCAL_FILE) > cache_mtime):
+        return False
+    return time.time() - cache_mtime < EDINETCD_CACHE_TTL_HOURS * 60 * 60
+
+
+def get_edinetcd_info(use_cols, force_refresh=False):
+    """
+    EDINETコードリストから企業情報を取得する
+    キャッシュが有効期間内の場合、キャッシュから読み込む（force_refresh=True で再取得）
+    """
+
+    if (not force_refresh) and is_edinetcd_cache_fresh():
+        df_edinetcd_info = pd.read_pickle(EDINETCD_CACHE_FILE)
+        return df_edinetcd_info[use_cols]
 
-    file_path = download_edinetcd_list()
+    if EDINETCD_LOCAL_FILE is None:
+        file_path = download_edinetcd_list()
+    else:
+        file_path = EDINETCD_LOCAL_FILE
     print(file_path)
-    file_path = "D:\EDINET\Edinetcode\EdinetcodeDlInfo.csv"
+    # 【備考】列の指定によらず使い回せるよう、全列をキャッシュする
     df_edinetcd_info = pd.read_csv(
         file_path,
         skiprows=1,
-        usecols=use_cols,
         encoding='cp932'
     )
-    return df_edinetcd_info
+    os.makedirs(os.path.dirname(EDINETCD_CACHE_FILE), exist_ok=True)
+    tmp_cache_path = f"{EDINETCD_CACHE_FILE}.tmp"
+    df_edinetcd_info.to_pickle(tmp_cache_path)
+    os.replace(tmp_cache_path, EDINETCD_CACHE_FILE)
+    return df_edinetcd_info[use_cols]
+
+
+def build_edinetcd_index(df_edinetcd_info, key_col):
+    """EDINETコードをキー、企業情報（業種、上場区分、提出者名など）を値とする辞書を作成する"""
+
+    # 【備考】辞書化の前に重複を確認しておき、
+    # 書類ごとの処理では重複チェックなしで参照できるようにする
+    is_duplicated = df_edinetcd_info[key_col].duplicated(keep=False)
+    if is_duplicated.any():
+        print("【想定外】EDINETコードリストのEDINETコードに重複があります。")
+        print(df_edinetcd_info.loc[is_duplicated, key_col].unique())
+        sys.exit()
+    return df_edinetcd_info.set_index(key_col).to_dict(orient="index")
+
+
+def get_edinetcd_index(use_cols, key_col):
+    """EDINETコードリストから、EDINETコードで企業情報を引ける辞書を作成する"""
+
+    df_edinetcd_info = get_edinetcd_info(use_cols)
+    return build_edinetcd_index(df_edinetcd_info, key_col)
+
+
+def merge_edinetcd_info(df, edinetcd_index, key_col, prepend=False):
+    """
+    EDINETコードをキーに企業情報の列を追加する
+    prepend=True の場合、EDINETコードと企業情報の列を先頭に配置する
+    """
+
+    df = df.reset_index(drop=True)
+    attr_cols = list(next(iter(edinetcd_index.values()), {}).keys())
+    df_attrs = pd.DataFrame(
+        [edinetcd_index.get(edinetcd, {}) for edinetcd in df[key_col]],
+        index=df.index,
+        columns=attr_cols
+    )
+    if prepend:
+        return pd.concat(
+            [df[[key_col]], df_attrs, df.drop(columns=[key_col])], axis=1)
+    return pd.concat([df, df_attrs], axis=1)
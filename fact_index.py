@@ -0,0 +1,81 @@
+"""
+提出書類ごとのfactの索引
+
+【備考】
+- factsByQname で取得したfactを走査してコンテキストID・ユニットIDを比較する代わりに、
+  (QName, 正規化したコンテキストID, ユニットID) をキーとする辞書を1度だけ作成して参照する
+- コンテキストIDの当期を表す接頭辞は、当会計期間の種類により異なるため「Current」に揃える
+  - 報告書インスタンス作成ガイドライン：5-4-5 コンテキストの設定例　参照
+  - 年度（有価証券報告書）: CurrentYearInstant, CurrentYearDuration
+  - 中間期（半期報告書）: InterimInstant, InterimDuration
+  - 四半期（四半期報告書）: CurrentQuarterInstant, CurrentQuarterDuration
+    （累積期間の CurrentYTDDuration はそのまま）
+- 個別財務情報のコンテキストIDは、末尾に「_NonConsolidatedMember」が付く
+- 索引の参照回数・factを取得できた回数を計測する（instrumentation.py 参照）
+"""
+
+from instrumentation import count
+
+# 当会計期間の種類ごとの、当期を表すコンテキストIDの接頭辞
+CURRENT_CONTEXT_PREFIXES = {
+    "FY": "CurrentYear",
+    "HY": "Interim",
+    "Q1": "CurrentQuarter",
+    "Q2": "CurrentQuarter",
+    "Q3": "CurrentQuarter",
+    "Q4": "CurrentQuarter",
+    "Q5": "CurrentQuarter",
+}
+# 正規化後の当期を表す接頭辞
+CURRENT_CONTEXT_PREFIX = "Current"
+# 個別財務情報を表すコンテキストIDの接尾辞
+NON_CONSOLIDATED_SUFFIX = "_NonConsolidatedMember"
+
+
+def normalize_context_id(context_id, current_prefix):
+    """コンテキストIDの当期を表す接頭辞を「Current」に置き換える"""
+
+    if (current_prefix is not None) and context_id.startswith(current_prefix):
+        return CURRENT_CONTEXT_PREFIX + context_id[len(current_prefix):]
+    return context_id
+
+
+def current_context_id(period_type, is_consolidated):
+    """当期の正規化したコンテキストIDを返す（例: CurrentInstant_NonConsolidatedMember）"""
+
+    context_id = f"{CURRENT_CONTEXT_PREFIX}{period_type.capitalize()}"
+    if not is_consolidated:
+        context_id += NON_CONSOLIDATED_SUFFIX
+    return context_id
+
+
+class FactIndex:
+    """(QName, 正規化したコンテキストID, ユニットID) をキーとするfactの索引"""
+
+    def __init__(self, model_xbrl, type_of_period="FY"):
+        current_prefix = CURRENT_CONTEXT_PREFIXES.get(type_of_period)
+        self._facts = {}
+        # 【備考】同じキーのfactが複数ある場合、インスタンス文書内で先に出現するものを使う
+        for fact in model_xbrl.facts:
+            if fact.contextID is None:
+                continue
+            key = (fact.qname, normalize_context_id(fact.contextID, current_prefix), fact.unitID)
+            self._facts.setdefault(key, fact)
+
+    def __len__(self):
+        return len(self._facts)
+
+    def get(self, concept_qname, context_id, unit_id=None):
+        """factを取得する（存在しない場合、None）"""
+
+        fact = self._facts.get((concept_qname, context_id, unit_id))
+        count("fact_lookups")
+        if fact is not None:
+            count("fact_hits")
+        return fact
+
+    def get_current(self, concept, is_consolidated, unit_id="JPY"):
+        """当期の連結／個別のfactを取得する（期間型・時点型は要素の定義に従う）"""
+
+        return self.get(
+            concept.qname, current_context_id(concept.periodType, is_consolidated), unit_id)
@@ -0,0 +1,131 @@
+"""
+想定外の内容の提出書類（異常）の扱い
+
+【備考】
+- 提出書類の内容が想定外で取得処理を続行できない場合、sys.exit() で実行全体を終了する代わりに、
+  異常の種類ごとの例外（FilingAnomalyError のサブクラス）を送出する
+  - 例外はファイル単位で捕捉し（xbrl_batch.py 参照）、他のファイルの処理は続行する
+- 解析に失敗したファイルは、失敗の種類・理由とともに隔離リスト（Quarantine）に記録する
+  - 隔離リストのファイルのみ後から再解析でき、再解析に成功したファイルは隔離リストから除く
+  - 1行1レコードのJSON Lines形式で追記し、同じファイルは後のレコードを正とする
+"""
+
+import json
+import os
+from datetime import datetime
+
+from parse_manifest import get_docid
+
+
+class FilingAnomalyError(Exception):
+    """提出書類の内容が想定外のため、取得処理を続行できない"""
+
+    # 異常の種類（隔離リストに記録する）
+    reason = "anomaly"
+
+
+class DeiFactMissingError(FilingAnomalyError):
+    """DEIの必須項目のfactが存在しない"""
+
+    reason = "dei_fact_missing"
+
+
+class DeiFactDuplicatedError(FilingAnomalyError):
+    """1つのXBRL内に、DEIの同じ項目のfactが複数存在する"""
+
+    reason = "dei_fact_duplicated"
+
+
+class UnexpectedDeiValueError(FilingAnomalyError):
+    """DEIの項目の値が想定外"""
+
+    reason = "dei_unexpected_value"
+
+
+def get_error_record(e, extractor=None):
+    """
+    例外から、隔離リストに記録するエラー内容を作成する
+    戻り値: {"type": 例外クラス名, "reason": 異常の種類, "message": メッセージ, "extractor": 取得処理名}
+    【備考】想定外の内容（FilingAnomalyError）以外の例外の reason は「error」とする
+    """
+
+    return {
+        "type": type(e).__name__,
+        "reason": e.reason if isinstance(e, FilingAnomalyError) else "error",
+        "message": str(e),
+        "extractor": extractor,
+    }
+
+
+def format_error(error):
+    """エラー内容を表示用の文字列にする"""
+
+    text = f"{error['type']}（{error['reason']}）: {error['message']}"
+    if error.get("extractor") is not None:
+        text = f"{error['extractor']} {text}"
+    return text
+
+
+class Quarantine:
+    """
+    解析に失敗したファイル（隔離したファイル）とエラー内容を記録する
+    【備考】1行1レコードのJSON Lines形式で追記し、同じファイルは後のレコードを正とする
+    （再解析に成功したファイルは status = "resolved" のレコードを追記する）
+    """
+
+    def __init__(self, quarantine_path):
+        self.quarantine_path = quarantine_path
+        self._records = {}
+        if os.path.exists(quarantine_path):
+            with open(quarantine_path, encoding="utf-8") as f:
+                for line in f:
+                    # 書き込み途中で中断された行は無視する
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["file"]] = record
+
+    def get_files(self):
+        """隔離中のファイルのリスト"""
+
+        return [
+            xbrl_file for xbrl_file, record in self._records.items()
+            if record["status"] == "quarantined"
+        ]
+
+    def is_quarantined(self, xbrl_file):
+        """隔離中のファイルか判定する"""
+
+        record = self._records.get(xbrl_file)
+        return (record is not None) and (record["status"] == "quarantined")
+
+    def record(self, failed_files, processed_files):
+        """
+        解析結果を追記する
+        failed_files: 解析に失敗したファイルとエラー内容のリスト
+        processed_files: 解析に成功したファイルのリスト（隔離中の場合、隔離を解除する）
+        """
+
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        new_records = []
+        for xbrl_file, error in failed_files:
+            new_records.append({
+                "file": xbrl_file,
+                "docID": get_docid(xbrl_file),
+                "status": "quarantined",
+                **error,
+                "timestamp": timestamp,
+            })
+        for xbrl_file in processed_files:
+            if self.is_quarantined(xbrl_file):
+                new_records.append({"file": xbrl_file, "status": "resolved", "timestamp": timestamp})
+        if not new_records:
+            return
+        with open(self.quarantine_path, "a", encoding="utf-8") as f:
+            for record in new_records:
+                self._records[record["file"]] = record
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        quarantined_num = sum(record["status"] == "quarantined" for record in new_records)
+        if quarantined_num:
+            print(f"{quarantined_num}件のファイルを隔離リストに記録しました: {self.quarantine_path}")
@@ -1,13 +1,15 @@
 import csv
+import hashlib
 import json
 import os
-import sys
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
+from functools import partial
 
-import requests
 from pandas import date_range
 
-from edinetcd_info import get_edinetcd_info
+from edinet_api_scheduler import ApiScheduler, create_session, raise_for_retryable_status
+from edinetcd_info import get_edinetcd_index
 
 # TODO: 訂正有価証券報告書が出ている場合、更新する
 
@@ -33,8 +35,34 @@ DATE_FORMAT = "%Y-%m-%d"
 EDINET_DOCLIST_API_URL = "https://disclosure.edinet-fsa.go.jp/api/v1/documents.json"
 # 書類一覧APIで取得する情報　1:メタデータのみ 2:メタデータと提出書類一覧
 EDINET_API_INFO_TYPE = 2
+# 書類一覧APIのレスポンスのキャッシュ保存先
+EDINET_DOCLIST_CACHE_DIR = "D:\\EDINET\\doclist_cache"
+# 書類一覧APIのレスポンスのキャッシュファイルの命名規則
+EDINET_DOCLIST_CACHE_FILE = "documents_{date}_type{type}.json"
+# キャッシュがあっても再取得する直近の日数
+# （提出直後は書類の追加・取下げにより一覧が変わり得るため）
+DOCLIST_REFRESH_DAYS = 7
 # 書類取得APIのエンドポイント
 EDINET_GETDOC_API_URL = "https://disclosure.edinet-fsa.go.jp/api/v1/documents/{}"
+# 書類取得の結果を記録するマニフェストファイル名（EDINET_DOC_SAVE_DIR配下に作成）
+DOWNLOAD_MANIFEST_FILE = "download_manifest.jsonl"
+# ダウンロード時の書き込み単位（バイト）
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 書類取得の同時実行数の上限（1の場合、逐次ダウンロード）
+# 【備考】エラー率・応答時間に応じて、上限の範囲で自動的に増減する
+DOWNLOAD_MAX_WORKERS = 4
+# EDINET APIへの1秒あたりのリクエスト数の上限（Noneの場合、制限なし）
+REQUESTS_PER_SECOND = 2.0
+# 一時的な失敗時のリトライ回数
+API_MAX_RETRIES = 5
+# リトライ間隔の基準値・上限（秒）。リトライごとに倍にした値を上限にランダムに待機する
+API_BACKOFF_BASE_SEC = 1.0
+API_BACKOFF_MAX_SEC = 60.0
+# 応答時間がこの値（秒）を超えた場合、同時実行数を下げる
+API_LATENCY_THRESHOLD_SEC = 10.0
+# リクエストの優先度（値が小さいものから実行する）
+DOCLIST_API_PRIORITY = 0
+GETDOC_API_PRIORITY = 1
 
 # EdinetcodeDlInfo.csv から取得する列
 EDINETCD_COL = "ＥＤＩＮＥＴコード"
@@ -45,10 +73,59 @@ EDINETCDDLINFO_COLS = [
 ]
 
 
-def extract_tgt_type_docs(res_from_edinet):
+class DownloadManifest:
+    """
+    docIDごとの書類取得結果（サイズ、ハッシュ値、ステータス、日時）を記録する
+    【備考】1行1レコードのJSON Lines形式で追記し、同じdocIDは後のレコードを正とする
+    """
+
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_PARTIAL = "partial"
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self._records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                for line in f:
+                    # 書き込み途中で中断された行は無視する
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["docID"]] = record
+
+    def is_completed(self, docid, save_zfile_path):
+        """取得済みかつ保存済みファイルのサイズが記録と一致するか判定する"""
+
+        record = self._records.get(docid)
+        if (record is None) or (record["status"] != self.STATUS_COMPLETED):
+            return False
+        return os.path.exists(save_zfile_path) \
+            and os.path.getsize(save_zfile_path) == record["size"]
+
+    def record(self, docid, status, file_name, size=None, sha256=None):
+        """取得結果を追記する"""
+
+        record = {
+            "docID": docid,
+            "file": file_name,
+            "size": size,
+            "sha256": sha256,
+            "status": status,
+            "timestamp": datetime.now().isoformat(timespec="seconds")
+        }
+        with self._lock:
+            self._records[docid] = record
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def extract_tgt_type_docs(json_res):
     """指定したタイプの文書情報を抽出する"""
 
-    json_res = json.loads(res_from_edinet.text)
     # 開示期間が過ぎている場合など取得失敗するケースあり
     if json_res["metadata"]["status"] != "200":
         return []
@@ -61,42 +138,173 @@ def extract_tgt_type_docs(res_from_edinet):
     return doc_info_list
 
 
-def get_doc_list(str_tgt_date):
-    """EDINET API で対象日の提出書類一覧を取得する"""
+def is_doclist_cacheable(str_tgt_date):
+    """対象日の提出書類一覧がキャッシュから取得可能な（今後変わらない）日付か判定する"""
+
+    tgt_date = datetime.strptime(str_tgt_date, DATE_FORMAT).date()
+    return tgt_date < date.today() - timedelta(days=DOCLIST_REFRESH_DAYS)
+
+
+def get_doclist_cache_path(str_tgt_date):
+    """対象日の提出書類一覧のキャッシュファイルのパスを返す"""
+
+    return os.path.join(
+        EDINET_DOCLIST_CACHE_DIR,
+        EDINET_DOCLIST_CACHE_FILE.format(
+            date=str_tgt_date, type=EDINET_API_INFO_TYPE)
+    )
+
+
+def load_doc_list_cache(str_tgt_date):
+    """
+    対象日の提出書類一覧（JSON）をキャッシュから読み込む
+    キャッシュがない、または再取得が必要な日付の場合、Noneを返す
+    """
+
+    cache_path = get_doclist_cache_path(str_tgt_date)
+    if is_doclist_cacheable(str_tgt_date) and os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def request_doc_list_json(str_tgt_date, session):
+    """EDINET API で対象日の提出書類一覧（JSON）を取得し、キャッシュに保存する"""
 
     params = {
         "date": str_tgt_date,
         "type": EDINET_API_INFO_TYPE
     }
-    res = requests.get(EDINET_DOCLIST_API_URL, params=params)
-    return extract_tgt_type_docs(res)
+    res = session.get(EDINET_DOCLIST_API_URL, params=params)
+    raise_for_retryable_status(res)
+    json_res = json.loads(res.text)
+    # 取得に成功したレスポンスのみキャッシュする
+    # 【備考】一時ファイルに書き込んでから置き換え、書き込み途中のキャッシュを残さない
+    if json_res["metadata"]["status"] == "200":
+        cache_path = get_doclist_cache_path(str_tgt_date)
+        os.makedirs(EDINET_DOCLIST_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(json_res, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    return json_res
+
+
+def get_doc_lists(tgt_dates, session, scheduler):
+    """
+    複数の対象日の提出書類一覧を並行して取得する
+    対象日をキー、提出書類一覧を値とする辞書を返す
+    """
+
+    dict_doc_list = {}
+    tasks = []
+    # キャッシュから取得できる日付はAPIを呼ばない
+    for str_tgt_date in tgt_dates:
+        json_res = load_doc_list_cache(str_tgt_date)
+        if json_res is None:
+            tasks.append((
+                DOCLIST_API_PRIORITY,
+                str_tgt_date,
+                partial(request_doc_list_json, str_tgt_date, session)
+            ))
+        else:
+            dict_doc_list[str_tgt_date] = extract_tgt_type_docs(json_res)
+    results, failures = scheduler.run(tasks)
+    for str_tgt_date, json_res in results.items():
+        dict_doc_list[str_tgt_date] = extract_tgt_type_docs(json_res)
+    for str_tgt_date, error in failures.items():
+        print(f"書類一覧の取得失敗: {str_tgt_date} {error}")
+        dict_doc_list[str_tgt_date] = []
+    return dict_doc_list
+
 
+def get_save_zfile_name(docid, doctype, edinetcd, gyoshu):
+    """文書の保存ファイル名を返す"""
 
-def download_zipfile(docid, doctype, edinetcd, gyoshu):
+    return EDINET_DOC_SAVE_FILE.format(
+        gyoshu=gyoshu,
+        doctype=doctype,
+        edinetcd=edinetcd,
+        docid=docid
+    )
+
+
+def download_zipfile(docid, doctype, edinetcd, gyoshu, session, manifest=None):
     """指定した文書をダウンロードして保存する"""
 
     url_doc = EDINET_GETDOC_API_URL.format(docid)
-    save_zfile_path = os.path.join(
-        EDINET_DOC_SAVE_DIR,
-        EDINET_DOC_SAVE_FILE.format(
-            gyoshu=gyoshu,
-            doctype=doctype,
-            edinetcd=edinetcd,
-            docid=docid
-        )
-    )
+    save_zfile_name = get_save_zfile_name(docid, doctype, edinetcd, gyoshu)
+    save_zfile_path = os.path.join(EDINET_DOC_SAVE_DIR, save_zfile_name)
+    # 【備考】一時ファイルに書き込み、完了後にリネームする。
+    # 中断された場合も不完全なzipファイルが保存先に残らない
+    tmp_zfile_path = f"{save_zfile_path}.part"
+    size = 0
+    sha256 = hashlib.sha256()
+    try:
+        with session.get(url_doc, params={"type": 1}, stream=True) as res:
+            # 過負荷・サーバーエラーの場合、スケジューラでリトライする
+            raise_for_retryable_status(res)
+            # zip形式のファイル取得成功時、zipファイルを保存
+            # （"Content-Type"の値は EDINET API仕様書より）
+            if res.headers.get("Content-Type") != "application/octet-stream":
+                if manifest is not None:
+                    manifest.record(docid, DownloadManifest.STATUS_FAILED, save_zfile_name)
+                return False
+            with open(tmp_zfile_path, "wb") as f:
+                for chunk in res.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+                    sha256.update(chunk)
+        os.replace(tmp_zfile_path, save_zfile_path)
+    except Exception:
+        if (manifest is not None) and (size > 0):
+            manifest.record(docid, DownloadManifest.STATUS_PARTIAL, save_zfile_name, size)
+        if os.path.exists(tmp_zfile_path):
+            os.remove(tmp_zfile_path)
+        raise
+    if manifest is not None:
+        manifest.record(
+            docid, DownloadManifest.STATUS_COMPLETED, save_zfile_name, size, sha256.hexdigest())
+    return True
 
-    res = requests.get(url_doc, params={"type": 1})
-    # zip形式のファイル取得成功時、zipファイルを保存
-    # （"Content-Type"の値は EDINET API仕様書より）
-    # TODO: 取得失敗した場合、リトライ
-    if res.headers["Content-Type"] == "application/octet-stream":
-        with open(save_zfile_path, "wb") as f:
-            for chunk in res.iter_content(chunk_size=1024):
-                f.write(chunk)
-                f.flush()
-            return True
-    return False
+
+def download_zipfiles(tgt_docs, session, scheduler, manifest=None):
+    """
+    複数の文書を並行してダウンロードする
+    戻り値: (ダウンロードした文書数, 取得済みのためダウンロードしなかった文書数, 取得失敗したdocIDのリスト)
+    """
+
+    tasks = []
+    skipped_count = 0
+    save_zfile_names = {}
+    for docid, doctype, edinetcd, gyoshu in tgt_docs:
+        save_zfile_names[docid] = get_save_zfile_name(docid, doctype, edinetcd, gyoshu)
+        # 取得済みの文書はダウンロードしない
+        if (manifest is not None) and manifest.is_completed(
+                docid, os.path.join(EDINET_DOC_SAVE_DIR, save_zfile_names[docid])):
+            skipped_count += 1
+            continue
+        tasks.append((
+            GETDOC_API_PRIORITY,
+            docid,
+            partial(download_zipfile, docid, doctype, edinetcd, gyoshu, session, manifest)
+        ))
+    # 【備考】同時実行数・リクエストレートの制御、一時的な失敗のリトライはスケジューラが行う
+    results, failures = scheduler.run(tasks)
+    for docid, error in failures.items():
+        print(f"通信エラー: docID {docid} {error}")
+        if manifest is not None:
+            manifest.record(docid, DownloadManifest.STATUS_FAILED, save_zfile_names[docid])
+        results[docid] = False
+    downloaded_count = 0
+    failed_docs = []
+    for docid, has_successed in results.items():
+        if has_successed == False:
+            print(f"取得失敗: docID {docid}")
+            failed_docs.append([docid])
+        else:
+            downloaded_count += 1
+    return downloaded_count, skipped_count, failed_docs
 
 
 def main():
@@ -106,16 +314,28 @@ def main():
         freq="D"
     ).strftime(DATE_FORMAT)
     # EDINETコードリストから企業情報を取得
-    df_edinetcd_info = get_edinetcd_info(EDINETCDDLINFO_COLS)
+    edinetcd_index = get_edinetcd_index(EDINETCDDLINFO_COLS, EDINETCD_COL)
+    session = create_session(DOWNLOAD_MAX_WORKERS)
+    scheduler = ApiScheduler(
+        DOWNLOAD_MAX_WORKERS,
+        requests_per_second=REQUESTS_PER_SECOND,
+        max_retries=API_MAX_RETRIES,
+        backoff_base=API_BACKOFF_BASE_SEC,
+        backoff_max=API_BACKOFF_MAX_SEC,
+        latency_threshold=API_LATENCY_THRESHOLD_SEC
+    )
+    # 取得済みの文書を把握するため、マニフェストを読み込む
+    os.makedirs(EDINET_DOC_SAVE_DIR, exist_ok=True)
+    manifest = DownloadManifest(
+        os.path.join(EDINET_DOC_SAVE_DIR, DOWNLOAD_MANIFEST_FILE))
+    # ファイル日付が対象日、かつ指定した種類の文書情報一覧を全対象日分取得
+    dict_doc_list = get_doc_lists(tgt_dates, session, scheduler)
     # 対象日ごとの処理
     for str_tgt_date in tgt_dates:
         print(f"{'-'*10} {str_tgt_date} {'-'*10}")
-        # ファイル日付が対象日、かつ指定した種類の文書情報一覧を取得
-        doc_list = get_doc_list(str_tgt_date)
+        doc_list = dict_doc_list[str_tgt_date]
         # 指定した業種の文書を取得
-        os.makedirs(EDINET_DOC_SAVE_DIR, exist_ok=True)
-        get_num = 0
-        failed_docs = []
+        tgt_docs = []
         for doc in doc_list:
             # 縦覧首相・書類取下げによりEDINETコード（他データも）が欠損となる
             if doc["edinetCode"] is None:
@@ -124,28 +344,23 @@ def main():
             # 最新のEDINETコードリストとマッチしないケースがある
             # TODO: ファンドコードを基に変更後のEDINET コードを把握する
             # EDINET API仕様書: EDINET コード自体の変更　参照
-            df_tgt = df_edinetcd_info[
-                df_edinetcd_info[EDINETCD_COL] == doc["edinetCode"]
-            ]
-            if df_tgt.shape[0] < 1:
+            filer_info = edinetcd_index.get(doc["edinetCode"])
+            if filer_info is None:
                 continue
-            elif df_tgt.shape[0] > 1:
-                print("【想定外】EDINETコードコードリストのEDINETコードに重複があります。")
-                sys.exit()
-            gyoshu = df_tgt[TEISHUTUSHA_GYOSHU_COL].values[0]
+            gyoshu = filer_info[TEISHUTUSHA_GYOSHU_COL]
             if TGT_GYOSHU_LIST:
                 if gyoshu not in TGT_GYOSHU_LIST:
                     continue
             edinet_cd = doc["edinetCode"]
             if TGT_EDINETCD_LIST and (edinet_cd not in TGT_EDINETCD_LIST):
                 continue
-            has_successed = download_zipfile(
-                doc["docID"], doc["docTypeCode"], edinet_cd, gyoshu)
-            if has_successed == False:
-                print(f"取得失敗: docID {doc['docID']}")
-                failed_docs.append([doc["docID"]])
-            get_num += 1
-        print(f"ダウンロード数: {get_num}")
+            tgt_docs.append(
+                (doc["docID"], doc["docTypeCode"], edinet_cd, gyoshu))
+        downloaded_count, skipped_count, failed_docs = download_zipfiles(
+            tgt_docs, session, scheduler, manifest)
+        print(f"ダウンロード数: {downloaded_count}")
+        print(f"取得済み（スキップ）数: {skipped_count}")
+        print(f"取得失敗数: {len(failed_docs)}")
         # EDINETから取得失敗した文書がある場合、docidを出力しておく
         if failed_docs:
             output_path = os.path.join(
@@ -0,0 +1,295 @@
+"""
+解析処理の計測（処理段階ごとの所要時間・件数）
+
+【備考】
+- ファイルごとに、処理段階（読み込み・DEI取得・リレーションシップの走査など）の所要時間と
+  カウンタ（factの件数・factの参照回数など）を記録する
+  - 計測値は解析を行うプロセス内で記録し、解析結果と合わせて親プロセスに返す
+  - 処理段階は入れ子にできる（取得処理全体と、その中のDEI取得など）。各段階の時間は個別に集計する
+- ファイルの解析以外の処理段階（zipファイルの解凍など）は、実行全体の計測値として記録する
+- ファイルごとの計測結果を JSON Lines 形式で出力し、処理の最後に百分位数による集計を出力する
+- 解析中のファイルがない場合（計測対象外の呼び出し）、カウンタは記録しない
+- ファイルごとに、解析を行うプロセスのメモリ使用量（RSS）を解析の開始時・読み込み後・終了時に記録し、
+  メモリ使用量の増加が他のファイルより極端に大きいファイルを集計で表示する
+  （psutil がある場合は psutil、ない場合は /proc/self/statm（Linux）から取得する）
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 集計に使う百分位数
+SUMMARY_PERCENTILES = [50, 90, 99]
+# 集計に表示する、所要時間の長いファイルの件数
+SLOWEST_FILES_NUM = 5
+# メモリ使用量の増加が、全ファイルの中央値のこの倍数を超えたファイルを集計で表示する
+MEMORY_OUTLIER_FACTOR = 3.0
+# 上記の判定で、メモリ使用量の増加（MB）がこの値未満のファイルは表示しない
+MEMORY_OUTLIER_MIN_MB = 50
+
+# 解析中のファイルの計測値（start_file で作成し、finish_file で返す）
+_file_metrics = None
+# ファイルの解析以外の処理段階の所要時間
+_run_phases = defaultdict(float)
+
+
+def get_rss_mb():
+    """現在のプロセスのメモリ使用量（RSS、MB）を取得する（取得できない場合、None）"""
+
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def start_file():
+    """ファイルの計測を開始する"""
+
+    global _file_metrics
+    _file_metrics = {
+        "start": time.perf_counter(),
+        "phases": defaultdict(float),
+        "counters": defaultdict(int),
+        "rss_mb": {"start": get_rss_mb()},
+    }
+
+
+def sample_rss(name):
+    """解析中のファイルの計測値として、現在のメモリ使用量（RSS）を記録する"""
+
+    if _file_metrics is not None:
+        _file_metrics["rss_mb"][name] = get_rss_mb()
+
+
+def finish_file():
+    """
+    ファイルの計測を終了し、計測値を返す
+    戻り値: {"duration_sec": 所要時間, "phases": {処理段階: 所要時間}, "counters": {カウンタ: 値},
+             "rss_mb": {計測時点: メモリ使用量}, "pid": プロセスID}
+    """
+
+    global _file_metrics
+    metrics = _file_metrics
+    _file_metrics = None
+    if metrics is None:
+        return {"duration_sec": 0.0, "phases": {}, "counters": {},
+                "rss_mb": {"end": get_rss_mb()}, "pid": os.getpid()}
+    metrics["rss_mb"]["end"] = get_rss_mb()
+    return {
+        "duration_sec": time.perf_counter() - metrics["start"],
+        "phases": dict(metrics["phases"]),
+        "counters": dict(metrics["counters"]),
+        "rss_mb": metrics["rss_mb"],
+        "pid": os.getpid(),
+    }
+
+
+def get_memory_cost_mb(metrics):
+    """ファイルの解析によるメモリ使用量の増加（解析中の最大 - 開始時、MB）を求める（取得できない場合、None）"""
+
+    rss_values = [value for value in metrics.get("rss_mb", {}).values() if value is not None]
+    start = metrics.get("rss_mb", {}).get("start")
+    if (start is None) or (not rss_values):
+        return None
+    return max(rss_values) - start
+
+
+@contextmanager
+def phase(name):
+    """with ブロックの所要時間を、処理段階 name の時間として記録する"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if _file_metrics is not None:
+            _file_metrics["phases"][name] += elapsed
+        else:
+            _run_phases[name] += elapsed
+
+
+def count(name, value=1):
+    """解析中のファイルのカウンタ name に value を加算する"""
+
+    if _file_metrics is not None:
+        _file_metrics["counters"][name] += value
+
+
+def percentile(values, pct):
+    """百分位数を求める（線形補間）"""
+
+    sorted_values = sorted(values)
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize_values(values):
+    """値のリストを集計する（合計・平均・百分位数・最大）"""
+
+    summary = {"total": sum(values), "mean": sum(values) / len(values)}
+    for pct in SUMMARY_PERCENTILES:
+        summary[f"p{pct}"] = percentile(values, pct)
+    summary["max"] = max(values)
+    return summary
+
+
+class RunMetrics:
+    """
+    1回の実行の計測結果（ファイルごとの計測値・進捗）を記録する
+    metrics_path を指定した場合、ファイルごとの計測結果と集計を JSON Lines 形式で出力する
+    """
+
+    def __init__(self, file_num, metrics_path=None):
+        self.file_num = file_num
+        self.metrics_path = metrics_path
+        self._start = time.perf_counter()
+        self._records = []
+        self._file = None
+        if metrics_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+            self._file = open(metrics_path, "a", encoding="utf-8")
+
+    def write_record(self, record):
+        """計測結果を1行出力する"""
+
+        if self._file is not None:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def add_file(self, xbrl_file, metrics, error=None):
+        """1ファイル分の計測値を記録し、進捗（処理件数・スループット・残り時間の見込み）を表示する"""
+
+        done_num = len(self._records) + 1
+        elapsed = time.perf_counter() - self._start
+        throughput = done_num / elapsed if elapsed > 0 else None
+        eta = (self.file_num - done_num) / throughput if throughput else None
+        record = {
+            "type": "file",
+            "file": xbrl_file,
+            "status": "failed" if error is not None else "ok",
+            "error": error,
+            "count": done_num,
+            "elapsed_sec": elapsed,
+            "throughput_files_per_sec": throughput,
+            "eta_sec": eta,
+            **metrics,
+        }
+        memory_cost = get_memory_cost_mb(metrics)
+        record["memory_cost_mb"] = memory_cost
+        self._records.append({
+            "file": xbrl_file,
+            "failed": error is not None,
+            "duration_sec": metrics["duration_sec"],
+            "phases": metrics["phases"],
+            "counters": metrics["counters"],
+            "memory_cost_mb": memory_cost,
+            "rss_end_mb": metrics.get("rss_mb", {}).get("end"),
+        })
+        self.write_record(record)
+        progress = f"{xbrl_file} : {done_num} / {self.file_num}　{metrics['duration_sec']:.2f}秒"
+        if throughput is not None:
+            progress += f"　{throughput:.2f}件/秒　残り約{eta:.0f}秒"
+        print(progress)
+
+    def summarize(self):
+        """実行全体の集計（処理段階ごとの百分位数・カウンタの合計・所要時間の長いファイル）"""
+
+        elapsed = time.perf_counter() - self._start
+        phase_values = defaultdict(list)
+        counter_totals = defaultdict(int)
+        for record in self._records:
+            for name, value in record["phases"].items():
+                phase_values[name].append(value)
+            for name, value in record["counters"].items():
+                counter_totals[name] += value
+        durations = [record["duration_sec"] for record in self._records]
+        slowest = sorted(self._records, key=lambda record: record["duration_sec"], reverse=True)
+        memory_costs = [record["memory_cost_mb"] for record in self._records
+                        if record["memory_cost_mb"] is not None]
+        rss_ends = [record["rss_end_mb"] for record in self._records if record["rss_end_mb"] is not None]
+        memory_outliers = []
+        if memory_costs:
+            threshold = max(percentile(memory_costs, 50) * MEMORY_OUTLIER_FACTOR, MEMORY_OUTLIER_MIN_MB)
+            memory_outliers = [
+                {"file": record["file"], "memory_cost_mb": record["memory_cost_mb"]}
+                for record in sorted(self._records, key=lambda record: record["memory_cost_mb"] or 0,
+                                     reverse=True)
+                if (record["memory_cost_mb"] is not None) and (record["memory_cost_mb"] > threshold)
+            ]
+        return {
+            "type": "summary",
+            "files": len(self._records),
+            "failed_files": sum(record["failed"] for record in self._records),
+            "elapsed_sec": elapsed,
+            "throughput_files_per_sec": len(self._records) / elapsed if elapsed > 0 else None,
+            "duration": summarize_values(durations) if durations else None,
+            "phases": {name: summarize_values(values) for name, values in phase_values.items()},
+            "run_phases": dict(_run_phases),
+            "counters": dict(counter_totals),
+            "memory_cost_mb": summarize_values(memory_costs) if memory_costs else None,
+            "max_rss_mb": max(rss_ends) if rss_ends else None,
+            "memory_outliers": memory_outliers,
+            "slowest_files": [
+                {"file": record["file"], "duration_sec": record["duration_sec"]}
+                for record in slowest[:SLOWEST_FILES_NUM]
+            ],
+        }
+
+    def close(self):
+        """集計を表示・出力する"""
+
+        summary = self.summarize()
+        # 【備考】同じプロセスで再度実行する場合に備え、実行全体の計測値を破棄する
+        _run_phases.clear()
+        self.write_record(summary)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        print_summary(summary)
+        return summary
+
+
+def print_summary(summary):
+    """集計を表示する"""
+
+    print(f"{'-'*10} 計測結果 {'-'*10}")
+    print(f"ファイル数: {summary['files']}件（失敗 {summary['failed_files']}件）"
+          f"　所要時間: {summary['elapsed_sec']:.2f}秒")
+    if summary["throughput_files_per_sec"] is not None:
+        print(f"スループット: {summary['throughput_files_per_sec']:.2f}件/秒")
+    for name, value in summary["run_phases"].items():
+        print(f"[全体] {name}: {value:.2f}秒")
+    pct_names = [f"p{pct}" for pct in SUMMARY_PERCENTILES]
+    rows = [("ファイル全体", summary["duration"])] if summary["duration"] else []
+    rows += list(summary["phases"].items())
+    for name, values in rows:
+        pcts = "　".join(f"{pct_name} {values[pct_name]:.3f}" for pct_name in pct_names)
+        print(f"{name}: 合計 {values['total']:.2f}秒　{pcts}　最大 {values['max']:.3f}（秒）")
+    for name, value in summary["counters"].items():
+        print(f"{name}: {value}")
+    if summary["slowest_files"]:
+        print("所要時間の長いファイル:")
+        for record in summary["slowest_files"]:
+            print(f"  {record['duration_sec']:.2f}秒 {record['file']}")
+    if summary["memory_cost_mb"] is not None:
+        values = summary["memory_cost_mb"]
+        print(f"メモリ使用量の増加: p50 {values['p50']:.1f}　p90 {values['p90']:.1f}"
+              f"　最大 {values['max']:.1f}（MB）　解析終了時の最大 {summary['max_rss_mb']:.1f}MB")
+    if summary["memory_outliers"]:
+        print("メモリ使用量の増加が極端に大きいファイル:")
+        for record in summary["memory_outliers"]:
+            print(f"  {record['memory_cost_mb']:.1f}MB {record['file']}")
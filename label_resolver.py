@@ -0,0 +1,200 @@
+"""
+要素（concept）のラベルの取得
+
+【備考】
+- concept.label() は呼び出しのたびに名称リンクのリレーションシップを走査し、ロール・言語で絞り込む
+  このモジュールでは要素ごとにラベルの一覧（ロール・言語・ラベル）を1度だけ作成し、
+  以降の取得（異なるロール・言語を含む）は辞書の参照で済ませる
+- ラベルの選択規則（優先度・言語の前方一致など）は Arelle の concept.label() と同じ
+  - Arelle（ModelRelationshipSet.label）と同じく、ラベルは優先度の高い順に並べてから選択する
+    （リレーションシップの同等性は考慮しない）
+  - 言語を指定しない場合（LABEL_LANG = None）、言語によらず優先度の最も高いラベルとする（従来どおり）
+- ラベルの一覧はプロセス内でキャッシュし、同じEDINETタクソノミの名称リンクを使う提出書類間で共有する
+  - キャッシュのキーは (EDINETタクソノミ（taxonomy_cache.EDINET_TAXONOMY_URL 配下）の名称リンクの
+    ファイルの一覧, QName) とし、ファイルの一覧は提出書類ごとに1度だけ作成する
+    （キャッシュにある場合は、名称リンクのリレーションシップを走査しない）
+  - 提出者別タクソノミの名称リンクで参照される要素（提出者の要素、ラベルを追加・変更（上書き・禁止）した
+    EDINETタクソノミの要素）は共有せず、提出書類ごとに作成する
+  - 英語のラベルのファイル（*_lab-en.xml）を読み込まない設定（taxonomy_cache.TAXONOMY_SKIP_LOADING）の
+    場合、英語のラベルは取得できない（select_label の英語へのフォールバックを含む）
+- 提出書類ごとのラベルの取得は get_label_resolver(model_xbrl) で取得した LabelResolver を使う
+"""
+
+from collections import OrderedDict
+
+from arelle import Locale, ModelDocument, XbrlConst
+
+from instrumentation import count
+from taxonomy_cache import EDINET_TAXONOMY_URL
+
+# 出力に使うラベルのロール
+# （例: 冗長ラベル "http://www.xbrl.org/2003/role/verboseLabel"）
+LABEL_ROLE = XbrlConst.standardLabel
+# 出力に使うラベルの言語（"ja": 日本語, "en": 英語。Noneの場合、言語によらず優先度の最も高いラベル）
+LABEL_LANG = None
+# プロセス内でキャッシュする要素（ラベルの一覧）の最大数（超えた場合、古いものから破棄する）
+LABEL_CACHE_MAX_SIZE = 100000
+# 読み込み済みの ModelXbrl に LabelResolver を保持する属性名
+RESOLVER_ATTR_NAME = "_label_resolver"
+
+# 提出書類間で共有するラベルの一覧のキャッシュ（ワーカープロセスごとに保持される）
+_shared_entries = OrderedDict()
+
+
+class LabelResolver:
+    """提出書類（読み込み済みの ModelXbrl）の要素のラベルを取得する"""
+
+    def __init__(self, model_xbrl):
+        self.model_xbrl = model_xbrl
+        self._rel_set = model_xbrl.relationshipSet(XbrlConst.conceptLabel)
+        # 共有キャッシュのキーに使う名称リンクのファイルの一覧・共有しない要素のQName（初回の取得時に作成する）
+        self._shared_linkbases = None
+        self._filer_qnames = None
+        # QNameごとのラベルの一覧
+        self._entries = {}
+        # (QName, ロール, 言語) ごとのラベル
+        self._labels = {}
+
+    def get_entries(self, qn):
+        """
+        要素のラベルの一覧を取得する
+        戻り値: (ロール, 言語（小文字）, ラベル) のリスト（優先度の高い順）
+        """
+
+        entries = self._entries.get(qn)
+        if entries is not None:
+            return entries
+        if self._filer_qnames is None:
+            self._shared_linkbases, self._filer_qnames = get_label_linkbases(self.model_xbrl)
+        # 【備考】提出者別タクソノミの名称リンクで参照されない要素は、提出書類間で共有する
+        shared_key = None
+        if qn not in self._filer_qnames:
+            shared_key = (self._shared_linkbases, qn)
+            entries = _shared_entries.get(shared_key)
+        if entries is not None:
+            count("label_cache_hits")
+            _shared_entries.move_to_end(shared_key)
+        else:
+            count("label_cache_misses")
+            concept = self.model_xbrl.qnameConcepts.get(qn)
+            rels = self._rel_set.fromModelObject(concept) if (concept is not None) and self._rel_set else []
+            # 【備考】Arelle（ModelRelationshipSet.label）と同じく、優先度の高い順に並べる
+            # （優先度が同じ場合はリレーションシップの順序）
+            if len(rels) > 1:
+                rels = sorted(rels, key=lambda rel: rel.priority, reverse=True)
+            entries = []
+            for rel in rels:
+                label = rel.toModelObject
+                label_lang = label.xmlLang
+                entries.append((label.role, label_lang.lower() if label_lang else label_lang, label.textValue))
+            if shared_key is not None:
+                _shared_entries[shared_key] = entries
+                if len(_shared_entries) > LABEL_CACHE_MAX_SIZE:
+                    _shared_entries.popitem(last=False)
+        self._entries[qn] = entries
+        return entries
+
+    def label(self, qn, role=None, lang=None, fallback_to_qname=True):
+        """
+        要素のラベルを取得する
+        role: ラベルのロール（Noneの場合、LABEL_ROLE）
+        lang: ラベルの言語（Noneの場合、LABEL_LANG）
+        ラベルがない場合、fallback_to_qname が True であればQNameの文字列、False であれば None
+        """
+
+        if role is None:
+            role = LABEL_ROLE
+        if lang is None:
+            lang = LABEL_LANG
+        key = (qn, role, lang)
+        if key in self._labels:
+            return self._labels[key]
+        text = select_label(self.get_entries(qn), role, lang)
+        if text is not None:
+            text = Locale.rtlString(text, lang=lang.lower() if lang else lang)
+        elif fallback_to_qname:
+            text = str(qn)
+        self._labels[key] = text
+        return text
+
+
+def select_label(entries, role, lang):
+    """
+    ラベルの一覧から、ロール・言語に合うラベルを選択する（Arelle の concept.label() と同じ規則）
+    言語が一致するラベルがない場合、より一般的な言語（"ja-JP" に対する "ja" など）、
+    より詳細な言語（"ja" に対する "ja-JP" など）、地域のみ異なる言語のラベルの順に選択する
+    """
+
+    lang = lang.lower() if lang else lang
+    base_lang = lang.partition(Locale.BCP47_LANGUAGE_REGION_SEPARATOR)[0] if lang else None
+    shorter = longer = regional_variant = None
+    for label_role, label_lang, text in entries:
+        if label_role != role:
+            continue
+        if (not lang) or (lang == label_lang):
+            return text
+        if label_lang is None:
+            continue
+        if label_lang.startswith(lang):
+            if (longer is None) or (len(longer[0]) > len(label_lang)):
+                longer = (label_lang, text)
+        elif lang.startswith(label_lang):
+            if (shorter is None) or (len(shorter[0]) < len(label_lang)):
+                shorter = (label_lang, text)
+        elif base_lang and label_lang.startswith(base_lang):
+            if regional_variant is None:
+                regional_variant = (label_lang, text)
+    for candidate in (shorter, longer, regional_variant):
+        if candidate is not None:
+            return candidate[1]
+    return None
+
+
+def get_label_linkbases(model_xbrl):
+    """
+    読み込み済みの ModelXbrl の名称リンクのファイルを確認する
+    戻り値: (EDINETタクソノミの名称リンクのファイルのURIのタプル（ソート済み）,
+            提出者別タクソノミの名称リンクで参照される要素のQNameの集合)
+    """
+
+    shared_linkbases = []
+    filer_qnames = set()
+    for model_document in model_xbrl.urlDocs.values():
+        if model_document.type not in (ModelDocument.Type.LINKBASE, ModelDocument.Type.SCHEMA):
+            continue
+        root = model_document.xmlRootElement
+        if model_document.uri.startswith(EDINET_TAXONOMY_URL):
+            # 【備考】EDINETタクソノミは名称リンクのファイルのみ（ファイルの先頭の拡張リンクで判定する）
+            if (model_document.type == ModelDocument.Type.LINKBASE
+                    and root.find(f"{{{XbrlConst.link}}}labelLink") is not None):
+                shared_linkbases.append(model_document.uri)
+            continue
+        for label_link in root.iterdescendants(f"{{{XbrlConst.link}}}labelLink"):
+            for loc in label_link.iterchildren(f"{{{XbrlConst.link}}}loc"):
+                concept = loc.dereference()
+                if getattr(concept, "qname", None) is not None:
+                    filer_qnames.add(concept.qname)
+    return tuple(sorted(shared_linkbases)), filer_qnames
+
+
+def get_label_resolver(model_xbrl):
+    """読み込み済みの ModelXbrl の LabelResolver を取得する（ModelXbrl ごとに1度だけ作成する）"""
+
+    # 【備考】ModelXbrl の属性として保持する（ModelXbrl を閉じると、属性とともに破棄される）
+    resolver = getattr(model_xbrl, RESOLVER_ATTR_NAME, None)
+    if resolver is None:
+        resolver = LabelResolver(model_xbrl)
+        setattr(model_xbrl, RESOLVER_ATTR_NAME, resolver)
+    return resolver
+
+
+def get_label(model_xbrl, qn, role=None, lang=None):
+    """要素のラベルを取得する（get_label_resolver(model_xbrl).label と同じ）"""
+
+    return get_label_resolver(model_xbrl).label(qn, role, lang)
+
+
+def clear_label_cache():
+    """提出書類間で共有するラベルの一覧のキャッシュを破棄する"""
+
+    _shared_entries.clear()
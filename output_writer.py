@@ -0,0 +1,467 @@
+"""
+取得結果をファイルごとに受け取り、一定件数ごとにCSVへ書き出す
+
+【備考】
+- 全ファイルの取得結果をメモリに溜めてから出力すると、件数に比例してメモリを使い、
+  途中で処理が止まった場合は何も出力されない
+- 取得結果を chunk_size ファイル分ずつ部分ファイル（{出力ファイル名}.parts 配下）に書き出し、
+  close() 時に1つのCSVにまとめる
+  - 処理が途中で止まった場合も、書き出し済みの部分ファイルはそれぞれ単独で読み込める
+  - 次回の実行時、残っている部分ファイルのディレクトリは「{出力ファイル名}.parts.{日時}」に移動して残す
+- 既存の出力ファイルにマージする場合、取得元の列（SOURCE_FILE_COL）がないファイルはマージせず、
+  「{出力ファイル名}.{日時}」にコピーを残してから上書きする
+- 企業ごとに勘定科目（列）が異なるため、まとめる際の列は全部分ファイルの列の和集合とする
+  （列の順序は、最初に出現した順）
+- 出力形式は CSV（cp932）と Parquet から選択する
+  - Parquet の場合、factの値を要素の型に応じた型（金額: int64 / decimal、日付: date、
+    真偽値: bool）に変換し、列のメタデータに要素のQName・decimals・scaleを設定する
+  - 値の型・メタデータは、取得処理で factの値を FactValue（文字列のサブクラス）として
+    設定した列のみ対象とする（それ以外の列は文字列）
+  - pyarrow が必要（Parquet を出力する場合のみ）
+"""
+
+import csv
+import datetime
+import os
+import re
+import shutil
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+
+# 部分ファイルへ書き出すまでに溜めるファイル数
+OUTPUT_CHUNK_SIZE = 100
+# 部分ファイルのディレクトリ名の接尾辞
+PARTS_DIR_SUFFIX = ".parts"
+# 取得元のXBRLファイルを設定する列（既存の出力ファイルにマージする際、行の取得元の判定に使う）
+SOURCE_FILE_COL = "XBRLファイル"
+# 既存の出力ファイルを読み込む際の、1回あたりの行数
+EXISTING_OUTPUT_READ_ROWS = 100000
+# 出力形式ごとの拡張子
+OUTPUT_FORMAT_EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+}
+
+# 整数型として扱うXMLスキーマの型
+INTEGER_XSD_TYPES = (
+    "integer", "nonNegativeInteger", "positiveInteger", "nonPositiveInteger",
+    "negativeInteger", "long", "int", "short", "byte",
+    "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte",
+)
+# 小数を含み得る数値型として扱うXMLスキーマの型（全ての値が整数の場合、int64にする）
+DECIMAL_XSD_TYPES = ("decimal",)
+# 浮動小数点数型として扱うXMLスキーマの型
+FLOAT_XSD_TYPES = ("float", "double")
+# decimal型の最大桁数（pyarrow の decimal128 の上限）
+MAX_DECIMAL_PRECISION = 38
+
+
+class FactValue(str):
+    """
+    factの値（文字列）に、要素のQName・型・decimals・scaleを付加したもの
+    文字列として扱えるため、CSV出力・EDINETコードリストのマージなどはそのまま行える
+    """
+
+    def __new__(cls, value, qname=None, xbrl_type=None, decimals=None, scale=None):
+        self = super().__new__(cls, value)
+        self.qname = qname
+        self.xbrl_type = xbrl_type
+        self.decimals = decimals
+        self.scale = scale
+        return self
+
+    def __getnewargs__(self):
+        # プロセス間で受け渡す（pickle する）際に、付加した情報も復元する
+        return (str(self), self.qname, self.xbrl_type, self.decimals, self.scale)
+
+
+def fact_value(fact):
+    """factから FactValue を作成する"""
+
+    concept = fact.concept
+    return FactValue(
+        fact.value,
+        qname=str(fact.qname),
+        xbrl_type=concept.baseXsdType if concept is not None else None,
+        decimals=fact.decimals,
+        # 【備考】scale はインラインXBRLのfactのみ持つ属性
+        scale=getattr(fact, "scale", None)
+    )
+
+
+def get_output_path(output_path, output_format):
+    """出力形式に応じて、出力ファイルの拡張子を変更する"""
+
+    if output_format not in OUTPUT_FORMAT_EXTENSIONS:
+        raise ValueError(
+            f"出力形式の指定が想定外です: {output_format}  想定: {list(OUTPUT_FORMAT_EXTENSIONS)}")
+    return os.path.splitext(output_path)[0] + OUTPUT_FORMAT_EXTENSIONS[output_format]
+
+
+def create_chunked_writer(output_path, output_format="csv", chunk_size=OUTPUT_CHUNK_SIZE,
+                          transform=None, merge_existing=False):
+    """出力形式に応じたライターを作成する"""
+
+    output_path = get_output_path(output_path, output_format)
+    if output_format == "parquet":
+        writer_class = ChunkedParquetWriter
+    else:
+        writer_class = ChunkedCsvWriter
+    return writer_class(
+        output_path, chunk_size=chunk_size, transform=transform, merge_existing=merge_existing)
+
+
+class ChunkedCsvWriter:
+    """取得結果を一定件数ごとに書き出すCSVライター"""
+
+    def __init__(self, output_path, chunk_size=OUTPUT_CHUNK_SIZE, transform=None,
+                 merge_existing=False, encoding="cp932"):
+        """
+        transform: 書き出す前にDataFrameに適用する関数（EDINETコードリストのマージなど）
+        merge_existing: Trueの場合、既存の出力ファイルの行のうち、
+                        今回取得したファイル以外の行を残して出力する
+        """
+
+        self.output_path = output_path
+        self.chunk_size = chunk_size
+        self.transform = transform
+        self.merge_existing = merge_existing
+        self.encoding = encoding
+        self.parts_dir = output_path + PARTS_DIR_SUFFIX
+        self.row_num = 0
+        self._buffer = []
+        self._buffered_file_num = 0
+        self._part_files = []
+        self._part_num = 0
+        # 今回取得したファイル（取得結果がないファイルも含む）
+        self._sources = set()
+        # 前回の実行で残った部分ファイルは使わない
+        # 【備考】途中で止まった実行の取得結果のため削除せず、ディレクトリ名に日時を付けて残す
+        if os.path.isdir(self.parts_dir):
+            backup_dir = f"{self.parts_dir}.{datetime.datetime.now():%Y%m%d_%H%M%S}"
+            os.rename(self.parts_dir, backup_dir)
+            print(f"前回の実行で残った部分ファイルを移動しました: {backup_dir}")
+
+    def write(self, facts, source=None):
+        """
+        1ファイル分の取得結果を追加する
+        facts: 辞書のリスト、または DataFrame（None の場合、何もしない）
+        source: 取得元のXBRLファイル（指定した場合、SOURCE_FILE_COL 列に設定する）
+        """
+
+        if source is not None:
+            self._sources.add(source)
+        if facts is None:
+            return
+        if isinstance(facts, pd.DataFrame):
+            if facts.empty:
+                return
+        elif not facts:
+            return
+        self._buffer.append((facts, source))
+        self._buffered_file_num += 1
+        if self._buffered_file_num >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """溜まっている取得結果を部分ファイルに書き出す"""
+
+        if not self._buffer:
+            return
+        list_df = []
+        for facts, _ in self._buffer:
+            if not isinstance(facts, pd.DataFrame):
+                # 【備考】factの値（FactValue）を文字列型に変換せずに保持するため、object型で作成する
+                facts = pd.DataFrame(facts, dtype=object)
+            list_df.append(facts)
+        df_chunk = pd.concat(list_df, axis=0, sort=False) if len(list_df) > 1 else list_df[0]
+        if self.transform is not None:
+            df_chunk = self.transform(df_chunk)
+        if any(source is not None for _, source in self._buffer):
+            df_chunk = df_chunk.reset_index(drop=True)
+            df_chunk[SOURCE_FILE_COL] = [
+                source for df, (_, source) in zip(list_df, self._buffer) for _ in range(len(df))]
+        self.write_part(df_chunk)
+        self.row_num += len(df_chunk)
+        self._buffer = []
+        self._buffered_file_num = 0
+
+    def write_part(self, df_part, prepend=False):
+        """部分ファイルを書き出す（prepend=True の場合、まとめる際に先頭に配置する）"""
+
+        os.makedirs(self.parts_dir, exist_ok=True)
+        part_file = os.path.join(self.parts_dir, f"part_{self._part_num:05d}.csv")
+        self._part_num += 1
+        df_part.to_csv(part_file, index=False, encoding=self.encoding)
+        part_column_keys = get_column_keys(df_part.columns)
+        self.collect_column_info(df_part, part_column_keys)
+        if prepend:
+            self._part_files.insert(0, (part_file, part_column_keys))
+        else:
+            self._part_files.append((part_file, part_column_keys))
+
+    def collect_column_info(self, df_chunk, part_column_keys):
+        """部分ファイルに書き出す取得結果から、列の情報を収集する（CSVでは何もしない）"""
+
+    def iter_existing_output(self):
+        """既存の出力ファイルを一定行数ずつ読み込む（値は文字列）"""
+
+        with open(self.output_path, encoding=self.encoding, newline="") as f:
+            columns = next(csv.reader(f), None)
+        if columns is None:
+            return
+        for df_existing in pd.read_csv(
+                self.output_path, header=None, skiprows=1, dtype=str, keep_default_na=False,
+                encoding=self.encoding, chunksize=EXISTING_OUTPUT_READ_ROWS):
+            df_existing.columns = columns
+            yield df_existing
+
+    def stage_existing_output(self):
+        """既存の出力ファイルの行のうち、今回取得したファイル以外の行を部分ファイルとして残す"""
+
+        list_df_existing = []
+        for df_existing in self.iter_existing_output():
+            if SOURCE_FILE_COL not in df_existing.columns:
+                # 【備考】行の取得元が分からずマージできないため、上書きされる前にファイル名に日時を付けて残す
+                backup_path = f"{self.output_path}.{datetime.datetime.now():%Y%m%d_%H%M%S}"
+                shutil.copy2(self.output_path, backup_path)
+                print(f"既存の出力ファイルに{SOURCE_FILE_COL}列がないため、マージせずにコピーを残しました: "
+                      f"{backup_path}")
+                return
+            df_existing = df_existing[~df_existing[SOURCE_FILE_COL].isin(self._sources)]
+            if not df_existing.empty:
+                list_df_existing.append(df_existing)
+        # 既存の行を先頭に配置する（読み込んだ順序を保つため、後ろの部分から先頭に挿入する）
+        for df_existing in reversed(list_df_existing):
+            self.write_part(df_existing, prepend=True)
+
+    def iter_parts(self, column_keys):
+        """部分ファイルを順に読み込み、列を column_keys に揃えて返す"""
+
+        for part_file, part_column_keys in self._part_files:
+            # 【備考】値は文字列のまま読み込み、部分ファイルに書き出した表記を変えない
+            df_part = pd.read_csv(
+                part_file, header=None, skiprows=1, dtype=str,
+                keep_default_na=False, encoding=self.encoding)
+            df_part.columns = pd.Index(part_column_keys, tupleize_cols=False)
+            yield df_part.reindex(columns=pd.Index(column_keys, tupleize_cols=False))
+
+    def merge_parts(self, tmp_path, column_keys):
+        """部分ファイルを1つのCSVにまとめる"""
+
+        with open(tmp_path, "w", encoding=self.encoding, newline="") as f:
+            pd.DataFrame(columns=[name for name, _ in column_keys]).to_csv(f, index=False)
+            for df_part in self.iter_parts(column_keys):
+                df_part.to_csv(f, index=False, header=False)
+
+    def close(self):
+        """
+        部分ファイルを1つのファイルにまとめる
+        戻り値: 出力したかどうか（出力データがない場合、False）
+        """
+
+        self.flush()
+        if self.merge_existing and os.path.exists(self.output_path):
+            self.stage_existing_output()
+        if not self._part_files:
+            return False
+        # 【備考】列の順序は、部分ファイルの順（既存の出力ファイル、今回の取得結果の順）に最初に出現した順
+        column_keys = list(dict.fromkeys(
+            column_key for _, part_column_keys in self._part_files
+            for column_key in part_column_keys
+        ))
+        tmp_path = self.output_path + ".tmp"
+        self.merge_parts(tmp_path, column_keys)
+        os.replace(tmp_path, self.output_path)
+        shutil.rmtree(self.parts_dir)
+        return True
+
+
+class ChunkedParquetWriter(ChunkedCsvWriter):
+    """
+    取得結果を一定件数ごとに書き出し、型付きの Parquet にまとめるライター
+    【備考】部分ファイルはCSVと同じ形式で書き出し、全ての部分ファイルを書き出した後に
+    列ごとの型を決めて変換する（部分ファイルごとに型が揺れないようにするため）
+    """
+
+    def __init__(self, output_path, chunk_size=OUTPUT_CHUNK_SIZE, transform=None,
+                 merge_existing=False, encoding="cp932"):
+        # 【備考】pyarrow は Parquet を出力する場合のみ必要なため、ここで読み込めるか確認する
+        import pyarrow  # noqa: F401
+
+        super().__init__(output_path, chunk_size=chunk_size, transform=transform,
+                         merge_existing=merge_existing, encoding=encoding)
+        # 列ごとの情報（列名, 同じ列名の出現順）: {qnames, xbrl_type, decimals, scales, max_frac_digits}
+        self._column_info = {}
+
+    def collect_column_info(self, df_chunk, part_column_keys):
+        """FactValue の列について、要素のQName・型・decimals・scale・小数部の桁数を収集する"""
+
+        for column_key, (_, values) in zip(part_column_keys, df_chunk.items()):
+            for value in values:
+                if not isinstance(value, FactValue):
+                    continue
+                info = self._column_info.setdefault(column_key, {
+                    "qnames": {}, "xbrl_type": value.xbrl_type,
+                    "decimals": {}, "scales": {}, "max_frac_digits": 0,
+                })
+                info["qnames"][value.qname] = None
+                if value.decimals is not None:
+                    info["decimals"][value.decimals] = None
+                if value.scale is not None:
+                    info["scales"][value.scale] = None
+                if "." in value:
+                    frac_digits = len(value.split(".", 1)[1].rstrip("0"))
+                    info["max_frac_digits"] = max(info["max_frac_digits"], frac_digits)
+
+    def iter_existing_output(self):
+        """
+        既存の出力ファイルを一定行数ずつ読み込む
+        値は部分ファイルと同じ文字列の表記に戻し、列の情報は列のメタデータから復元する
+        """
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.output_path)
+        schema = parquet_file.schema_arrow
+        columns = []
+        for field in schema:
+            # 【備考】同じ列名の列は「.1」などを付けて出力しているため、元の列名に戻す
+            match = re.fullmatch(r"(.*)\.(\d+)", field.name)
+            if match and (match.group(1) in columns):
+                column_key = (match.group(1), int(match.group(2)))
+            else:
+                column_key = (field.name, 0)
+            columns.append(column_key[0])
+            if field.metadata:
+                metadata = {key.decode(): value.decode() for key, value in field.metadata.items()}
+                self._column_info.setdefault(column_key, {
+                    "qnames": dict.fromkeys(filter(None, metadata.get("qname", "").split(","))),
+                    "xbrl_type": metadata.get("xbrl_type") or None,
+                    "decimals": dict.fromkeys(filter(None, metadata.get("decimals", "").split(","))),
+                    "scales": dict.fromkeys(filter(None, metadata.get("scale", "").split(","))),
+                    "max_frac_digits": field.type.scale if pa.types.is_decimal(field.type) else 0,
+                })
+        for batch in parquet_file.iter_batches(batch_size=EXISTING_OUTPUT_READ_ROWS):
+            df_existing = pd.DataFrame({
+                index: [to_string_value(value) for value in batch.column(index).to_pylist()]
+                for index in range(batch.num_columns)
+            })
+            df_existing.columns = columns
+            yield df_existing
+
+    def get_arrow_type(self, column_key):
+        """列の型を決める"""
+
+        import pyarrow as pa
+
+        info = self._column_info.get(column_key)
+        if info is None:
+            return pa.string()
+        xbrl_type = info["xbrl_type"]
+        if xbrl_type in INTEGER_XSD_TYPES:
+            return pa.int64()
+        if xbrl_type in DECIMAL_XSD_TYPES:
+            if info["max_frac_digits"] == 0:
+                return pa.int64()
+            return pa.decimal128(MAX_DECIMAL_PRECISION, info["max_frac_digits"])
+        if xbrl_type in FLOAT_XSD_TYPES:
+            return pa.float64()
+        if xbrl_type == "boolean":
+            return pa.bool_()
+        if xbrl_type == "date":
+            return pa.date32()
+        return pa.string()
+
+    def get_field_metadata(self, column_key):
+        """列のメタデータ（要素のQName・型・decimals・scale）"""
+
+        info = self._column_info.get(column_key)
+        if info is None:
+            return None
+        return {
+            "qname": ",".join(info["qnames"]),
+            "xbrl_type": info["xbrl_type"] or "",
+            "decimals": ",".join(info["decimals"]),
+            "scale": ",".join(info["scales"]),
+        }
+
+    def merge_parts(self, tmp_path, column_keys):
+        """部分ファイルを列ごとに型変換し、1つの Parquet にまとめる"""
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        fields = []
+        for name, occurrence in column_keys:
+            # 【備考】同じ列名の列は、pandas の読み込み時と同様に「.1」などを付けて区別する
+            field_name = name if occurrence == 0 else f"{name}.{occurrence}"
+            fields.append(pa.field(
+                field_name,
+                self.get_arrow_type((name, occurrence)),
+                metadata=self.get_field_metadata((name, occurrence))
+            ))
+        schema = pa.schema(fields)
+        with pq.ParquetWriter(tmp_path, schema) as parquet_writer:
+            for df_part in self.iter_parts(column_keys):
+                arrays = [
+                    pa.array([to_typed_value(value, field.type) for value in values],
+                             type=field.type)
+                    for field, (_, values) in zip(schema, df_part.items())
+                ]
+                parquet_writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def get_column_keys(columns):
+    """
+    列名の重複を区別するため、列ごとに (列名, 同じ列名の出現順) を返す
+    （DEIの提出者名とEDINETコードリストの提出者名など、同じ列名の列が存在し得る）
+    """
+
+    counts = {}
+    column_keys = []
+    for name in columns:
+        column_keys.append((name, counts.get(name, 0)))
+        counts[name] = counts.get(name, 0) + 1
+    return column_keys
+
+
+def to_typed_value(value, arrow_type):
+    """部分ファイルから読み込んだ値（文字列）を、列の型の値に変換する"""
+
+    import pyarrow as pa
+
+    # 空文字（nilのfactなど）・列が存在しない部分ファイルの値（NaN）は欠損値とする
+    if (not isinstance(value, str)) or (value == ""):
+        return None
+    if pa.types.is_string(arrow_type):
+        return value
+    try:
+        if pa.types.is_int64(arrow_type):
+            return int(Decimal(value))
+        if pa.types.is_decimal(arrow_type):
+            return Decimal(value)
+        if pa.types.is_float64(arrow_type):
+            return float(value)
+        if pa.types.is_boolean(arrow_type):
+            return value.lower() in ("true", "1")
+        if pa.types.is_date32(arrow_type):
+            return datetime.date.fromisoformat(value[:10])
+    except (InvalidOperation, ValueError):
+        print(f"値を変換できませんでした: {value}  型: {arrow_type}")
+        return None
+    return value
+
+
+def to_string_value(value):
+    """Parquet から読み込んだ値を、部分ファイルに書き出す文字列の表記に変換する"""
+
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,144 @@
+"""
+解析済みのXBRLファイルを記録し、追加・変更されたファイルのみ解析する（差分解析）
+
+【備考】
+- XBRLファイルごとに、docID・内容のハッシュ値・取得処理のバージョン・出力先を記録する
+- 次回以降の実行では、以下のいずれかに該当するファイルのみ解析する
+  - 記録がない（新規のファイル）
+  - 内容のハッシュ値が記録と異なる（変更されたファイル）
+  - 取得処理のバージョンが記録と異なる（取得処理のコードが変更された）
+- 取得処理のバージョンは、取得処理のモジュールのソースコードのハッシュ値とする
+  （各サンプルコードに共通のモジュールは EXTRACTOR_VERSION_MODULES で指定する）
+- DEIによる事前絞り込みで処理対象外となったファイルも、取得結果のないファイルとして記録する
+- 1行1レコードのJSON Lines形式で追記し、同じファイルは後のレコードを正とする
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import re
+from datetime import datetime
+
+from utils import open_xbrl_file
+
+# ファイルを読み込む際の、1回あたりのバイト数
+HASH_CHUNK_SIZE = 1024 * 1024
+# docID（書類管理番号）の形式
+DOCID_REGREX = r"S[0-9A-Z]{7}"
+# 取得結果に影響する、各サンプルコードに共通のモジュール（取得処理のバージョンに含める）
+EXTRACTOR_VERSION_MODULES = [
+    "xbrl_batch",
+    "dei_reader",
+    "filing_anomaly",
+    "edinetcd_info",
+    "fact_index",
+    "presentation_walker",
+    "label_resolver",
+    "output_writer",
+]
+
+
+def get_file_hash(xbrl_file):
+    """XBRLファイルの内容のハッシュ値（SHA-256）を取得する（zipファイル内のファイルにも対応）"""
+
+    sha256 = hashlib.sha256()
+    with open_xbrl_file(xbrl_file) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_docid(xbrl_file):
+    """
+    XBRLファイルのパスから docID を取得する（取得できない場合、None）
+    【備考】get_edinet_data.py で保存したzipファイル名・解凍先のディレクトリ名の末尾が docID
+    """
+
+    for name in reversed(re.split(r"[\\/]", xbrl_file)):
+        match = re.search(rf"_({DOCID_REGREX})(\.zip)?$", name)
+        if match:
+            return match.group(1)
+    return None
+
+
+def get_extractor_version(module_names, *options):
+    """
+    取得処理のバージョン（モジュールのソースコード・取得処理の設定のハッシュ値）を取得する
+    module_names: EXTRACTOR_VERSION_MODULES 以外の、取得結果に影響するモジュール名のリスト（取得処理のモジュールなど）
+    options: 取得結果に影響する設定（取得処理の指定など）
+    """
+
+    sha256 = hashlib.sha256()
+    for module_name in dict.fromkeys(list(module_names) + EXTRACTOR_VERSION_MODULES):
+        with open(importlib.import_module(module_name).__file__, "rb") as f:
+            sha256.update(f.read())
+    sha256.update(json.dumps(options, ensure_ascii=False).encode("utf-8"))
+    return sha256.hexdigest()[:16]
+
+
+class ParseManifest:
+    """
+    XBRLファイルごとの解析結果（docID、ハッシュ値、取得処理のバージョン、出力先、日時）を記録する
+    【備考】1行1レコードのJSON Lines形式で追記し、同じファイルは後のレコードを正とする
+    """
+
+    def __init__(self, manifest_path, extractor_version):
+        self.manifest_path = manifest_path
+        self.extractor_version = extractor_version
+        self._records = {}
+        # 解析対象としたファイルのハッシュ値（解析後の記録に使う）
+        self._file_hashes = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                for line in f:
+                    # 書き込み途中で中断された行は無視する
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["file"]] = record
+
+    def is_processed(self, xbrl_file, file_hash):
+        """同じ内容のファイルを、同じバージョンの取得処理で解析済みか判定する"""
+
+        record = self._records.get(xbrl_file)
+        if record is None:
+            return False
+        return (record["sha256"] == file_hash) \
+            and (record["extractor_version"] == self.extractor_version)
+
+    def get_unprocessed_files(self, xbrl_files):
+        """新規・変更されたファイル（または取得処理のバージョンが異なるファイル）を抽出する"""
+
+        unprocessed_files = []
+        for xbrl_file in xbrl_files:
+            file_hash = get_file_hash(xbrl_file)
+            if self.is_processed(xbrl_file, file_hash):
+                continue
+            self._file_hashes[xbrl_file] = file_hash
+            unprocessed_files.append(xbrl_file)
+        return unprocessed_files
+
+    def record(self, xbrl_files, outputs):
+        """
+        解析したファイルを追記する
+        outputs: 取得結果の出力先のリスト
+        """
+
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            for xbrl_file in xbrl_files:
+                file_hash = self._file_hashes.get(xbrl_file)
+                if file_hash is None:
+                    file_hash = get_file_hash(xbrl_file)
+                record = {
+                    "file": xbrl_file,
+                    "docID": get_docid(xbrl_file),
+                    "sha256": file_hash,
+                    "extractor_version": self.extractor_version,
+                    "outputs": outputs,
+                    "timestamp": timestamp
+                }
+                self._records[xbrl_file] = record
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
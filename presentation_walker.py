@@ -0,0 +1,166 @@
+"""
+表示リンクの親子関係（parentChild）をたどり、取得対象の要素の一覧（走査計画）を作成する
+
+【備考】
+- 階層ごとに fromModelObject を入れ子で呼び出す代わりに、スタックを使って任意の階層まで走査する
+  - 走査する階層の深さ（max_depth）と、各要素から取得対象を選ぶ規則（select）は呼び出し側が指定する
+- 走査計画は (出力キーに使う要素のQNameのタプル, 取得対象の要素のQName) の順序付きリスト
+  - QNameのみ保持するため、ModelXbrl を閉じた後も（同じ提出者の別の書類でも）再利用できる
+- 走査計画はプロセス内でキャッシュし、同じ提出者の同じ様式の書類（会計期間の異なる書類を含む）では再作成しない
+  - キャッシュのキーは (提出者別タクソノミの名前空間, リンクロール, 起点の要素, 階層の深さ, 計画の名前)
+  - 提出者別タクソノミの名前空間は、末尾の報告対象期間期末日・提出回数・提出日を除いたもの
+    （例: http://disclosure.edinet-fsa.go.jp/jpcrp030000/asr/001/E00001-000）
+  - 起点の要素のQNameはEDINETタクソノミのバージョン（名前空間の日付）を含むため、
+    タクソノミのバージョンが異なる書類では計画を作り直す
+  - 計画とともに、走査した要素ごとの子要素のQNameの並び（署名）を保持し、キャッシュした計画を使う前に
+    書類の表示リンクと照合する（提出者が期ごとに表示科目を追加・削除・並べ替えた場合は、計画を作り直す）
+    - 照合は走査した要素の fromModelObject のみ行い、選択規則の適用・計画の作成は省略する
+    - 照合するため、キャッシュの有無・ワーカープロセスへの書類の割り当て順によらず、計画は同じになる
+  - 提出者別タクソノミがない書類は、計画をキャッシュしない
+- 走査計画の取得時間は処理段階「traversal」として計測する（instrumentation.py 参照）
+"""
+
+import re
+from collections import OrderedDict
+
+from arelle import ModelDocument
+from instrumentation import count, phase
+from taxonomy_cache import EDINET_TAXONOMY_URL
+
+# プロセス内でキャッシュする走査計画の最大数（超えた場合、古いものから破棄する）
+PLAN_CACHE_MAX_SIZE = 256
+# 提出者別タクソノミの名前空間の末尾（/報告対象期間期末日/提出回数/提出日）
+FILER_NAMESPACE_PERIOD_REGREX = r"/\d{4}-\d{2}-\d{2}/\d{2,3}/\d{4}-\d{2}-\d{2}$"
+
+# 走査計画のキャッシュ（ワーカープロセスごとに保持される）
+_plan_cache = OrderedDict()
+
+
+def get_children(pc_rel_set, mcpt):
+    """表示リレーションシップの子要素を、表示順（order）のリストで返す"""
+
+    return [rel.toModelObject for rel in pc_rel_set.fromModelObject(mcpt)
+            if rel.toModelObject is not None]
+
+
+def walk(pc_rel_set, root_mcpt, max_depth):
+    """
+    起点の要素の子孫を、表示順に深さ優先で走査する（起点の要素自体は含まない）
+    戻り値: (階層, 祖先の要素のリスト（第一階層から親まで）, 要素, 子要素のリスト) のジェネレータ
+    【備考】階層は起点の要素の子を1とする。max_depth より深い階層は走査しない
+    """
+
+    stack = [(1, [], mcpt) for mcpt in reversed(get_children(pc_rel_set, root_mcpt))]
+    while stack:
+        depth, ancestors, mcpt = stack.pop()
+        children = get_children(pc_rel_set, mcpt)
+        yield depth, ancestors, mcpt, children
+        if depth >= max_depth:
+            continue
+        # 【備考】表示リンクが循環している場合に無限に走査しないよう、祖先の要素は走査しない
+        path = ancestors + [mcpt]
+        for child in reversed(children):
+            if (child is not root_mcpt) and all(child is not a for a in path):
+                stack.append((depth + 1, path, child))
+
+
+def last_child_of_abstract(mcpt, children):
+    """
+    選択規則用: タイトル項目（abstract == True）の場合、最後の子要素（合計金額を表す要素）を返す
+    タイトル項目でない場合、要素自体を返す。子が存在しないタイトル項目の場合、None
+    """
+
+    if not mcpt.isAbstract:
+        return mcpt
+    if not children:
+        # 【備考】：タイトル項目のfactに子が存在しないケースがあった。
+        # （表示リンク・定義リンク共に）該当項目を親とする関係が定義されておらず
+        # 該当項目と同階層に該当項目の内訳が定義されていた。
+        # 関係が正しく定義されていないため、該当項目のみ処理対象から除外する
+        print(f"{mcpt.qname.localName} に子が存在しない")
+        return None
+    return children[-1]
+
+
+def build_plan(pc_rel_set, root_mcpt, max_depth, select):
+    """
+    走査計画を作成する
+    select: (階層, 祖先の要素のリスト, 要素, 子要素のリスト) を受け取り、
+            (出力キーに使う要素のリスト, 取得対象の要素) のリストを返す関数
+    戻り値: (走査計画, 署名)
+            署名は走査した要素（起点の要素を含む）ごとの (要素のQName, 子要素のQNameのタプル) のタプル
+    """
+
+    plan = []
+    signature = [(root_mcpt.qname, tuple(m.qname for m in get_children(pc_rel_set, root_mcpt)))]
+    for depth, ancestors, mcpt, children in walk(pc_rel_set, root_mcpt, max_depth):
+        signature.append((mcpt.qname, tuple(m.qname for m in children)))
+        for key_mcpts, tgt_mcpt in select(depth, ancestors, mcpt, children):
+            plan.append((tuple(m.qname for m in key_mcpts), tgt_mcpt.qname))
+    return plan, tuple(signature)
+
+
+def matches_signature(pc_rel_set, signature):
+    """
+    書類の表示リンクが、走査計画の署名と一致するか判定する
+    【備考】走査した全ての要素の子要素（QName・表示順）が一致する場合、走査する要素・選択規則に渡す
+    子要素も一致するため、同じ計画が作成される（タイトル項目かどうかは、QNameの名前空間に含まれる
+    タクソノミのバージョンが同じであれば変わらない）
+    """
+
+    qname_concepts = pc_rel_set.modelXbrl.qnameConcepts
+    for mcpt_qname, child_qnames in signature:
+        mcpt = qname_concepts.get(mcpt_qname)
+        if mcpt is None:
+            return False
+        if tuple(m.qname for m in get_children(pc_rel_set, mcpt)) != child_qnames:
+            return False
+    return True
+
+
+def get_filer_schema_key(model_xbrl):
+    """
+    提出者別タクソノミのスキーマの名前空間から、報告対象期間期末日・提出回数・提出日を除いたものを取得する
+    （提出者別タクソノミがない場合、None）
+    """
+
+    for doc in model_xbrl.modelDocument.referencesDocument:
+        if (doc.type == ModelDocument.Type.SCHEMA) and doc.targetNamespace \
+                and (not doc.uri.startswith(EDINET_TAXONOMY_URL)):
+            return re.sub(FILER_NAMESPACE_PERIOD_REGREX, "", doc.targetNamespace)
+    return None
+
+
+def get_plan(pc_rel_set, root_mcpt, max_depth, select, plan_name):
+    """
+    走査計画を取得する（キャッシュにない場合、作成してキャッシュする）
+    plan_name: 選択規則の名前（同じ表示リンクでも、選択規則が異なる計画を区別する）
+    """
+
+    with phase("traversal"):
+        filer_schema_key = get_filer_schema_key(pc_rel_set.modelXbrl)
+        if filer_schema_key is None:
+            # 【備考】提出者を特定できないため、他の書類と計画を共有しない
+            count("plan_cache_misses")
+            plan, _ = build_plan(pc_rel_set, root_mcpt, max_depth, select)
+            return plan
+        key = (filer_schema_key, pc_rel_set.linkrole, root_mcpt.qname, max_depth, plan_name)
+        cached = _plan_cache.get(key)
+        # 【備考】提出者が表示リンクを変更した場合（署名が一致しない場合）は作り直す
+        if (cached is not None) and matches_signature(pc_rel_set, cached[1]):
+            count("plan_cache_hits")
+            _plan_cache.move_to_end(key)
+            return cached[0]
+        count("plan_cache_misses" if cached is None else "plan_cache_stale")
+        plan, signature = build_plan(pc_rel_set, root_mcpt, max_depth, select)
+        _plan_cache[key] = (plan, signature)
+        _plan_cache.move_to_end(key)
+        if len(_plan_cache) > PLAN_CACHE_MAX_SIZE:
+            _plan_cache.popitem(last=False)
+        return plan
+
+
+def clear_plan_cache():
+    """走査計画のキャッシュを破棄する"""
+
+    _plan_cache.clear()
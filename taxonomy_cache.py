@@ -0,0 +1,113 @@
+"""
+EDINETタクソノミをローカルから読み込むための設定（Webキャッシュ・タクソノミパッケージの設定のみ）
+
+【備考】
+- 提出書類ごとの読み込み（model_manager.load）では、提出者別タクソノミに加えて
+  EDINETタクソノミ（jppfs_cor, jpcrp_cor, jpdei_cor のスキーマ・リンクベース）も読み込まれる
+- EDINETタクソノミは提出書類間で共通のため、ネットワークから取得せずローカルのファイルを使う
+  - Arelle のWebキャッシュ（URLと同じディレクトリ構成）にEDINETタクソノミを配置する
+  - タクソノミパッケージがある場合、URLをパッケージ内のファイルに対応付ける
+- 【注意】このモジュールで短縮されるのは、EDINETタクソノミの取得（ネットワークアクセス）のみ
+  - Arelle は読み込み済みのタクソノミ（DTS）を ModelXbrl 間で共有できないため、
+    EDINETタクソノミのスキーマ・リンクベースの解析は、提出書類ごとに（ローカルのファイルから）行われる
+  - 解析自体を省く場合は、TAXONOMY_SKIP_LOADING で使わないリンクベースを読み込まない
+    （名称リンクを読み込まない場合、そのラベルは取得できない）
+- ワーカープロセス起動時に1度だけ上記の設定と、ローカルにEDINETタクソノミがあることの確認を行う
+  - 確認はファイルの存在のみで行い、ネットワークには接続しない（TAXONOMY_WORK_OFFLINE によらない）
+"""
+
+import glob
+import os
+import re
+import shutil
+
+from arelle import PackageManager
+
+# EDINETタクソノミのURL
+EDINET_TAXONOMY_URL = "http://disclosure.edinet-fsa.go.jp/taxonomy"
+# ArelleのWebキャッシュの保存先（Noneの場合、Arelleの既定の保存先）
+TAXONOMY_CACHE_DIR = None
+# Trueの場合、ネットワークに接続せず、Webキャッシュ・タクソノミパッケージのみ使用する
+TAXONOMY_WORK_OFFLINE = False
+# EDINETサイトからダウンロード・解凍したEDINETタクソノミのディレクトリ
+# （配下の taxonomy ディレクトリをWebキャッシュにコピーする。Noneの場合、コピーしない）
+EDINET_TAXONOMY_DIR = None
+# タクソノミパッケージ（zipファイル）のパスのリスト
+TAXONOMY_PACKAGE_FILES = []
+# 読み込まないファイルのURL（正規表現。Noneの場合、全て読み込む）
+# 【備考】名称リンク（*_lab.xml, *_lab-en.xml）を読み込まない場合、そのラベルは取得できない
+# （LABEL_LANG = "en" の場合や、label_resolver.select_label の英語へのフォールバックを含む）
+TAXONOMY_SKIP_LOADING = None
+# ワーカープロセス起動時に、ローカル（Webキャッシュ・タクソノミパッケージ）にあることを確認するスキーマ
+WARM_UP_SCHEMA_URLS = [
+    f"{EDINET_TAXONOMY_URL}/jpdei/2013-08-31/jpdei_cor_2013-08-31.xsd",
+]
+
+
+def install_edinet_taxonomy(taxonomy_dir, cache_dir):
+    """
+    解凍済みのEDINETタクソノミをWebキャッシュにコピーする
+    コピー済みのファイルはコピーしない
+    """
+
+    src_root = os.path.join(taxonomy_dir, "taxonomy")
+    if not os.path.isdir(src_root):
+        # taxonomy ディレクトリがさらに下の階層にある場合
+        src_roots = glob.glob(os.path.join(taxonomy_dir, "**", "taxonomy"), recursive=True)
+        if not src_roots:
+            print(f"EDINETタクソノミのディレクトリが見つかりません: {taxonomy_dir}")
+            return 0
+        src_root = src_roots[0]
+    dest_root = os.path.join(cache_dir, "http", "disclosure.edinet-fsa.go.jp", "taxonomy")
+    copied_num = 0
+    for src_dir, _, filenames in os.walk(src_root):
+        dest_dir = os.path.join(dest_root, os.path.relpath(src_dir, src_root))
+        for filename in filenames:
+            dest_path = os.path.join(dest_dir, filename)
+            if os.path.exists(dest_path):
+                continue
+            os.makedirs(dest_dir, exist_ok=True)
+            shutil.copy2(os.path.join(src_dir, filename), dest_path)
+            copied_num += 1
+    return copied_num
+
+
+def init_taxonomy_cache(model_manager):
+    """
+    EDINETタクソノミをローカルから読み込むよう、Arelle を設定する
+    ワーカープロセスごとに1度だけ呼び出す
+    """
+
+    ctrl = model_manager.cntlr
+    if TAXONOMY_CACHE_DIR is not None:
+        ctrl.webCache.cacheDir = TAXONOMY_CACHE_DIR
+    ctrl.webCache.workOffline = TAXONOMY_WORK_OFFLINE
+    if EDINET_TAXONOMY_DIR is not None:
+        install_edinet_taxonomy(EDINET_TAXONOMY_DIR, ctrl.webCache.cacheDir)
+    if TAXONOMY_PACKAGE_FILES:
+        PackageManager.init(ctrl, loadPackagesConfig=False)
+        for package_file in TAXONOMY_PACKAGE_FILES:
+            if PackageManager.addPackage(ctrl, package_file) is None:
+                print(f"タクソノミパッケージを読み込めませんでした: {package_file}")
+        PackageManager.rebuildRemappings(ctrl)
+    if TAXONOMY_SKIP_LOADING is not None:
+        model_manager.skipLoading = re.compile(TAXONOMY_SKIP_LOADING)
+    warm_up(model_manager)
+
+
+def warm_up(model_manager):
+    """
+    EDINETタクソノミがローカル（Webキャッシュ・タクソノミパッケージ）にあることを確認する
+    【備考】スキーマは読み込まず、ネットワークにも接続しない
+    """
+
+    web_cache = model_manager.cntlr.webCache
+    for schema_url in WARM_UP_SCHEMA_URLS:
+        if TAXONOMY_PACKAGE_FILES and PackageManager.isMappedUrl(schema_url):
+            continue
+        if os.path.exists(web_cache.urlToCacheFilepath(schema_url)):
+            continue
+        if TAXONOMY_WORK_OFFLINE:
+            print(f"EDINETタクソノミがローカルにないため、読み込みに失敗します: {schema_url}")
+        else:
+            print(f"EDINETタクソノミがローカルにないため、ネットワークから取得します: {schema_url}")
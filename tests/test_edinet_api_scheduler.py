@@ -0,0 +1,125 @@
+"""
+edinet_api_scheduler.py のテスト
+
+【備考】
+- ローカルのモックHTTPサーバーに実際にリクエストし、429 + Retry-After のバックオフと
+  同時実行数・レートの増減（AIMD）を確認する
+- 実行方法: python -m unittest discover -s tests
+"""
+
+import collections
+import http.server
+import threading
+import time
+import unittest
+
+from edinet_api_scheduler import ApiScheduler, RetryableError, create_session, raise_for_retryable_status
+
+# モックサーバーが返す Retry-After（秒）
+RETRY_AFTER_SEC = 1
+
+
+class MockEdinetHandler(http.server.BaseHTTPRequestHandler):
+    """
+    パスごとに応答を変えるモックサーバーのハンドラ
+    - /throttled-once: 1回目は 429（Retry-After 付き）、2回目以降は 200
+    - /throttled: 常に 429（Retry-After 付き）
+    - それ以外: 200
+    """
+
+    protocol_version = "HTTP/1.1"
+    hits = collections.Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.hits[self.path] += 1
+            hit_num = self.hits[self.path]
+        if (self.path == "/throttled") or (self.path == "/throttled-once" and hit_num == 1):
+            self.send_response(429)
+            self.send_header("Retry-After", str(RETRY_AFTER_SEC))
+            body = b"{}"
+        else:
+            self.send_response(200)
+            body = b'{"metadata": {"status": "200"}}'
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ApiSchedulerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MockEdinetHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.session = create_session(4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        MockEdinetHandler.hits.clear()
+
+    def get(self, path):
+        """モックサーバーにリクエストし、リトライ対象のステータスコードの場合は RetryableError を送出する"""
+
+        res = self.session.get(self.base_url + path)
+        raise_for_retryable_status(res)
+        return res.status_code
+
+    def test_retry_after_backoff(self):
+        """429 の場合、Retry-After の秒数以上待ってからリトライする"""
+
+        scheduler = ApiScheduler(max_workers=1, max_retries=3, backoff_base=0.01)
+        start = time.monotonic()
+        status_code = scheduler.call(lambda: self.get("/throttled-once"))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(MockEdinetHandler.hits["/throttled-once"], 2)
+        self.assertGreaterEqual(elapsed, RETRY_AFTER_SEC)
+
+    def test_retry_limit(self):
+        """リトライ回数の上限まで 429 が続いた場合、RetryableError を送出する"""
+
+        scheduler = ApiScheduler(max_workers=1, max_retries=0, backoff_base=0.01)
+        with self.assertRaises(RetryableError) as cm:
+            scheduler.call(lambda: self.get("/throttled"))
+
+        self.assertTrue(cm.exception.throttled)
+        self.assertEqual(cm.exception.retry_after, RETRY_AFTER_SEC)
+        self.assertEqual(MockEdinetHandler.hits["/throttled"], 1)
+
+    def test_aimd_shrink_and_grow(self):
+        """429 で同時実行数・レートを半減させ、成功が続くと上限まで戻す"""
+
+        scheduler = ApiScheduler(max_workers=4, requests_per_second=20, max_retries=0)
+        with self.assertRaises(RetryableError):
+            scheduler.call(lambda: self.get("/throttled"))
+        self.assertEqual(scheduler.concurrency.limit, 2.0)
+        self.assertEqual(scheduler.bucket.rate, 10.0)
+
+        # 成功時は 1/上限 ずつ増やす（上限2 → 2.5）
+        scheduler.call(lambda: self.get("/ok"))
+        self.assertEqual(scheduler.concurrency.limit, 2.5)
+        self.assertEqual(scheduler.bucket.rate, 12.0)
+
+        results, failures = scheduler.run(
+            [(0, index, lambda: self.get("/ok")) for index in range(20)])
+        self.assertEqual(len(results), 20)
+        self.assertEqual(failures, {})
+        self.assertEqual(scheduler.concurrency.limit, 4.0)
+        self.assertEqual(scheduler.bucket.rate, 20.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
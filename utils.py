@@ -2,37 +2,147 @@ import glob
 import os
 import re
 import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 
-def extract_files_from_zip(zip_dir, tgt_zfile_names=None, dest_dir_root=None, dest_dirname=None, unzip_members_regrep=None):
-    """zipファイルからファイルを抽出する"""
+def is_extracted(zf, tgt_members, dest_dir_path):
+    """解凍先に対象メンバーが全て存在し、サイズが一致するか判定する"""
+
+    for member in tgt_members:
+        info = zf.getinfo(member)
+        if info.is_dir():
+            continue
+        dest_path = os.path.join(dest_dir_path, *member.split("/"))
+        if (not os.path.isfile(dest_path)) or (os.path.getsize(dest_path) != info.file_size):
+            return False
+    return True
+
+
+def extract_zip(zip_file, dest_dir_path, member_pattern=None, skip_extracted=True):
+    """
+    1つのzipファイルを解凍し、結果を辞書で返す
+    status: extracted（解凍）, skipped（解凍済のためスキップ）, failed（失敗）
+    """
+
+    result = {
+        "zip_file": zip_file,
+        "dest_dir": dest_dir_path,
+        "status": None,
+        "members": 0,
+        "error": None
+    }
+    try:
+        with zipfile.ZipFile(zip_file) as zf:
+            if member_pattern is None:
+                tgt_members_names = zf.namelist()
+            else:
+                tgt_members_names = [
+                    filename for filename in zf.namelist() if member_pattern.search(filename)
+                ]
+            result["members"] = len(tgt_members_names)
+            if skip_extracted and is_extracted(zf, tgt_members_names, dest_dir_path):
+                result["status"] = "skipped"
+                return result
+            zf.extractall(
+                path=dest_dir_path,
+                members=tgt_members_names
+            )
+        result["status"] = "extracted"
+    except (zipfile.BadZipFile, OSError) as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    return result
+
+
+def extract_files_from_zip(zip_dir, tgt_zfile_names=None, dest_dir_root=None, dest_dirname=None,
+                           unzip_members_regrep=None, max_workers=None, skip_extracted=True):
+    """
+    zipファイルからファイルを抽出する
+    zipファイルごとの結果（extract_zip 参照）のリストを返す
+    """
 
     if tgt_zfile_names is None:
         zip_files = glob.glob(os.path.join(zip_dir, "*.zip"))
     else:
         zip_files = [os.path.join(zip_dir, fname) for fname in tgt_zfile_names]
-    zip_file_num = len(zip_files)
-    for index, zip_file in enumerate(zip_files):
+    if unzip_members_regrep is None:
+        member_pattern = None
+    else:
+        member_pattern = re.compile(unzip_members_regrep)
+    dest_dir_paths = []
+    for zip_file in zip_files:
         zfile_name = os.path.splitext(os.path.basename(zip_file))[0]
-        print(f"{zfile_name}: {index + 1} / {zip_file_num}")
         if dest_dirname is None:
             dest_last_dir = zfile_name
         else:
             dest_last_dir = dest_dirname
         if dest_dir_root is None:
-            dest_dir_path = os.path.join(zip_dir, dest_last_dir)
+            dest_dir_paths.append(os.path.join(zip_dir, dest_last_dir))
         else:
-            dest_dir_path = os.path.join(dest_dir_root, dest_last_dir)
+            dest_dir_paths.append(os.path.join(dest_dir_root, dest_last_dir))
+    # 【備考】解凍処理（zlib）や書き込みの間はGILが解放されるため、スレッドで並行実行する
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            extract_zip,
+            zip_files,
+            dest_dir_paths,
+            [member_pattern] * len(zip_files),
+            [skip_extracted] * len(zip_files)
+        )
+        return list(results)
+
+
+def print_extract_results(extract_results):
+    """zipファイルの解凍結果の件数と、失敗したzipファイルを表示する"""
+
+    status_counts = Counter(result["status"] for result in extract_results)
+    print(f"zipファイル解凍: {status_counts['extracted']}件"
+          f"　スキップ（解凍済）: {status_counts['skipped']}件"
+          f"　失敗: {status_counts['failed']}件")
+    for result in extract_results:
+        if result["status"] == "failed":
+            print(f"解凍失敗: {result['zip_file']} {result['error']}")
+
+
+def get_xbrl_files_in_zips(zip_dir, member_regrex, tgt_zfile_names=None):
+    """
+    zipファイルを解凍せずに、zip内のXBRLファイルのパスを取得する
+    パスは「zipファイルのパス + 区切り文字 + zip内のパス」の形式で、
+    Arelle の FileSource がzipファイル内のファイルとして読み込める
+    """
+
+    if tgt_zfile_names is None:
+        zip_files = glob.glob(os.path.join(zip_dir, "*.zip"))
+    else:
+        zip_files = [os.path.join(zip_dir, fname) for fname in tgt_zfile_names]
+    pattern = re.compile(member_regrex)
+    xbrl_files = []
+    for zip_file in zip_files:
         with zipfile.ZipFile(zip_file) as zf:
-            if unzip_members_regrep is None:
-                tgt_members_names = None
-            else:
-                tgt_members_names = []
-                for filename in zf.namelist():
-                    if re.findall(unzip_members_regrep, filename):
-                        tgt_members_names.append(filename)
-            zf.extractall(
-                path=dest_dir_path,
-                members=tgt_members_names
-            )
-            zf.close()
+            for member_name in zf.namelist():
+                if pattern.search(member_name):
+                    xbrl_files.append(zip_file + os.sep + member_name)
+    return xbrl_files
+
+
+@contextmanager
+def open_xbrl_file(xbrl_file):
+    """
+    XBRLファイルをバイナリモードで開く
+    get_xbrl_files_in_zips で取得したzipファイル内のXBRLファイルのパスにも対応する
+    """
+
+    # 【備考】Arelle はzipファイル内のXBRLファイルを扱う場合のみ必要なため、ここで読み込む
+    # （EDINETコードリストの取得・書類のダウンロードなど、このモジュールの他の関数は Arelle なしで使える）
+    from arelle.FileSource import archiveFilenameParts
+
+    archive_parts = archiveFilenameParts(xbrl_file)
+    if archive_parts is None:
+        with open(xbrl_file, "rb") as f:
+            yield f
+    else:
+        zip_file, member_name = archive_parts
+        with zipfile.ZipFile(zip_file) as zf, zf.open(member_name) as f:
+            yield f
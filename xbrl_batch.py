@@ -0,0 +1,386 @@
+"""
+複数のXBRLファイルを、複数プロセスで解析する
+
+【備考】
+- Arelle の読み込み・解析はCPU処理が大半のため、プロセスを分けて並列実行する
+- 各ワーカープロセスは自身の Cntlr / ModelManager を持つ
+- サイズの大きいファイルから順に割り当て、ワーカー間の処理量の偏りを抑える
+- ファイル単位の失敗は記録して処理を続行する
+  - 失敗の内容は、例外の種類・異常の種類（filing_anomaly.py 参照）・メッセージの辞書として返す
+- on_result を指定した場合、解析結果は完了したファイルから順に on_result に渡し、保持しない
+  （出力を逐次書き出し、全ファイル分の解析結果をメモリに溜めないため）
+- ファイルごとの処理段階の所要時間・件数を計測し、進捗と集計を表示する（instrumentation.py 参照）
+  - on_result の実行時間は、処理段階「write」として該当ファイルの計測値に加える
+- 読み込んだ ModelXbrl は、解析の成否・途中での return によらず必ず解放する
+  - 各取得処理は load_model で読み込み、with ブロックを抜ける際に解放する
+  - 解析後に解放されていない ModelXbrl が残っている場合も、run_task で解放する
+- WORKER_MEMORY_CEILING_MB を指定した場合、ワーカープロセスのメモリ使用量（RSS）が上限を超えた時点で
+  ワーカープロセスを再起動する（メモリ使用量の増加による強制終了を防ぐため）
+  - プロセス数が1の場合も、解析はワーカープロセスで行う
+  - 実行中のファイルの解析が完了してからプロセスプールを作り直し、残りのファイルを解析する
+  - ワーカープロセスが異常終了した場合（メモリ不足による強制終了など）、プロセスプールを作り直して処理を続行する
+    - 実行中だったファイル（異常終了の原因でないファイルを含む）は、1度だけ割り当て直す
+    - 割り当て直したファイルの実行中に再度異常終了した場合、解析失敗として記録する
+    - ファイルの割り当て時にプロセスプールが異常終了していた場合も、該当ファイルを割り当て直す
+- 各サンプルコードの main の共通処理（XBRLファイルの取得・隔離リスト・差分解析・事前絞り込み・
+  取得結果の書き出し・パネルデータへのマージ）は find_xbrl_files と run_extraction で行う
+  （各サンプルコードは自身の設定（定数）を引数に指定する）
+"""
+
+import glob
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from arelle import Cntlr, ModelManager
+from arelle.FileSource import archiveFilenameParts
+from company_panel import create_panel_writer
+from dei_reader import filter_xbrl_files
+from filing_anomaly import Quarantine, format_error, get_error_record
+from instrumentation import RunMetrics, count, finish_file, phase, sample_rss, start_file
+from parse_manifest import ParseManifest, get_extractor_version
+from taxonomy_cache import init_taxonomy_cache
+from utils import extract_files_from_zip, get_xbrl_files_in_zips, print_extract_results
+
+# ワーカープロセスのメモリ使用量（RSS、MB）の上限（Noneの場合、上限なし）
+WORKER_MEMORY_CEILING_MB = None
+# ワーカープロセスごとに、同時に割り当てるファイル数
+# （割り当て済みのファイルは、ワーカープロセスの再起動前に解析される）
+TASKS_IN_FLIGHT_PER_WORKER = 2
+
+# ワーカープロセスごとのモデルマネージャ（init_worker で作成）
+_model_manager = None
+
+
+def create_model_manager():
+    """
+    Arelle のコントローラ・モデルマネージャを作成する
+    EDINETタクソノミはローカルから読み込むよう設定する
+    """
+
+    ctrl = Cntlr.Cntlr()
+    model_manager = ModelManager.initialize(ctrl)
+    init_taxonomy_cache(model_manager)
+    return model_manager
+
+
+def init_worker():
+    """ワーカープロセスの初期化"""
+
+    global _model_manager
+    _model_manager = create_model_manager()
+
+
+def get_file_size(xbrl_file):
+    """XBRLファイルのサイズを取得する（zipファイル内のファイルにも対応）"""
+
+    archive_parts = archiveFilenameParts(xbrl_file)
+    if archive_parts is None:
+        return os.path.getsize(xbrl_file)
+    zip_file, member_name = archive_parts
+    with zipfile.ZipFile(zip_file) as zf:
+        return zf.getinfo(member_name).file_size
+
+
+@contextmanager
+def load_model(model_manager, xbrl_file):
+    """
+    XBRLファイルを読み込み、with ブロックを抜ける際に（例外・途中での return を含め）必ず解放する
+    """
+
+    with phase("load"):
+        model_xbrl = model_manager.load(xbrl_file)
+    sample_rss("loaded")
+    count("facts", len(model_xbrl.facts))
+    try:
+        yield model_xbrl
+    finally:
+        model_manager.close(model_xbrl)
+
+
+def release_models(model_manager):
+    """モデルマネージャに残っている（解放されていない） ModelXbrl を全て解放する"""
+
+    while model_manager.loadedModelXbrls:
+        count("released_models")
+        model_manager.close(model_manager.loadedModelXbrls[-1])
+
+
+def run_task(get_facts, model_manager, xbrl_file):
+    """
+    1ファイル分の解析を実行する
+    戻り値: (解析結果, エラー内容, 計測値)
+    """
+
+    start_file()
+    # 【備考】解析中の sys.exit() もファイル単位の失敗として扱い、他のファイルの処理を続行する
+    try:
+        result, error = get_facts(model_manager, xbrl_file), None
+    except (Exception, SystemExit) as e:
+        result, error = None, get_error_record(e)
+    finally:
+        release_models(model_manager)
+    return result, error, finish_file()
+
+
+def run_worker_task(get_facts, xbrl_file):
+    """ワーカープロセスで1ファイル分の解析を実行する"""
+
+    return run_task(get_facts, _model_manager, xbrl_file)
+
+
+def handle_result(results, failed_files, xbrl_files, index, result, error, metrics,
+                  on_result, run_metrics):
+    """1ファイル分の解析結果を、結果のリスト・on_result・失敗ファイルのリストに振り分ける"""
+
+    if error is not None:
+        print(f"解析失敗: {xbrl_files[index]} {format_error(error)}")
+        failed_files.append((xbrl_files[index], error))
+    elif on_result is not None:
+        start = time.perf_counter()
+        on_result(xbrl_files[index], result)
+        metrics["phases"]["write"] = time.perf_counter() - start
+    else:
+        results[index] = result
+    run_metrics.add_file(xbrl_files[index], metrics, error)
+
+
+def run_pool(get_facts, xbrl_files, order, max_workers, memory_ceiling_mb, handle):
+    """
+    プロセスプールで order の順にファイルを解析し、解析結果ごとに handle(index, 解析結果, エラー内容, 計測値) を呼び出す
+    ワーカープロセスのメモリ使用量が memory_ceiling_mb を超えた場合、プロセスプールを作り直す
+    """
+
+    pending = deque(order)
+    max_in_flight = max_workers * TASKS_IN_FLIGHT_PER_WORKER
+    # ワーカープロセスの異常終了により、割り当て直したファイル
+    requeued = set()
+    while pending:
+        recycle = False
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+            future_to_index = {}
+            while pending or future_to_index:
+                # 【備考】再起動が必要な場合、新たなファイルは割り当てず、実行中のファイルの完了を待つ
+                while pending and (not recycle) and (len(future_to_index) < max_in_flight):
+                    index = pending.popleft()
+                    try:
+                        future = executor.submit(run_worker_task, get_facts, xbrl_files[index])
+                    except BrokenProcessPool:
+                        # 【備考】解析結果の書き出し中などにワーカープロセスが異常終了していた場合
+                        pending.appendleft(index)
+                        recycle = True
+                        break
+                    future_to_index[future] = index
+                if not future_to_index:
+                    break
+                done, _ = wait(future_to_index, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = future_to_index.pop(future)
+                    try:
+                        result, error, metrics = future.result()
+                    except BrokenProcessPool as e:
+                        recycle = True
+                        # 【備考】異常終了の原因でないファイルも失敗するため、1度だけ割り当て直す
+                        if index not in requeued:
+                            requeued.add(index)
+                            pending.appendleft(index)
+                            continue
+                        result, error = None, get_error_record(e)
+                        metrics = {"duration_sec": 0.0, "phases": {}, "counters": {}, "rss_mb": {}, "pid": None}
+                    handle(index, result, error, metrics)
+                    rss_end = metrics["rss_mb"].get("end")
+                    if (memory_ceiling_mb is not None) and (rss_end is not None) \
+                            and (rss_end > memory_ceiling_mb):
+                        recycle = True
+        if recycle and pending:
+            print(f"ワーカープロセスのメモリ使用量が上限（{memory_ceiling_mb}MB）を超えたか、"
+                  "ワーカープロセスが異常終了したため、ワーカープロセスを再起動します。")
+
+
+def run_batch(get_facts, xbrl_files, max_workers=1, on_result=None, metrics_path=None):
+    """
+    XBRLファイルごとに get_facts(model_manager, xbrl_file) を実行する
+    max_workers が2以上の場合（または WORKER_MEMORY_CEILING_MB を指定した場合）、プロセスプールで実行する
+    on_result を指定した場合、解析に成功したファイルごとに on_result(xbrl_file, 解析結果) を呼び出す
+    metrics_path を指定した場合、ファイルごとの計測結果と集計を JSON Lines 形式で出力する
+    戻り値: (xbrl_files と同じ順序の解析結果のリスト, 解析に失敗したファイルとエラー内容（辞書）のリスト)
+    （on_result を指定した場合、解析結果のリストの要素は全て None）
+    """
+
+    file_num = len(xbrl_files)
+    results = [None] * file_num
+    failed_files = []
+    run_metrics = RunMetrics(file_num, metrics_path)
+    # サイズの大きいファイルから処理する
+    order = sorted(
+        range(file_num), key=lambda index: get_file_size(xbrl_files[index]), reverse=True)
+
+    def handle(index, result, error, metrics):
+        handle_result(
+            results, failed_files, xbrl_files, index, result, error, metrics,
+            on_result, run_metrics)
+
+    if (max_workers == 1) and (WORKER_MEMORY_CEILING_MB is None):
+        model_manager = create_model_manager()
+        for index in order:
+            handle(index, *run_task(get_facts, model_manager, xbrl_files[index]))
+        run_metrics.close()
+        return results, failed_files
+
+    run_pool(get_facts, xbrl_files, order, max_workers, WORKER_MEMORY_CEILING_MB, handle)
+    run_metrics.close()
+    return results, failed_files
+
+
+def find_xbrl_files(root_dir, xbrl_regrex, member_regrex, is_extracted=True, read_from_zip=False):
+    """
+    解析対象のXBRLファイルのパスを取得する
+    read_from_zip が True の場合、root_dir/zip 配下のzipファイル内のXBRLのパス（member_regrex に一致するもの）
+    read_from_zip が False の場合、root_dir 配下の xbrl_regrex に一致するパス
+    （is_extracted が False の場合、zipファイルを解凍してから取得する）
+    """
+
+    edinet_zip_dir = os.path.join(root_dir, "zip")
+    if read_from_zip:
+        # 【備考】Arelle の FileSource はzipファイル内のファイルを直接読み込めるため、
+        # 解凍せずにzip内のXBRLのパスを指定する
+        return get_xbrl_files_in_zips(edinet_zip_dir, member_regrex)
+    if not is_extracted:
+        # 【備考】解凍済のzipファイルはスキップされる
+        with phase("extract_zip"):
+            extract_results = extract_files_from_zip(
+                edinet_zip_dir,
+                dest_dir_root=root_dir,
+                unzip_members_regrep="|".join(
+                    [f"XBRL/PublicDoc/.*\\.{extension}" for extension in ["xbrl", "xsd", "xml"]]
+                )
+            )
+        print_extract_results(extract_results)
+    return glob.glob(os.path.join(root_dir, xbrl_regrex))
+
+
+def run_extraction(get_facts, xbrl_files, root_dir, output_files, output_format="csv",
+                   extractor_name=None, max_workers=1, metrics_file=None,
+                   quarantine_file=None, reprocess_quarantine=False,
+                   manifest_file=None, version_modules=(), version_options=(),
+                   prefilter=None, panel_extractors=None):
+    """
+    XBRLファイルごとに get_facts(model_manager, xbrl_file) を実行し、取得結果を取得処理ごとに書き出す
+    output_files: {取得処理名: (ライターを作成する関数, 出力ファイル名)}
+                  （ライターを作成する関数が None を返す取得処理は、取得時にファイルを出力する）
+    extractor_name: get_facts が1つの取得処理の取得結果を返す場合、その取得処理名
+                    （None の場合、get_facts は ({取得処理名: 取得結果}, {取得処理名: エラー内容}) を返す）
+    metrics_file: 処理段階の所要時間・件数の出力先（Noneの場合、表示のみ）
+    quarantine_file: 隔離リスト（Noneの場合、記録しない）
+    reprocess_quarantine: 隔離リストのファイルのみ解析し直し、既存の出力ファイルにマージするかどうか
+                          （True の場合、quarantine_file の指定が必要）
+    manifest_file: 解析済みのファイルの記録（Noneの場合、差分解析しない）
+    version_modules, version_options: 取得処理のバージョンに含めるモジュール名・設定
+                                      （共通のモジュール以外。get_extractor_version 参照）
+    prefilter: DEIによる事前絞り込みの (判定する関数, 判定に使う要素名のリスト)（Noneの場合、絞り込まない）
+               【備考】処理対象外となったファイルは取得結果のないファイルとして扱い、
+               既存の出力ファイルの行を削除し、解析済みのファイルとして記録する
+    panel_extractors: 企業ごとのパネルデータにマージする取得処理名のリスト（Noneの場合、マージしない）
+    【備考】ファイル名は全て root_dir 配下のファイル名
+    """
+
+    if reprocess_quarantine and (quarantine_file is None):
+        raise ValueError("隔離リストのファイルを解析し直す場合、quarantine_file を指定してください")
+    quarantine = None if quarantine_file is None else Quarantine(os.path.join(root_dir, quarantine_file))
+    if reprocess_quarantine:
+        # 隔離リストのファイル（前回までに解析・取得処理に失敗したファイル）のみ解析し直す
+        quarantined_files = set(quarantine.get_files())
+        xbrl_files = [xbrl_file for xbrl_file in xbrl_files if xbrl_file in quarantined_files]
+        if not xbrl_files:
+            print("隔離中のファイルはありませんでした。")
+            return
+    manifest = None
+    if manifest_file is not None:
+        # 前回の実行以降に追加・変更されたファイルのみ解析する
+        manifest = ParseManifest(
+            os.path.join(root_dir, manifest_file),
+            get_extractor_version(version_modules, *version_options)
+        )
+        xbrl_files = manifest.get_unprocessed_files(xbrl_files)
+        if not xbrl_files:
+            print("新規・変更されたファイルはありませんでした。")
+            return
+    # 事前絞り込みで処理対象外となったファイル
+    excluded_files = []
+    if prefilter is not None:
+        # 【備考】会計基準などで処理対象外となるファイルは、Arelle で読み込まない
+        is_target, localnames = prefilter
+        with phase("dei_prefilter"):
+            tgt_xbrl_files = filter_xbrl_files(xbrl_files, is_target, localnames)
+        tgt_xbrl_file_set = set(tgt_xbrl_files)
+        excluded_files = [xbrl_file for xbrl_file in xbrl_files if xbrl_file not in tgt_xbrl_file_set]
+        xbrl_files = tgt_xbrl_files
+    # 取得処理ごとのライターを作成
+    # 【備考】差分解析・隔離したファイルの再解析の場合、既存の出力ファイルの行のうち、今回解析したファイル以外の行を残す
+    writers = {}
+    for name, (create_writer, output_file_name) in output_files.items():
+        writer = create_writer(
+            os.path.join(root_dir, output_file_name), output_format,
+            merge_existing=(manifest is not None) or reprocess_quarantine)
+        if writer is not None:
+            writers[name] = writer
+    panel_writer = None if panel_extractors is None else create_panel_writer(root_dir)
+    # 【備考】事前絞り込みで処理対象外となったファイルは、取得結果のないファイルとして書き出す
+    # （差分解析・再解析の場合、前回までの実行で出力したこれらのファイルの行は残さない）
+    for xbrl_file in excluded_files:
+        for writer in writers.values():
+            writer.write(None, source=xbrl_file)
+    processed_files = list(excluded_files)
+    extractor_failures = []
+
+    def write_results(xbrl_file, result):
+        if extractor_name is None:
+            dict_results, dict_errors = result
+        else:
+            dict_results, dict_errors = {extractor_name: result}, {}
+        for name, writer in writers.items():
+            # 【備考】取得処理が失敗した場合、既存の出力ファイルの行を残す
+            if name in dict_results:
+                writer.write(dict_results[name], source=xbrl_file)
+        if panel_writer is not None:
+            # 【備考】取得処理が失敗した場合、既存のパネルデータを残す
+            for name in panel_extractors:
+                if name in dict_results:
+                    panel_writer.write(dict_results[name], xbrl_file, name)
+        # 【備考】一部の取得処理が失敗したファイルは記録せず、次回の実行で再度解析する
+        if not dict_errors:
+            processed_files.append(xbrl_file)
+        else:
+            # 隔離リストには最初に失敗した取得処理のエラー内容と、失敗した取得処理の一覧を記録する
+            extractor_failures.append((xbrl_file, {
+                **next(iter(dict_errors.values())),
+                "failed_extractors": list(dict_errors),
+            }))
+
+    # XBRLから情報取得
+    # 【備考】取得結果は解析の完了したファイルから順に、取得処理ごとに一定件数ごとに書き出す
+    _, failed_files = run_batch(
+        get_facts, xbrl_files, max_workers, on_result=write_results,
+        metrics_path=None if metrics_file is None else os.path.join(root_dir, metrics_file))
+    for name, writer in writers.items():
+        if writer.close():
+            print(f"出力: {writer.output_path}")
+        else:
+            print(f"処理対象のデータはありませんでした: {name}")
+    if panel_writer is not None:
+        panel_writer.close()
+    if manifest is not None:
+        # 【備考】解析に失敗したファイルは記録せず、次回の実行で再度解析する
+        manifest.record(processed_files, [writer.output_path for writer in writers.values()])
+    if quarantine is not None:
+        # 【備考】解析に失敗したファイルは隔離リストに記録し、再解析に成功したファイルは隔離を解除する
+        quarantine.record(failed_files + extractor_failures, processed_files)
+    print(f"{'-'*10} 情報抽出　完了 {'-'*10}")
+    if failed_files:
+        print(f"解析に失敗したファイルが{len(failed_files)}件あります。")
+    if extractor_failures:
+        print(f"一部の取得処理に失敗したファイルが{len(extractor_failures)}件あります。")
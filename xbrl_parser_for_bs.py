@@ -9,24 +9,54 @@ Arelleを使ったサンプルコード４
   - EDINETの仕様を利用した処理を含んでいる
 """
 
-import glob
-import os
-import sys
-
-import pandas as pd
-
-from arelle import Cntlr, ModelManager, XbrlConst
+from arelle import XbrlConst
 from arelle.ModelValue import qname
-from edinetcd_info import get_edinetcd_info
-from utils import extract_files_from_zip
+from fact_index import FactIndex
+from filing_anomaly import (
+    DeiFactDuplicatedError, DeiFactMissingError, UnexpectedDeiValueError)
+from instrumentation import phase
+from label_resolver import get_label, get_label_resolver
+from output_writer import create_chunked_writer, fact_value
+from presentation_walker import get_plan, last_child_of_abstract
+from xbrl_batch import find_xbrl_files, load_model, run_extraction
 
 # パス関連
 EDINET_ROOT_DIR = "D:\\EDINET\\120_yuho_test"
 EDINET_XBRL_REGREX = "*\\XBRL\\PublicDoc\\*.xbrl"
+# zipファイル内のXBRLファイルのパス（正規表現）
+EDINET_XBRL_MEMBER_REGREX = r"^XBRL/PublicDoc/[^/]+\.xbrl$"
 OUTPUT_FILE_NAME = "120_yuho_test_bs.csv"
+# 出力形式（"csv": cp932のCSV, "parquet": 型付きのParquet。pyarrowが必要）
+OUTPUT_FORMAT = "csv"
 
 # EDINETからダウンロードしたXBRLを含むzipファイルが解凍済かどうか
 IS_EXTRACTED = True
+# zipファイルを解凍せずに、zip内のXBRLを直接読み込むかどうか
+# （Trueの場合、IS_EXTRACTEDの値によらず解凍しない）
+READ_FROM_ZIP = False
+
+# 解析に使用するプロセス数（2以上の場合、プロセスプールで並列解析）
+PARSE_MAX_WORKERS = 1
+
+# Arelle で読み込む前に、DEIの値で処理対象のファイルを絞り込むかどうか（dei_reader.py 参照）
+DEI_PREFILTER = True
+
+# 前回の実行以降に追加・変更されたファイルのみ解析し、既存の出力ファイルにマージするかどうか
+INCREMENTAL = False
+# 解析済みのファイルの記録（EDINET_ROOT_DIR 配下に作成）
+PARSE_MANIFEST_FILE = "parse_manifest_bs.jsonl"
+
+# 解析に失敗したファイルとエラー内容を記録する隔離リスト（filing_anomaly.py 参照）
+QUARANTINE_FILE = "quarantine_bs.jsonl"
+# 隔離リストのファイルのみ解析し直し、既存の出力ファイルにマージするかどうか
+REPROCESS_QUARANTINE = False
+
+# 取得結果を企業ごとのパネルデータ（company_panel.py 参照）にマージするかどうか
+# （訂正報告書の取得結果は、訂正元の提出書類の取得結果を置き換える）
+UPDATE_PANEL = False
+
+# ファイルごとの処理段階の所要時間・件数の出力先（JSON Lines。Noneの場合、表示のみ）
+METRICS_FILE = "parse_metrics_bs.jsonl"
 
 # ----- 財務情報XBRLから取得する内容 -----
 # 会計基準を示す要素
@@ -52,54 +82,65 @@ DEI_COLS = [
     "FilerNameInJapaneseDEI",
     "CurrentFiscalYearStartDateDEI",
     TYPE_OF_PERIOD_ELM_NAME,
-    "CurrentPeriodEndDateDEI"
+    "CurrentPeriodEndDateDEI",
+    "AmendmentFlagDEI"
 ]
+# 事前絞り込みで読み込むDEI
+PREFILTER_DEI_COLS = [ACCOUNTING_STD_ELM_NAME]
 # 【備考】財務諸表本表の項目は企業ごとに項目が異なるため、
 # リンクベースに沿って情報を取得する
 
-# ----- EDINETコードリストから取得する列 -----
-EDINETCD_COL = "ＥＤＩＮＥＴコード"
-EDINETCDDLINFO_COLS = [
-    EDINETCD_COL,
-    "提出者業種",
-    "上場区分",
-    "提出者種別",
-    "提出者名"
-]
-
 # ----- アウトプットに列名指定で設定する列 -----
+EDINETCD_COL = "ＥＤＩＮＥＴコード"
 CONSOLIDATED_OR_NONCONSOLIDATED_COL = "連結/個別"
 
+# 貸借対照表のLineItemsから走査する階層の深さ（第三階層の勘定科目まで）
+BS_MAX_DEPTH = 3
+
 
-def get_tgt_fact(model_xbrl, is_consolidated, ns, qname_prefix, top_str_for_contextid, mcpt):
+def get_tgt_fact(fact_index, is_consolidated, mcpt):
     """指定したModelObjectのfact を取得"""
 
     # 【備考】1つの要素に対し、コンテキスト・ユニットの異なる複数のfactが存在し得る。
     # コンテキストIDについては、報告書インスタンス作成ガイドライン：5-4-5 コンテキストの設定例　参照
     # 【注意】有報では時点型／期間型どちらも当期を表す接頭辞はCurrentYearで同じだが
     # 四半期報告書は時点型はCurrentQuarter、期間型はCurrentQuarterとCurrentYTD(累積)がある。
+    # 当期を表す接頭辞の違いは、factの索引作成時に吸収している（fact_index.py 参照）
     # 貸借対照表は対象期末（対象期間終了日）時点の状態を表すので勘定科目は時点型(一応periodTypeを取得)
     # EDINET勘定科目リスト　参照
-    contextid = f"{top_str_for_contextid}{mcpt.periodType.capitalize()}"
-    if not is_consolidated:
-        contextid += "_NonConsolidatedMember"
-    facts = model_xbrl.factsByQname[qname(
-        ns, name=f"{qname_prefix}:{mcpt.qname.localName}")]
-    for fact in facts:
-        # 対象期の財務情報かつユニットが日本円のfactを取得する
-        if (fact.contextID == contextid) and (fact.unitID == "JPY"):
-            return fact.value
-    # TODO: プレフィックス対応
-    # 提出者が独自定義したタクソノミスキーマの要素はjppfs_corではないため
-    # 現状プログラムではfactを取得できない。
-    # 欲しい情報はとれているので、一旦ペンディング。
-    # 【備考】提出者別タクソノミ作成ガイドライン > 「要素の定義」参照
+    # 対象期の財務情報かつユニットが日本円のfactを取得する
+    # 【備考】要素のQNameで索引を引くため、提出者が独自定義した要素のfactも取得できる
+    fact = fact_index.get_current(mcpt, is_consolidated, unit_id="JPY")
+    if fact is not None:
+        return fact_value(fact)
     print("abstract==Falseの勘定科目のfactを取得できませんでした。")
-    print(f"{qname_prefix}:{mcpt.qname.localName}")
+    print(mcpt.qname)
     return None
 
 
-def get_bs_facts(model_xbrl, is_consolidated, type_of_period):
+def select_bs_items(depth, ancestors, mcpt, children):
+    """
+    貸借対照表の走査計画の選択規則
+    戻り値: (出力キーに使う要素のリスト, 取得対象の要素) のリスト
+    """
+
+    # 【備考】：第一・第二階層で abstract == False の場合、実データの項目。
+    #  列名は勘定科目名のみ
+    if depth < BS_MAX_DEPTH:
+        if mcpt.isAbstract:
+            return []
+        return [([mcpt], mcpt)]
+    # 【備考】：abstract == True の場合、タイトル項目なので金額情報なし。
+    # その表示子要素の内、合計金額を表す要素（一番最後の子）のfactを取得する
+    # 子が存在しないタイトル項目は、該当項目のみ除外する
+    tgt_mcpt = last_child_of_abstract(mcpt, children)
+    if tgt_mcpt is None:
+        return []
+    # 第三階層の列名は「第二階層の勘定科目名_第三階層の勘定科目名」
+    return [([ancestors[-1], tgt_mcpt], tgt_mcpt)]
+
+
+def get_bs_facts(model_xbrl, fact_index, is_consolidated, type_of_period):
     """XBRLデータから貸借対照表の第三階層の勘定科目の値を取得する"""
 
     qname_prefix = "jppfs_cor"
@@ -111,80 +152,54 @@ def get_bs_facts(model_xbrl, is_consolidated, type_of_period):
     # 年度（有価証券報告書）
     if type_of_period == "FY":
         top_str_for_linkrole = ""
-        top_str_for_contextid = "CurrentYear"
     # 中間期（半期報告書）
     elif type_of_period == "HY":
         top_str_for_linkrole = "SemiAnnual"
-        top_str_for_contextid = "Interim"
     # 四半期（四半期報告書）
     elif type_of_period in ["Q1", "Q2", "Q3", "Q4", "Q5"]:
         top_str_for_linkrole = "Quarterly"
-        top_str_for_contextid = "CurrentQuarter"
     else:
-        print("当会計期間の種類の項目の値が想定外です。確認してください。")
-        print("この文書の貸借対照表のデータは取得しません。")
-        return None
+        # 【備考】当会計期間の種類は全ての財務情報の取得に影響するため、ファイル単位の異常として扱う
+        raise UnexpectedDeiValueError(
+            f"当会計期間の種類の項目の値が想定外です。データ: {type_of_period}")
     # 表示の親子関係を表すリレーションシップを取得
     # linkrole=で対象のリンクロールに絞り込み
     if is_consolidated:
         link_role = f"http://disclosure.edinet-fsa.go.jp/role/jppfs/rol_{top_str_for_linkrole}ConsolidatedBalanceSheet"
     else:
         link_role = f"http://disclosure.edinet-fsa.go.jp/role/jppfs/rol_{top_str_for_linkrole}BalanceSheet"
-    pc_rel_set = model_xbrl.relationshipSet(
-        XbrlConst.parentChild,
-        linkrole=link_role
-    )
-    # 貸借対照表のLineItemsを親とする表示リレーションシップを抽出
-    # 抽出した表示リレーションシップの子が第一階層の勘定科目
+    with phase("traversal"):
+        pc_rel_set = model_xbrl.relationshipSet(
+            XbrlConst.parentChild,
+            linkrole=link_role
+        )
+    # 貸借対照表のLineItemsを起点に、第三階層までの勘定科目を走査する
+    # （走査計画は表示リンクが同じ書類間で再利用する。presentation_walker.py 参照）
     qname_from = qname(ns, name=f"{qname_prefix}:BalanceSheetLineItems")
-    rel_first_list = pc_rel_set.fromModelObject(
-        model_xbrl.qnameConcepts.get(qname_from))
+    mcpt_from = model_xbrl.qnameConcepts.get(qname_from)
     # 連結四半期財務諸表を提出する場合個別四半期財務諸表の提出は要しないとされているため
     # 四半期の場合の個別はないことが多い
-    if not rel_first_list:
+    if (mcpt_from is None) or (not pc_rel_set.fromModelObject(mcpt_from)):
         print("指定したアークロールの表示リレーションシップはありませんでした。")
         print(f"指定アークロール: {link_role}")
         return None
-    for rel_1st in rel_first_list:
-        mcpt_1st = rel_1st.toModelObject
-        # 【備考】：abstract == False の場合、実データの項目。
-        #  第二・第三階層の科目はないため、この時点でfact取得。
-        if not mcpt_1st.isAbstract:
-            dict_facts[f"{mcpt_1st.label()}"] = get_tgt_fact(
-                model_xbrl, is_consolidated, ns, qname_prefix, top_str_for_contextid, mcpt_1st)
-        # 第一階層の各勘定科目を親とする表示リレーションシップを抽出
-        # 抽出した表示リレーションシップの子が第二階層の勘定科目
-        rel_2nd_list = pc_rel_set.fromModelObject(mcpt_1st)
-        for rel_2nd in rel_2nd_list:
-            mcpt_2nd = rel_2nd.toModelObject
-            if not mcpt_2nd.isAbstract:
-                dict_facts[f"{mcpt_2nd.label()}"] = get_tgt_fact(
-                    model_xbrl, is_consolidated, ns, qname_prefix, top_str_for_contextid, mcpt_2nd)
-            # 第二階層の各勘定科目を親とする表示リレーションシップを抽出
-            # 抽出した表示リレーションシップの子が第三階層の勘定科目
-            rel_3rd_list = pc_rel_set.fromModelObject(mcpt_2nd)
-            for rel_3rd in rel_3rd_list:
-                mcpt_3rd = rel_3rd.toModelObject
-                # 【備考】：abstract == True の場合、タイトル項目なので金額情報なし。
-                # その表示子要素の内、合計金額を表す要素のfactを取得する
-                # 1. タイトル項目をfrom(親)とする表示リレーションシップを取得
-                # 2. 1のリレーションシップの内、一番最後のリレーションシップのto(子)のfactを取得する
-                if mcpt_3rd.isAbstract:
-                    pc_rels_from_tgt = pc_rel_set.fromModelObject(mcpt_3rd)
-                    # 【備考】：タイトル項目のfactに子が存在しないケースがあった。
-                    # （表示リンク・定義リンク共に）該当項目を親とする関係が定義されておらず
-                    # 該当項目と同階層に該当項目の内訳が定義されていた。
-                    # 関係が正しく定義されていないため、当スクリプトでは処理対象から除外する
-                    if not pc_rels_from_tgt:
-                        print(f"{mcpt_3rd.qname.localName} に子が存在しない")
-                        return None
-                    mcpt_3rd = pc_rels_from_tgt[-1].toModelObject
-                dict_facts[f"{mcpt_2nd.label()}_{mcpt_3rd.label()}"] = get_tgt_fact(
-                    model_xbrl, is_consolidated, ns, qname_prefix, top_str_for_contextid, mcpt_3rd)
+    plan = get_plan(pc_rel_set, mcpt_from, BS_MAX_DEPTH, select_bs_items, "bs")
+    label_resolver = get_label_resolver(model_xbrl)
+    with phase("fact_lookup"):
+        for key_qnames, tgt_qname in plan:
+            key = "_".join(label_resolver.label(q) for q in key_qnames)
+            dict_facts[key] = get_tgt_fact(
+                fact_index, is_consolidated, model_xbrl.qnameConcepts[tgt_qname])
 
     return dict_facts
 
 
+def is_target_dei(dei_values):
+    """DEIの値（要素名: 値）から、処理対象のファイルか判定する（事前絞り込み用）"""
+
+    return dei_values.get(ACCOUNTING_STD_ELM_NAME) == "Japan GAAP"
+
+
 def get_dei_facts(model_xbrl):
     """XBRLデータから会社・書類情報を取得する"""
 
@@ -200,18 +215,19 @@ def get_dei_facts(model_xbrl):
     for localname in DEI_COLS:
         facts = model_xbrl.factsByQname[qname(
             ns, name=f"{qname_prefix}:{localname}")]
-        if (not facts) or (len(facts) > 1):
-            print(f"【想定外】1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
-            sys.exit()
+        if not facts:
+            raise DeiFactMissingError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが存在しません。")
+        if len(facts) > 1:
+            raise DeiFactDuplicatedError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
         fact = list(facts)[0]
         if localname == ACCOUNTING_STD_ELM_NAME:
             if fact.value != "Japan GAAP":
                 print(f"会計基準: {fact.value}　処理対象外")
-                return None, None
+                return None, None, None
         if localname == EDINET_CD_ELM_NAME:
-            dict_facts[EDINETCD_COL] = fact.value
+            dict_facts[EDINETCD_COL] = fact_value(fact)
         else:
-            dict_facts[fact.concept.label()] = fact.value
+            dict_facts[get_label(model_xbrl, fact.qname)] = fact_value(fact)
         if localname == HAS_CONSOLIDATED_ELM_NAME:
             if fact.value == "true":
                 has_consolidated = True
@@ -228,13 +244,13 @@ def get_dei_facts(model_xbrl):
     return dict_facts, has_consolidated, type_of_period
 
 
-def get_facts(model_manager, xbrl_file):
-    """有価証券報告書から情報を取得する"""
+def extract_facts(model_xbrl):
+    """読み込み済みの有価証券報告書から情報を取得する"""
 
-    model_xbrl = model_manager.load(xbrl_file)
     # 会社・書類情報を取得
-    dict_facts_dei, has_consolidated, type_of_period = get_dei_facts(
-        model_xbrl)
+    with phase("dei"):
+        dict_facts_dei, has_consolidated, type_of_period = get_dei_facts(
+            model_xbrl)
     if dict_facts_dei is None:
         return None
     # 貸借対照表の情報を取得
@@ -242,53 +258,50 @@ def get_facts(model_manager, xbrl_file):
     list_is_consolidated = [False]
     if has_consolidated:
         list_is_consolidated.append(True)
+    # fact を (QName, コンテキストID, ユニットID) で参照できるよう索引を作成
+    with phase("fact_index"):
+        fact_index = FactIndex(model_xbrl, type_of_period)
     list_dict_facts = []
     for is_consolidated in list_is_consolidated:
         dict_facts_bs = get_bs_facts(
-            model_xbrl, is_consolidated, type_of_period)
+            model_xbrl, fact_index, is_consolidated, type_of_period)
         if dict_facts_bs is None:
             continue
         dict_facts_bs[CONSOLIDATED_OR_NONCONSOLIDATED_COL] \
             = "連結" if is_consolidated else "個別／非連結"
         list_dict_facts.append({**dict_facts_dei, **dict_facts_bs})
 
-    model_manager.close()
     return list_dict_facts
 
 
+def get_facts(model_manager, xbrl_file):
+    """有価証券報告書から情報を取得する"""
+
+    # 【備考】処理対象外・取得失敗の場合も、読み込んだデータは必ず解放する
+    with load_model(model_manager, xbrl_file) as model_xbrl:
+        return extract_facts(model_xbrl)
+
+
+def create_writer(output_path, output_format="csv", merge_existing=False):
+    """ファイルごとの取得結果を書き出すライターを作成する"""
+
+    return create_chunked_writer(output_path, output_format, merge_existing=merge_existing)
+
+
 def main():
-    if IS_EXTRACTED:
-        pass
-    else:
-        edinet_zip_dir = os.path.join(EDINET_ROOT_DIR, "zip")
-        extract_files_from_zip(
-            edinet_zip_dir,
-            dest_dir_root=EDINET_ROOT_DIR,
-            unzip_members_regrep="|".join(
-                [f"XBRL/PublicDoc/.*\.{extension}" for extension in ["xbrl", "xsd", "xml"]]
-            )
-        )
-    # XBRLから情報取得
-    xbrl_file_regrex = os.path.join(EDINET_ROOT_DIR, EDINET_XBRL_REGREX)
-    xbrl_files = glob.glob(xbrl_file_regrex)
-    list_dict_facts = []
-    ctrl = Cntlr.Cntlr()
-    model_manager = ModelManager.initialize(ctrl)
-    for index, xbrl_file in enumerate(xbrl_files):
-        print(xbrl_file, ":", index + 1, "/", len(xbrl_files))
-        list_dict_facts_per_file = get_facts(model_manager, xbrl_file)
-        if list_dict_facts_per_file is not None:
-            list_dict_facts = list_dict_facts + list_dict_facts_per_file
-    if list_dict_facts:
-        df_yuho = pd.DataFrame(list_dict_facts)
-        df_yuho.to_csv(
-            os.path.join(EDINET_ROOT_DIR, OUTPUT_FILE_NAME),
-            index=False,
-            encoding="cp932"
-        )
-        print(f"{'-'*10} 情報抽出　完了 {'-'*10}")
-    else:
-        print("処理対象のデータはありませんでした。")
+    xbrl_files = find_xbrl_files(
+        EDINET_ROOT_DIR, EDINET_XBRL_REGREX, EDINET_XBRL_MEMBER_REGREX, IS_EXTRACTED, READ_FROM_ZIP)
+    # XBRLから情報取得（隔離リスト・差分解析・事前絞り込み・書き出しは xbrl_batch.run_extraction 参照）
+    run_extraction(
+        get_facts, xbrl_files, EDINET_ROOT_DIR,
+        {"bs": (create_writer, OUTPUT_FILE_NAME)}, OUTPUT_FORMAT, extractor_name="bs",
+        max_workers=PARSE_MAX_WORKERS, metrics_file=METRICS_FILE,
+        quarantine_file=QUARANTINE_FILE, reprocess_quarantine=REPROCESS_QUARANTINE,
+        manifest_file=PARSE_MANIFEST_FILE if INCREMENTAL else None,
+        version_modules=[__name__],
+        prefilter=(is_target_dei, PREFILTER_DEI_COLS) if DEI_PREFILTER else None,
+        panel_extractors=["bs"] if UPDATE_PANEL else None
+    )
 
 
 if __name__ == "__main__":
@@ -9,28 +9,58 @@ Arelleを使ったサンプルコード１
 - このスクリプトについて
   - 会計基準 = 日本基準の書類のみ対象としている
   - EDINETの仕様を利用した処理を含んでいる
+- 子が存在しないタイトル項目（abstract == True）は、該当項目のみ除外し、他の勘定科目は取得する
+  （以前は子が存在しないタイトル項目があると、書類全体の損益計算書を取得しなかった）
 """
 
-import glob
-import os
-import re
-import sys
-import zipfile
-
-import pandas as pd
-
-from arelle import Cntlr, ModelManager, XbrlConst
+from arelle import XbrlConst
 from arelle.ModelValue import qname
-from edinetcd_info import get_edinetcd_info
-from utils import extract_files_from_zip
+from edinetcd_info import get_edinetcd_index, merge_edinetcd_info
+from fact_index import FactIndex
+from filing_anomaly import DeiFactDuplicatedError, DeiFactMissingError
+from instrumentation import phase
+from label_resolver import get_label
+from output_writer import create_chunked_writer, fact_value
+from presentation_walker import get_plan, last_child_of_abstract
+from xbrl_batch import find_xbrl_files, load_model, run_extraction
 
 # パス関連
 EDINET_ROOT_DIR = "D:\\EDINET\\120_yuho_test"
 EDINET_XBRL_REGREX = "*\\XBRL\\PublicDoc\\*.xbrl"
+# zipファイル内のXBRLファイルのパス（正規表現）
+EDINET_XBRL_MEMBER_REGREX = r"^XBRL/PublicDoc/[^/]+\.xbrl$"
 OUTPUT_FILE_NAME = "yuho.csv"
+# 出力形式（"csv": cp932のCSV, "parquet": 型付きのParquet。pyarrowが必要）
+OUTPUT_FORMAT = "csv"
 
 # EDINETからダウンロードしたXBRLを含むzipファイルが解凍済かどうか
 IS_EXTRACTED = True
+# zipファイルを解凍せずに、zip内のXBRLを直接読み込むかどうか
+# （Trueの場合、IS_EXTRACTEDの値によらず解凍しない）
+READ_FROM_ZIP = False
+
+# 解析に使用するプロセス数（2以上の場合、プロセスプールで並列解析）
+PARSE_MAX_WORKERS = 1
+
+# Arelle で読み込む前に、DEIの値で処理対象のファイルを絞り込むかどうか（dei_reader.py 参照）
+DEI_PREFILTER = True
+
+# 前回の実行以降に追加・変更されたファイルのみ解析し、既存の出力ファイルにマージするかどうか
+INCREMENTAL = False
+# 解析済みのファイルの記録（EDINET_ROOT_DIR 配下に作成）
+PARSE_MANIFEST_FILE = "parse_manifest_pl.jsonl"
+
+# 解析に失敗したファイルとエラー内容を記録する隔離リスト（filing_anomaly.py 参照）
+QUARANTINE_FILE = "quarantine_pl.jsonl"
+# 隔離リストのファイルのみ解析し直し、既存の出力ファイルにマージするかどうか
+REPROCESS_QUARANTINE = False
+
+# 取得結果を企業ごとのパネルデータ（company_panel.py 参照）にマージするかどうか
+# （訂正報告書の取得結果は、訂正元の提出書類の取得結果を置き換える）
+UPDATE_PANEL = False
+
+# ファイルごとの処理段階の所要時間・件数の出力先（JSON Lines。Noneの場合、表示のみ）
+METRICS_FILE = "parse_metrics_pl.jsonl"
 
 # ----- 財務情報XBRLから取得する内容 -----
 # 会計基準を示す要素
@@ -53,8 +83,11 @@ DEI_COLS = [
     "SecurityCodeDEI",
     "FilerNameInJapaneseDEI",
     "CurrentPeriodEndDateDEI",
-    "CurrentFiscalYearEndDateDEI"
+    "CurrentFiscalYearEndDateDEI",
+    "AmendmentFlagDEI"
 ]
+# 事前絞り込みで読み込むDEI
+PREFILTER_DEI_COLS = [ACCOUNTING_STD_ELM_NAME]
 # 【備考】財務諸表本表の項目は企業ごとに項目が異なるため、
 # リンクベースに沿って情報を取得する
 
@@ -72,7 +105,19 @@ EDINETCDDLINFO_COLS = [
 CONSOLIDATED_OR_NONCONSOLIDATED_COL = "連結/個別"
 
 
-def get_pl_facts(model_xbrl, is_consolidated):
+def select_pl_items(depth, ancestors, mcpt, children):
+    """
+    損益計算書の走査計画の選択規則（タイトル項目は最後の子要素を取得対象とする）
+    【備考】子が存在しないタイトル項目は、該当項目のみ除外する（書類全体は除外しない）
+    """
+
+    tgt_mcpt = last_child_of_abstract(mcpt, children)
+    if tgt_mcpt is None:
+        return []
+    return [([tgt_mcpt], tgt_mcpt)]
+
+
+def get_pl_facts(model_xbrl, fact_index, is_consolidated):
     """XBRLデータから損益計算書の第一階層の勘定科目の値を取得する"""
 
     # 【備考】ここでは表示リンクを使う
@@ -91,61 +136,53 @@ def get_pl_facts(model_xbrl, is_consolidated):
         link_role = "http://disclosure.edinet-fsa.go.jp/role/jppfs/rol_ConsolidatedStatementOfIncome"
     else:
         link_role = "http://disclosure.edinet-fsa.go.jp/role/jppfs/rol_StatementOfIncome"
-    pc_rel_set = model_xbrl.relationshipSet(
-        XbrlConst.parentChild,
-        linkrole=link_role
-    )
-    # 損益計算書のLineItemsを親とする表示リレーションシップを抽出
+    with phase("traversal"):
+        pc_rel_set = model_xbrl.relationshipSet(
+            XbrlConst.parentChild,
+            linkrole=link_role
+        )
+    # 損益計算書のLineItemsを親とする表示リレーションシップの子（第一階層の勘定科目）を走査する
+    # 【備考】：abstract == True の場合、タイトル項目なので金額情報なし。
+    # その表示子要素の内、合計金額を表す要素（一番最後の子）のfactを取得する
+    # 子が存在しないタイトル項目は、該当項目のみ除外する（presentation_walker.py 参照）
     qname_from = qname(ns, name=f"{qname_prefix}:StatementOfIncomeLineItems")
-    rel_from_tgt_list = pc_rel_set.fromModelObject(
-        model_xbrl.qnameConcepts.get(qname_from))
-
-    for rel_from_tgt in rel_from_tgt_list:
-        mcpt_to = rel_from_tgt.toModelObject
-
-        # 【備考】：abstract == True の場合、タイトル項目なので金額情報なし。
-        # その表示子要素の内、合計金額を表す要素のfactを取得する
-        # 1. タイトル項目をfrom(親)とする表示リレーションシップを取得
-        # 2. 1のリレーションシップの内、一番最後のリレーションシップのto(子)のfactを取得する
-        if mcpt_to.isAbstract:
-            pc_rels_from_tgt = pc_rel_set.fromModelObject(mcpt_to)
-            # 【備考】：タイトル項目のfactに子が存在しないケースがあった。
-            # （表示リンク・定義リンク共に）該当項目を親とする関係が定義されておらず
-            # 該当項目と同階層に該当項目の内訳が定義されていた。
-            # 関係が正しく定義されていないため、当スクリプトでは処理対象から除外する
-            if not pc_rels_from_tgt:
-                print(f"{mcpt_to.qname.localName} に子が存在しない")
-                return None
-            mcpt_to = pc_rels_from_tgt[-1].toModelObject
-
-        # fact を取得
-        # 【備考】1つの要素に対し、コンテキスト・ユニットの異なる複数のfactが存在し得る
-        # - 当期のコンテキストID
-        #   報告書インスタンス作成ガイドライン：5-4-5 コンテキストの設定例　参照
-        #   - 連結財務情報:
-        #     - 当期連結時点 = CurrentYearInstant
-        #     - 当期連結期間 = CurrentYearDuration
-        #   - 個別財務情報:
-        #     - 当期個別時点 = CurrentYearInstant_NonConsolidatedMember
-        #     - 当期個別期間 = CurrentYearDuration_NonConsolidatedMember
-        # 損益計算書は会計期間の損益を表すので勘定科目は期間型（Duration）
-        # ただし、前期繰越＊、当期末＊など時点型（Instant）の勘定科目も一部定義されている
-        # EDINET勘定科目リスト　参照
-        contextid = f"CurrentYear{mcpt_to.periodType.capitalize()}"
-        if is_consolidated == False:
-            contextid += "_NonConsolidatedMember"
-        localname = mcpt_to.qname.localName
-        facts = model_xbrl.factsByQname[qname(
-            ns, name=f"{qname_prefix}:{localname}")]
-        for fact in facts:
+    mcpt_from = model_xbrl.qnameConcepts.get(qname_from)
+    if mcpt_from is None:
+        return dict_facts
+    plan = get_plan(pc_rel_set, mcpt_from, 1, select_pl_items, "pl")
+
+    with phase("fact_lookup"):
+        for _, tgt_qname in plan:
+            mcpt_to = model_xbrl.qnameConcepts[tgt_qname]
+
+            # fact を取得
+            # 【備考】1つの要素に対し、コンテキスト・ユニットの異なる複数のfactが存在し得る
+            # - 当期のコンテキストID
+            #   報告書インスタンス作成ガイドライン：5-4-5 コンテキストの設定例　参照
+            #   - 連結財務情報:
+            #     - 当期連結時点 = CurrentYearInstant
+            #     - 当期連結期間 = CurrentYearDuration
+            #   - 個別財務情報:
+            #     - 当期個別時点 = CurrentYearInstant_NonConsolidatedMember
+            #     - 当期個別期間 = CurrentYearDuration_NonConsolidatedMember
+            # 損益計算書は会計期間の損益を表すので勘定科目は期間型（Duration）
+            # ただし、前期繰越＊、当期末＊など時点型（Instant）の勘定科目も一部定義されている
+            # EDINET勘定科目リスト　参照
+            # 【備考】当期を表す接頭辞（CurrentYear）は、factの索引では「Current」に正規化している
             # 当年度の財務情報かつユニットが日本円のfactを取得する
-            if (fact.contextID == contextid) and (fact.unitID == "JPY"):
-                dict_facts[mcpt_to.label()] = fact.value
-                break
+            fact = fact_index.get_current(mcpt_to, is_consolidated, unit_id="JPY")
+            if fact is not None:
+                dict_facts[get_label(model_xbrl, tgt_qname)] = fact_value(fact)
 
     return dict_facts
 
 
+def is_target_dei(dei_values):
+    """DEIの値（要素名: 値）から、処理対象のファイルか判定する（事前絞り込み用）"""
+
+    return dei_values.get(ACCOUNTING_STD_ELM_NAME) == "Japan GAAP"
+
+
 def get_dei_facts(model_xbrl):
     """XBRLデータから会社・書類情報を取得する"""
 
@@ -161,18 +198,19 @@ def get_dei_facts(model_xbrl):
     for localname in DEI_COLS:
         facts = model_xbrl.factsByQname[qname(
             ns, name=f"{qname_prefix}:{localname}")]
-        if (not facts) or (len(facts) > 1):
-            print(f"【想定外】1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
-            sys.exit()
+        if not facts:
+            raise DeiFactMissingError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが存在しません。")
+        if len(facts) > 1:
+            raise DeiFactDuplicatedError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
         fact = list(facts)[0]
         if localname == ACCOUNTING_STD_ELM_NAME:
             if fact.value != "Japan GAAP":
                 print(f"会計基準: {fact.value}　処理対象外")
                 return None, None
         if localname == EDINET_CD_ELM_NAME:
-            dict_facts[EDINETCD_COL] = fact.value
+            dict_facts[EDINETCD_COL] = fact_value(fact)
         else:
-            dict_facts[fact.concept.label()] = fact.value
+            dict_facts[get_label(model_xbrl, fact.qname)] = fact_value(fact)
         if localname == HAS_CONSOLIDATED_ELM_NAME:
             if fact.value == "true":
                 has_consolidated = True
@@ -187,12 +225,12 @@ def get_dei_facts(model_xbrl):
     return dict_facts, has_consolidated
 
 
-def get_facts(model_manager, xbrl_file):
-    """有価証券報告書から情報を取得する"""
+def extract_facts(model_xbrl):
+    """読み込み済みの有価証券報告書から情報を取得する"""
 
-    model_xbrl = model_manager.load(xbrl_file)
     # 会社・書類情報を取得
-    dict_facts_dei, has_consolidated = get_dei_facts(model_xbrl)
+    with phase("dei"):
+        dict_facts_dei, has_consolidated = get_dei_facts(model_xbrl)
     if dict_facts_dei is None:
         return None
     # 損益計算書の情報を取得
@@ -200,54 +238,56 @@ def get_facts(model_manager, xbrl_file):
     list_is_consolidated = [False]
     if has_consolidated:
         list_is_consolidated.append(True)
+    # fact を (QName, コンテキストID, ユニットID) で参照できるよう索引を作成
+    # 【備考】このスクリプトは有価証券報告書（年度）のみ対象としている
+    with phase("fact_index"):
+        fact_index = FactIndex(model_xbrl, "FY")
     list_dict_facts = []
     for is_consolidated in list_is_consolidated:
-        dict_facts_pl = get_pl_facts(model_xbrl, is_consolidated)
+        dict_facts_pl = get_pl_facts(model_xbrl, fact_index, is_consolidated)
         if dict_facts_pl is None:
             return None
         dict_facts_pl[CONSOLIDATED_OR_NONCONSOLIDATED_COL] = "連結" if is_consolidated else "個別／非連結"
         list_dict_facts.append({**dict_facts_dei, **dict_facts_pl})
 
-    model_manager.close()
     return list_dict_facts
 
 
+def get_facts(model_manager, xbrl_file):
+    """有価証券報告書から情報を取得する"""
+
+    # 【備考】処理対象外・取得失敗の場合も、読み込んだデータは必ず解放する
+    with load_model(model_manager, xbrl_file) as model_xbrl:
+        return extract_facts(model_xbrl)
+
+
+def create_writer(output_path, output_format="csv", merge_existing=False):
+    """ファイルごとの取得結果を書き出すライターを作成する"""
+
+    # 書き出す前に、Edinetコードリストの情報をマージ
+    edinetcd_index = get_edinetcd_index(EDINETCDDLINFO_COLS, EDINETCD_COL)
+    return create_chunked_writer(
+        output_path,
+        output_format,
+        merge_existing=merge_existing,
+        transform=lambda df_yuho: merge_edinetcd_info(df_yuho, edinetcd_index, EDINETCD_COL)
+    )
+
+
 def main():
-    if IS_EXTRACTED:
-        pass
-    else:
-        edinet_zip_dir = os.path.join(EDINET_ROOT_DIR, "zip")
-        extract_files_from_zip(
-            edinet_zip_dir,
-            dest_dir_root=EDINET_ROOT_DIR,
-            unzip_members_regrep="|".join(
-                [f"XBRL/PublicDoc/.*\.{extension}" for extension in ["xbrl", "xsd", "xml"]]
-            )
-        )
-    # XBRLから情報取得
-    xbrl_file_regrex = os.path.join(EDINET_ROOT_DIR, EDINET_XBRL_REGREX)
-    xbrl_files = glob.glob(xbrl_file_regrex)
-    list_dict_facts = []
-    ctrl = Cntlr.Cntlr()
-    model_manager = ModelManager.initialize(ctrl)
-    for index, xbrl_file in enumerate(xbrl_files):
-        print(xbrl_file, ":", index + 1, "/", len(xbrl_files))
-        list_dict_facts_per_file = get_facts(model_manager, xbrl_file)
-        if list_dict_facts_per_file is not None:
-            list_dict_facts = list_dict_facts + list_dict_facts_per_file
-    if list_dict_facts:
-        df_yuho = pd.DataFrame(list_dict_facts)
-        # Edinetコードリストの情報をマージ
-        df_edinetcd_info = get_edinetcd_info(EDINETCDDLINFO_COLS)
-        df_yuho = df_yuho.merge(df_edinetcd_info, on=EDINETCD_COL, how="left")
-        df_yuho.to_csv(
-            os.path.join(EDINET_ROOT_DIR, OUTPUT_FILE_NAME),
-            index=False,
-            encoding="cp932"
-        )
-        print(f"{'-'*10} 情報抽出　完了 {'-'*10}")
-    else:
-        print("処理対象のデータはありませんでした。")
+    xbrl_files = find_xbrl_files(
+        EDINET_ROOT_DIR, EDINET_XBRL_REGREX, EDINET_XBRL_MEMBER_REGREX, IS_EXTRACTED, READ_FROM_ZIP)
+    # XBRLから情報取得（隔離リスト・差分解析・事前絞り込み・書き出しは xbrl_batch.run_extraction 参照）
+    run_extraction(
+        get_facts, xbrl_files, EDINET_ROOT_DIR,
+        {"pl": (create_writer, OUTPUT_FILE_NAME)}, OUTPUT_FORMAT, extractor_name="pl",
+        max_workers=PARSE_MAX_WORKERS, metrics_file=METRICS_FILE,
+        quarantine_file=QUARANTINE_FILE, reprocess_quarantine=REPROCESS_QUARANTINE,
+        manifest_file=PARSE_MANIFEST_FILE if INCREMENTAL else None,
+        version_modules=[__name__],
+        prefilter=(is_target_dei, PREFILTER_DEI_COLS) if DEI_PREFILTER else None,
+        panel_extractors=["pl"] if UPDATE_PANEL else None
+    )
 
 
 if __name__ == "__main__":
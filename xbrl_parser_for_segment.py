@@ -10,31 +10,62 @@ Dimensionを利用し、セグメント情報を取得する
 - このスクリプトについて
   - 会計基準 = 日本基準の書類のみ対象としている
   - EDINETの仕様を利用した処理を含んでいる
+  - セグメント情報の表は、factごとに辞書を作成する代わりに、縦持ちの列
+    （DimensionメンバーのQName・会計期間・要素のQName・単位・値）を作成してから、pandas で横持ちに変換する
+    - 行はメンバーのQNameで区別する（ラベルが同じ異なるメンバーも別の行とする）
+    - メンバー・要素のラベル（メンバーの列の値・横持ちの列名）は、横持ちに変換する際に
+      異なるQNameごとに1度だけ取得する（label_resolver.py 参照）
+    - 会計期間・Dimensionメンバーはコンテキストごとに1度だけ取得する
+  - SEGMENT_AXES で複数のDimension（軸）を指定できる（軸ごとに列を作成する）
 """
 
-import glob
-import os
-import re
-import sys
-import zipfile
-
+import numpy as np
 import pandas as pd
 
-from arelle import Cntlr, ModelManager, XbrlConst
 from arelle.ModelValue import qname
-from edinetcd_info import get_edinetcd_info
-from utils import extract_files_from_zip
+from edinetcd_info import get_edinetcd_index, merge_edinetcd_info
+from filing_anomaly import DeiFactDuplicatedError, DeiFactMissingError
+from instrumentation import count, phase
+from label_resolver import get_label, get_label_resolver
+from output_writer import create_chunked_writer, fact_value
+from xbrl_batch import find_xbrl_files, load_model, run_extraction
 
 # パス関連
 EDINET_ROOT_DIR = "D:\\EDINET\\140_qr_test"
 EDINET_XBRL_REGREX = "*\\XBRL\\PublicDoc\\*.xbrl"
+# zipファイル内のXBRLファイルのパス（正規表現）
+EDINET_XBRL_MEMBER_REGREX = r"^XBRL/PublicDoc/[^/]+\.xbrl$"
 OUTPUT_FILE_NAME = "qr_segment_info.csv"
+# 出力形式（"csv": cp932のCSV, "parquet": 型付きのParquet。pyarrowが必要）
+OUTPUT_FORMAT = "csv"
 
 # 様式指定
 TGT_DOC_TYPE = "第四号の三様式"
 
 # EDINETからダウンロードしたXBRLを含むzipファイルが解凍済かどうか
 IS_EXTRACTED = True
+# zipファイルを解凍せずに、zip内のXBRLを直接読み込むかどうか
+# （Trueの場合、IS_EXTRACTEDの値によらず解凍しない）
+READ_FROM_ZIP = False
+
+# 解析に使用するプロセス数（2以上の場合、プロセスプールで並列解析）
+PARSE_MAX_WORKERS = 1
+
+# Arelle で読み込む前に、DEIの値で処理対象のファイルを絞り込むかどうか（dei_reader.py 参照）
+DEI_PREFILTER = True
+
+# 前回の実行以降に追加・変更されたファイルのみ解析し、既存の出力ファイルにマージするかどうか
+INCREMENTAL = False
+# 解析済みのファイルの記録（EDINET_ROOT_DIR 配下に作成）
+PARSE_MANIFEST_FILE = "parse_manifest_segment.jsonl"
+
+# 解析に失敗したファイルとエラー内容を記録する隔離リスト（filing_anomaly.py 参照）
+QUARANTINE_FILE = "quarantine_segment.jsonl"
+# 隔離リストのファイルのみ解析し直し、既存の出力ファイルにマージするかどうか
+REPROCESS_QUARANTINE = False
+
+# ファイルごとの処理段階の所要時間・件数の出力先（JSON Lines。Noneの場合、表示のみ）
+METRICS_FILE = "parse_metrics_segment.jsonl"
 
 # ----- 財務情報XBRLから取得する内容 -----
 # 会計基準を示す要素
@@ -62,6 +93,16 @@ DEI_COLS = [
     "CurrentPeriodEndDateDEI",
     "CurrentFiscalYearEndDateDEI"
 ]
+# セグメント情報の取得対象のDimension（軸）: 出力する列名
+# 【備考】いずれかの軸が設定されているfactを取得し、軸ごとのメンバーと会計期間の組み合わせを1行とする
+# （factに設定されていない軸の列は空欄）
+SEGMENT_AXES = {
+    "jpcrp_cor:OperatingSegmentsAxis": "セグメント",
+}
+# 取得対象の単位（日本円のfactのみ取得する）
+SEGMENT_UNIT_ID = "JPY"
+# 事前絞り込みで読み込むDEI
+PREFILTER_DEI_COLS = [ACCOUNTING_STD_ELM_NAME, DOC_TYPE_ELM_NAME]
 # 【備考】財務諸表本表の勘定科目は企業ごとに異なるため、
 # リンクベースに沿って情報を取得する
 
@@ -76,54 +117,132 @@ EDINETCDDLINFO_COLS = [
 ]
 
 
-def get_segments_facts(model_xbrl):
-    """XBRLデータからセグメント情報を取得する"""
+def get_axis_qnames(model_xbrl):
+    """SEGMENT_AXES の軸のQNameを取得する（名前空間が存在しない軸は除く）"""
+
+    axis_qnames = {}
+    for prefixed_name, col_name in SEGMENT_AXES.items():
+        prefix = prefixed_name.split(":")[0]
+        if prefix in model_xbrl.prefixedNamespaces:
+            axis_qnames[qname(model_xbrl.prefixedNamespaces[prefix], name=prefixed_name)] = col_name
+    return axis_qnames
 
-    qname_prefix = "jpcrp_cor"
-    ns = model_xbrl.prefixedNamespaces[qname_prefix]
-    dict_facts = {}
+
+def collect_segment_columns(model_xbrl, axis_qnames):
+    """
+    軸が設定されているfactを、縦持ちの列（リスト）として取得する
+    戻り値: {列名: 値のリスト}
+            （軸ごとのメンバーのQName・"会計期間"・"qname": 要素のQName・"unit": 単位・"value": 値）
+    """
 
     # 【備考】factsByDimMemQnameメソッドで、
     # 指定したDimensionが設定されているfactを取得できる。
     # ここではセグメントを示すDimensionを指定する。
-    tgt_dimension = qname(
-        model_xbrl.prefixedNamespaces[qname_prefix],
-        name=f"{qname_prefix}:OperatingSegmentsAxis"
-    )
-    facts_by_dim = model_xbrl.factsByDimMemQname(tgt_dimension)
-    if not facts_by_dim:
-        print("セグメントなし")
+    facts = set()
+    for axis_qname in axis_qnames:
+        facts.update(model_xbrl.factsByDimMemQname(axis_qname))
+    # 【備考】出力の行・列の順序が実行ごとに変わらないよう、インスタンス内の出現順に処理する
+    facts = sorted(facts, key=lambda fact: fact.objectIndex)
+
+    member_cols = list(axis_qnames.values())
+    columns = {col_name: [] for col_name in member_cols + ["会計期間", "qname", "unit", "value"]}
+    # コンテキストごとの (軸ごとのメンバーのQName, 会計期間)
+    context_keys = {}
+    for fact in facts:
+        context = fact.context
+        key = context_keys.get(context.id)
+        if key is None:
+            # 【備考】DimensionメンバーのQName取得方法
+            # 1. context.dimValue(axis_qname)
+            #    - コンテキストに設定されている、指定した軸の値
+            #      （ModelDimensionValueクラスのインスタンス）を取得
+            #      セグメントを示す軸の場合、例えば
+            #     「商業施設部門」「チェーンストア部門」などセグメントの種類を示す。
+            # 2. .memberQname
+            #    - メンバーの要素のQName（ラベルは build_segment_table で取得する）
+            members = [
+                getattr(context.dimValue(axis_qname), "memberQname", None) for axis_qname in axis_qnames
+            ]
+            key = (members, context.period.stringValue)
+            context_keys[context.id] = key
+        members, period = key
+        for col_name, member in zip(member_cols, members):
+            columns[col_name].append(member)
+        columns["会計期間"].append(period)
+        columns["qname"].append(fact.qname)
+        columns["unit"].append(fact.unitID)
+        columns["value"].append(fact_value(fact))
+    return columns
+
+
+def build_segment_table(model_xbrl, axis_qnames, columns):
+    """
+    縦持ちの列から、軸ごとのメンバー（QName）・会計期間ごとに1行、要素のラベルごとに1列の表を作成する
+    （メンバーの列には、メンバーのラベルを出力する）
+    【備考】同じ行・同じラベルのfactが複数ある場合（異なる要素で同じラベルの場合を含む）、後のfactの値とする
+    """
+
+    # 【備考】factの値（FactValue）を文字列型に変換せずに保持するため、object型で作成する
+    df_long = pd.DataFrame({
+        **{col_name: values for col_name, values in columns.items() if col_name != "value"},
+        "value": pd.Series(columns["value"], dtype=object),
+    })
+    # 日本円のfactのみ取得する
+    df_long = df_long[df_long["unit"] == SEGMENT_UNIT_ID]
+    if df_long.empty:
         return None
-    for fact in facts_by_dim:
-        # セグメント情報のDimensionメンバーごと・会計期間毎に1行としてデータを作成する
-        # 【備考】Dimensionメンバーのラベル取得方法
-        # 1. fact.context.dimValue(tgt_dimension) 
-        #    - factに設定されているセグメントを示すDimensionの値
-        #      （ModelDimensionValueクラスのインスタンス）を取得
-        #      ここではセグメントのDimensionを扱っているので、例えば
-        #     「商業施設部門」「チェーンストア部門」などセグメントの種類を示す。
-        # 2. .member
-        #    - ModelDimensionValueクラスのインスタンスの属性の１つで
-        #      ModelConceptクラスのインスタンス
-        # 3. .label()
-        #    - 2に設定されているラベルを取得
-        dim_mem_label = fact.context.dimValue(tgt_dimension).member.label()
-        # 日本円のfactのみ取得する
-        if fact.unitID == "JPY":
-            fact_label = fact.concept.label()
-            period = fact.context.period.stringValue
-            if not dim_mem_label in dict_facts.keys():
-                dict_facts[dim_mem_label] = {}
-            if not period in dict_facts[dim_mem_label]:
-                dict_facts[dim_mem_label][period] = {"セグメント": dim_mem_label, "会計期間": period}
-            dict_facts[dim_mem_label][period][fact_label] = fact.value
-    list_facts = [val_per_enddt for val_per_dim in dict_facts.values() for val_per_enddt in val_per_dim.values()]
-    df_facts = pd.DataFrame(list_facts)
-    df_facts.sort_values(by="会計期間", inplace=True)
+
+    # 行（軸ごとのメンバーのQName・会計期間）と列（ラベル）の番号を求め、2次元配列に値を配置する
+    # 【備考】メンバーが空欄（factに設定されていない軸）の行も残すため、dropna=False とする
+    member_cols = list(axis_qnames.values())
+    row_keys = member_cols + ["会計期間"]
+    row_codes = df_long.groupby(row_keys, sort=False, dropna=False).ngroup().to_numpy()
+    # 【備考】ラベルは異なるQNameごとに1度だけ取得し、QNameの番号からラベルの番号を求める
+    qname_codes, tgt_qnames = pd.factorize(df_long["qname"])
+    label_resolver = get_label_resolver(model_xbrl)
+    label_codes, col_labels = pd.factorize(
+        pd.Series([label_resolver.label(tgt_qname) for tgt_qname in tgt_qnames], dtype=object))
+    col_codes = label_codes[qname_codes]
+    # 【備考】NumPy の配列への代入は、同じ位置に複数の値を代入した場合にどの値が残るか保証されないため、
+    # 同じ行・同じラベルのfactは、事前に後のfactのみ残す
+    is_last = ~pd.DataFrame({"row": row_codes, "label_code": col_codes}).duplicated(keep="last").to_numpy()
+    values = np.full((row_codes.max() + 1, len(col_labels)), np.nan, dtype=object)
+    values[row_codes[is_last], col_codes[is_last]] = df_long["value"].to_numpy()[is_last]
+    _, first_positions = np.unique(row_codes, return_index=True)
+    df_rows = df_long[row_keys].iloc[first_positions].reset_index(drop=True)
+    # メンバーのQNameをラベルに置き換える
+    for col_name in member_cols:
+        member_labels = {
+            member_qname: label_resolver.label(member_qname)
+            for member_qname in df_rows[col_name].dropna().unique()
+        }
+        df_rows[col_name] = df_rows[col_name].map(member_labels)
+    df_facts = pd.concat([df_rows, pd.DataFrame(values, columns=col_labels, dtype=object)], axis=1)
+    df_facts.sort_values(by="会計期間", kind="stable", inplace=True)
 
     return df_facts
 
 
+def get_segments_facts(model_xbrl):
+    """XBRLデータからセグメント情報を取得する"""
+
+    axis_qnames = get_axis_qnames(model_xbrl)
+    with phase("fact_lookup"):
+        columns = collect_segment_columns(model_xbrl, axis_qnames)
+    count("segment_facts", len(columns["qname"]))
+    if not columns["qname"]:
+        print("セグメントなし")
+        return None
+    return build_segment_table(model_xbrl, axis_qnames, columns)
+
+
+def is_target_dei(dei_values):
+    """DEIの値（要素名: 値）から、処理対象のファイルか判定する（事前絞り込み用）"""
+
+    return (dei_values.get(ACCOUNTING_STD_ELM_NAME) == "Japan GAAP") \
+        and (dei_values.get(DOC_TYPE_ELM_NAME) == TGT_DOC_TYPE)
+
+
 def get_dei_facts(model_xbrl):
     """XBRLデータから会社・書類情報を取得する"""
 
@@ -139,9 +258,10 @@ def get_dei_facts(model_xbrl):
     for localname in DEI_COLS:
         facts = model_xbrl.factsByQname[qname(
             ns, name=f"{qname_prefix}:{localname}")]
-        if (not facts) or (len(facts) > 1):
-            print(f"【想定外】1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
-            sys.exit()
+        if not facts:
+            raise DeiFactMissingError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが存在しません。")
+        if len(facts) > 1:
+            raise DeiFactDuplicatedError(f"1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
         fact = list(facts)[0]
         if localname == ACCOUNTING_STD_ELM_NAME:
             if fact.value != "Japan GAAP":
@@ -152,20 +272,19 @@ def get_dei_facts(model_xbrl):
                 print(f"提出書類の様式: {fact.value}　処理対象外")
                 return None
         if localname == EDINET_CD_ELM_NAME:
-            dict_facts[EDINETCD_COL] = fact.value
+            dict_facts[EDINETCD_COL] = fact_value(fact)
         else:
-            dict_facts[fact.concept.label()] = fact.value
-
-    return pd.DataFrame([dict_facts])
+            dict_facts[get_label(model_xbrl, fact.qname)] = fact_value(fact)
 
+    return pd.DataFrame([dict_facts], dtype=object)
 
-def get_facts(model_manager, xbrl_file):
-    """XBRL形式のデータから情報を取得する"""
 
-    model_xbrl = model_manager.load(xbrl_file)
+def extract_facts(model_xbrl):
+    """読み込み済みのXBRL形式のデータから情報を取得する"""
 
     # 会社・書類情報を取得
-    df_facts_dei = get_dei_facts(model_xbrl)
+    with phase("dei"):
+        df_facts_dei = get_dei_facts(model_xbrl)
     if df_facts_dei is None:
         return None
 
@@ -179,47 +298,44 @@ def get_facts(model_manager, xbrl_file):
     df_facts_dei.loc[:, "key"] = 1
     df_facts = df_facts_dei.merge(df_facts_segment, on="key", how="left").drop(columns=["key"])
 
-    model_manager.close()
     return df_facts
 
 
+def get_facts(model_manager, xbrl_file):
+    """XBRL形式のデータから情報を取得する"""
+
+    # 【備考】処理対象外・取得失敗の場合も、読み込んだデータは必ず解放する
+    with load_model(model_manager, xbrl_file) as model_xbrl:
+        return extract_facts(model_xbrl)
+
+
+def create_writer(output_path, output_format="csv", merge_existing=False):
+    """ファイルごとの取得結果を書き出すライターを作成する"""
+
+    # 書き出す前に、Edinetコードリストの情報をマージ
+    edinetcd_index = get_edinetcd_index(EDINETCDDLINFO_COLS, EDINETCD_COL)
+    return create_chunked_writer(
+        output_path,
+        output_format,
+        merge_existing=merge_existing,
+        transform=lambda df_xbrl: merge_edinetcd_info(
+            df_xbrl, edinetcd_index, EDINETCD_COL, prepend=True)
+    )
+
+
 def main():
-    if IS_EXTRACTED:
-        pass
-    else:
-        edinet_zip_dir = os.path.join(EDINET_ROOT_DIR, "zip")
-        extract_files_from_zip(
-            edinet_zip_dir,
-            dest_dir_root=EDINET_ROOT_DIR,
-            unzip_members_regrep="|".join(
-                [f"XBRL/PublicDoc/.*\.{extension}" for extension in ["xbrl", "xsd", "xml"]]
-            )
-        )
-    
-    # XBRLから情報取得
-    xbrl_file_regrex = os.path.join(EDINET_ROOT_DIR, EDINET_XBRL_REGREX)
-    xbrl_files = glob.glob(xbrl_file_regrex)
-    list_df_facts = []
-    ctrl = Cntlr.Cntlr()
-    model_manager = ModelManager.initialize(ctrl)
-    for index, xbrl_file in enumerate(xbrl_files):
-        print(xbrl_file, ":", index + 1, "/", len(xbrl_files))
-        df_facts = get_facts(model_manager, xbrl_file)
-        if df_facts is not None:
-            list_df_facts.append(df_facts)
-    if list_df_facts:
-        df_xbrl = pd.concat(list_df_facts, axis=0, sort=False)
-        # Edinetコードリストの情報をマージ
-        df_edinetcd_info = get_edinetcd_info(EDINETCDDLINFO_COLS)
-        df_xbrl = df_edinetcd_info.merge(df_xbrl, on=EDINETCD_COL, how="right")
-        df_xbrl.to_csv(
-            os.path.join(EDINET_ROOT_DIR, OUTPUT_FILE_NAME),
-            index=False,
-            encoding="cp932"
-        )
-        print(f"{'-'*10} 情報抽出　完了 {'-'*10}")
-    else:
-        print("処理対象のデータはありませんでした。")
+    xbrl_files = find_xbrl_files(
+        EDINET_ROOT_DIR, EDINET_XBRL_REGREX, EDINET_XBRL_MEMBER_REGREX, IS_EXTRACTED, READ_FROM_ZIP)
+    # XBRLから情報取得（隔離リスト・差分解析・事前絞り込み・書き出しは xbrl_batch.run_extraction 参照）
+    run_extraction(
+        get_facts, xbrl_files, EDINET_ROOT_DIR,
+        {"segment": (create_writer, OUTPUT_FILE_NAME)}, OUTPUT_FORMAT, extractor_name="segment",
+        max_workers=PARSE_MAX_WORKERS, metrics_file=METRICS_FILE,
+        quarantine_file=QUARANTINE_FILE, reprocess_quarantine=REPROCESS_QUARANTINE,
+        manifest_file=PARSE_MANIFEST_FILE if INCREMENTAL else None,
+        version_modules=[__name__],
+        prefilter=(is_target_dei, PREFILTER_DEI_COLS) if DEI_PREFILTER else None,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+"""
+1回の読み込みで、DEI・貸借対照表・損益計算書・セグメント情報・階層構造の一覧表を取得する
+
+【備考】
+- 各サンプルコードを個別に実行すると、同じXBRLファイルを何度も読み込む（model_manager.load）
+  このスクリプトでは提出書類ごとに1度だけ読み込み、読み込み済みの ModelXbrl に対し
+  TGT_EXTRACTORS で指定した取得処理を順に実行する
+- 取得処理ごとの設定（取得対象のDEI・様式指定・リンクロールなど）は各サンプルコードの定数に従う
+- 取得処理ごとに出力する（出力ファイル名は OUTPUT_FILE_NAMES で指定）
+- ある取得処理が失敗しても、同じファイルに対する他の取得処理は続行する
+  - 一部の取得処理が失敗したファイルも、失敗した取得処理とエラー内容を隔離リストに記録する
+- DEIのみ取得する場合（TGT_EXTRACTORS = ["dei"]）、提出書類を Arelle で読み込まない
+  - DEIの値は dei_reader.py でインスタンス文書から直接読み込む
+  - 要素のラベル・型は、DEIタクソノミのスキーマのみ Arelle で読み込んで取得する
+    （DEIタクソノミのバージョンごとに1度だけ。提出者別タクソノミでのDEIのラベルの変更は反映しない）
+"""
+
+import sys
+
+import xbrl_parser_for_bs
+import xbrl_parser_for_pl
+import xbrl_parser_for_segment
+import xbrl_view_facts
+from arelle.ModelValue import qname
+from dei_reader import read_dei_facts
+from edinetcd_info import get_edinetcd_index, merge_edinetcd_info
+from filing_anomaly import format_error, get_error_record
+from instrumentation import phase
+from label_resolver import get_label
+from output_writer import FactValue, create_chunked_writer, fact_value
+from xbrl_batch import find_xbrl_files, load_model, run_extraction
+
+# パス関連
+EDINET_ROOT_DIR = "D:\\EDINET\\120_yuho_test"
+EDINET_XBRL_REGREX = "*\\XBRL\\PublicDoc\\*.xbrl"
+# zipファイル内のXBRLファイルのパス（正規表現）
+EDINET_XBRL_MEMBER_REGREX = r"^XBRL/PublicDoc/[^/]+\.xbrl$"
+
+# EDINETからダウンロードしたXBRLを含むzipファイルが解凍済かどうか
+IS_EXTRACTED = True
+# zipファイルを解凍せずに、zip内のXBRLを直接読み込むかどうか
+# （Trueの場合、IS_EXTRACTEDの値によらず解凍しない）
+READ_FROM_ZIP = False
+
+# 解析に使用するプロセス数（2以上の場合、プロセスプールで並列解析）
+PARSE_MAX_WORKERS = 1
+
+# 実行する取得処理
+# - dei: 会社・書類情報
+# - bs: 貸借対照表の第三階層の勘定科目（xbrl_parser_for_bs.py）
+# - pl: 損益計算書の第一階層の勘定科目（xbrl_parser_for_pl.py）
+# - segment: セグメント情報（xbrl_parser_for_segment.py）
+# - view_facts: 階層構造の一覧表（xbrl_view_facts.py。提出書類ごとにファイルを出力。
+#   xbrl_view_facts.OUTPUT_COMBINED = True の場合、全提出書類の一覧表を1つのファイルに出力）
+TGT_EXTRACTORS = ["dei", "bs", "pl", "segment", "view_facts"]
+# Arelle で読み込む前に、DEIの値で処理対象のファイルを絞り込むかどうか（dei_reader.py 参照）
+# 【備考】dei・view_facts は全てのファイルが対象のため、これらを実行する場合は絞り込まない
+DEI_PREFILTER = True
+
+# 前回の実行以降に追加・変更されたファイルのみ解析し、既存の出力ファイルにマージするかどうか
+INCREMENTAL = False
+# 解析済みのファイルの記録（EDINET_ROOT_DIR 配下に作成）
+PARSE_MANIFEST_FILE = "parse_manifest_pipeline.jsonl"
+
+# 解析に失敗したファイルとエラー内容を記録する隔離リスト（filing_anomaly.py 参照）
+QUARANTINE_FILE = "quarantine_pipeline.jsonl"
+# 隔離リストのファイルのみ解析し直し、既存の出力ファイルにマージするかどうか
+REPROCESS_QUARANTINE = False
+
+# 取得結果を企業ごとのパネルデータ（company_panel.py 参照）にマージするかどうか
+# （訂正報告書の取得結果は、訂正元の提出書類の取得結果を置き換える）
+UPDATE_PANEL = False
+# パネルデータにマージする取得処理（TGT_EXTRACTORS で実行するもののみ）
+PANEL_EXTRACTORS = ["bs", "pl"]
+
+# ファイルごとの処理段階の所要時間・件数の出力先（JSON Lines。Noneの場合、表示のみ）
+# 【備考】取得処理ごとの所要時間は「extractor_取得処理名」として記録する
+METRICS_FILE = "parse_metrics_pipeline.jsonl"
+
+# 取得処理ごとの出力ファイル名
+# （view_facts は xbrl_view_facts.OUTPUT_COMBINED = False の場合、
+#   提出書類ごとに xbrl_view_facts.OUTPUT_FILE_NAME のファイル名で出力する）
+OUTPUT_FILE_NAMES = {
+    "dei": "dei.csv",
+    "bs": xbrl_parser_for_bs.OUTPUT_FILE_NAME,
+    "pl": xbrl_parser_for_pl.OUTPUT_FILE_NAME,
+    "segment": xbrl_parser_for_segment.OUTPUT_FILE_NAME,
+    "view_facts": xbrl_view_facts.COMBINED_OUTPUT_FILE_NAME,
+}
+# 出力形式（view_facts 以外。"csv": cp932のCSV, "parquet": 型付きのParquet。pyarrowが必要）
+OUTPUT_FORMAT = "csv"
+
+# ----- 財務情報XBRLから取得する内容 -----
+# 取得対象のDEI（会社・書類情報）
+# 各サンプルコードで取得対象としているDEIをまとめて取得する（会計基準・様式によらず全て出力）
+DEI_COLS = list(dict.fromkeys(
+    xbrl_parser_for_segment.DEI_COLS
+    + xbrl_parser_for_bs.DEI_COLS
+    + xbrl_parser_for_pl.DEI_COLS
+))
+
+# DEIタクソノミのスキーマのファイル名（DEIのみ取得する場合に使う。{version}はDEIタクソノミのバージョン（日付））
+DEI_SCHEMA_FILE_NAME = "jpdei_cor_{version}.xsd"
+
+# ----- EDINETコードリストから取得する列 -----
+EDINETCD_COL = "ＥＤＩＮＥＴコード"
+EDINETCDDLINFO_COLS = [
+    EDINETCD_COL,
+    "提出者業種",
+    "上場区分",
+    "提出者種別",
+    "提出者名"
+]
+
+
+def get_dei_facts(model_xbrl):
+    """XBRLデータから会社・書類情報を取得する"""
+
+    qname_prefix = "jpdei_cor"
+    ns = model_xbrl.prefixedNamespaces[qname_prefix]
+    dict_facts = {}
+
+    for localname in DEI_COLS:
+        facts = model_xbrl.factsByQname[qname(
+            ns, name=f"{qname_prefix}:{localname}")]
+        if not facts:
+            continue
+        if len(facts) > 1:
+            print(f"【想定外】1つのXBRL内に{qname_prefix}:{localname}のfactが複数存在します。")
+        fact = list(facts)[0]
+        if localname == xbrl_parser_for_bs.EDINET_CD_ELM_NAME:
+            dict_facts[EDINETCD_COL] = fact_value(fact)
+        else:
+            dict_facts[get_label(model_xbrl, fact.qname)] = fact_value(fact)
+
+    return [dict_facts]
+
+
+# DEIタクソノミの名前空間ごとの {要素名: (QName, 型, ラベル)}（ワーカープロセスごとに保持される）
+_dei_concepts = {}
+
+
+def get_dei_concepts(model_manager, namespace):
+    """DEIタクソノミのスキーマのみ読み込み、DEI_COLS の要素のQName・型・ラベルを取得する"""
+
+    dei_concepts = _dei_concepts.get(namespace)
+    if dei_concepts is not None:
+        return dei_concepts
+    # 【備考】名前空間は「.../jpdei/{バージョン}/jpdei_cor」、スキーマは同じ階層に置かれる
+    base_url = namespace.rsplit("/", 1)[0]
+    schema_url = base_url + "/" + DEI_SCHEMA_FILE_NAME.format(version=base_url.rsplit("/", 1)[1])
+    dei_concepts = {}
+    with load_model(model_manager, schema_url) as model_xbrl:
+        for localname in DEI_COLS:
+            dei_qname = qname(namespace, name=f"jpdei_cor:{localname}")
+            concept = model_xbrl.qnameConcepts.get(dei_qname)
+            if concept is None:
+                continue
+            dei_concepts[localname] = (
+                str(dei_qname), concept.baseXsdType, get_label(model_xbrl, dei_qname))
+    _dei_concepts[namespace] = dei_concepts
+    return dei_concepts
+
+
+def get_dei_only_facts(model_manager, xbrl_file):
+    """
+    DEIのみ取得する場合に、XBRLファイルを Arelle で読み込まずに会社・書類情報を取得する
+    戻り値: get_facts と同じ
+    """
+
+    with phase("extractor_dei"):
+        namespace, dei_values = read_dei_facts(xbrl_file, DEI_COLS)
+    dei_concepts = get_dei_concepts(model_manager, namespace) if namespace else {}
+    dict_facts = {}
+    for localname in DEI_COLS:
+        if localname not in dei_values:
+            continue
+        # 【備考】DEIタクソノミにない要素は、要素名を列名とする
+        qname_str, xbrl_type, label = dei_concepts.get(localname, (None, None, localname))
+        value = FactValue(dei_values[localname], qname=qname_str, xbrl_type=xbrl_type)
+        if localname == xbrl_parser_for_bs.EDINET_CD_ELM_NAME:
+            dict_facts[EDINETCD_COL] = value
+        else:
+            dict_facts[label] = value
+    return {"dei": [dict_facts]}, {}
+
+
+def create_dei_writer(output_path, output_format="csv", merge_existing=False):
+    """ファイルごとの会社・書類情報を書き出すライターを作成する"""
+
+    # 書き出す前に、Edinetコードリストの情報をマージ
+    edinetcd_index = get_edinetcd_index(EDINETCDDLINFO_COLS, EDINETCD_COL)
+    return create_chunked_writer(
+        output_path,
+        output_format,
+        merge_existing=merge_existing,
+        transform=lambda df_dei: merge_edinetcd_info(df_dei, edinetcd_index, EDINETCD_COL)
+    )
+
+
+# 事前絞り込みの判定を行うモジュール（is_target_dei, PREFILTER_DEI_COLS を定義）
+PREFILTER_MODULES = {
+    "bs": xbrl_parser_for_bs,
+    "pl": xbrl_parser_for_pl,
+    "segment": xbrl_parser_for_segment,
+}
+
+
+def is_target_dei(dei_values):
+    """DEIの値から、いずれかの取得処理の処理対象のファイルか判定する（事前絞り込み用）"""
+
+    return any(
+        PREFILTER_MODULES[extractor_name].is_target_dei(dei_values)
+        for extractor_name in TGT_EXTRACTORS
+    )
+
+
+# 取得処理名: (読み込み済みの ModelXbrl から情報を取得する関数, 取得結果のライターを作成する関数)
+# 【備考】ライターとして None を返す取得処理は、取得時にファイルを出力する
+# （view_facts は提出書類ごとの一覧表を、このスクリプトの EDINET_ROOT_DIR に出力する）
+EXTRACTORS = {
+    "dei": (get_dei_facts, create_dei_writer),
+    "bs": (xbrl_parser_for_bs.extract_facts, xbrl_parser_for_bs.create_writer),
+    "pl": (xbrl_parser_for_pl.extract_facts, xbrl_parser_for_pl.create_writer),
+    "segment": (xbrl_parser_for_segment.extract_facts, xbrl_parser_for_segment.create_writer),
+    "view_facts": (
+        lambda model_xbrl: xbrl_view_facts.extract_facts(model_xbrl, EDINET_ROOT_DIR),
+        xbrl_view_facts.create_writer
+    ),
+}
+
+
+def get_facts(model_manager, xbrl_file):
+    """
+    XBRLファイルを1度だけ読み込み、TGT_EXTRACTORS の取得処理を実行する
+    戻り値: ({取得処理名: 取得結果}, {取得処理名: エラー内容})（取得結果に失敗した取得処理は含めない）
+    """
+
+    dict_results = {}
+    dict_errors = {}
+    with load_model(model_manager, xbrl_file) as model_xbrl:
+        for extractor_name in TGT_EXTRACTORS:
+            extract, _ = EXTRACTORS[extractor_name]
+            # 【備考】取得処理中の sys.exit() も取得処理単位の失敗として扱う
+            try:
+                with phase(f"extractor_{extractor_name}"):
+                    dict_results[extractor_name] = extract(model_xbrl)
+            except (Exception, SystemExit) as e:
+                dict_errors[extractor_name] = get_error_record(e, extractor_name)
+                print(f"取得失敗: {xbrl_file} {format_error(dict_errors[extractor_name])}")
+    return dict_results, dict_errors
+
+
+def main():
+    for extractor_name in TGT_EXTRACTORS:
+        if extractor_name not in EXTRACTORS:
+            print(f"取得処理の指定が想定外です: {extractor_name}")
+            print(f"想定: {list(EXTRACTORS)}")
+            sys.exit()
+
+    xbrl_files = find_xbrl_files(
+        EDINET_ROOT_DIR, EDINET_XBRL_REGREX, EDINET_XBRL_MEMBER_REGREX, IS_EXTRACTED, READ_FROM_ZIP)
+    prefilter = None
+    if DEI_PREFILTER and all(
+            extractor_name in PREFILTER_MODULES for extractor_name in TGT_EXTRACTORS):
+        # 【備考】全ての取得処理で処理対象外となるファイルは、Arelle で読み込まない
+        prefilter = (is_target_dei, list(dict.fromkeys(
+            localname for extractor_name in TGT_EXTRACTORS
+            for localname in PREFILTER_MODULES[extractor_name].PREFILTER_DEI_COLS
+        )))
+    # XBRLから情報取得（提出書類ごとに1度だけ読み込む。DEIのみ取得する場合、Arelle で読み込まない）
+    # 【備考】実行する取得処理の指定が変わった場合も、差分解析では全ファイルを解析し直す
+    run_extraction(
+        get_dei_only_facts if TGT_EXTRACTORS == ["dei"] else get_facts, xbrl_files, EDINET_ROOT_DIR,
+        {extractor_name: (EXTRACTORS[extractor_name][1], OUTPUT_FILE_NAMES[extractor_name])
+         for extractor_name in TGT_EXTRACTORS},
+        OUTPUT_FORMAT, max_workers=PARSE_MAX_WORKERS, metrics_file=METRICS_FILE,
+        quarantine_file=QUARANTINE_FILE, reprocess_quarantine=REPROCESS_QUARANTINE,
+        manifest_file=PARSE_MANIFEST_FILE if INCREMENTAL else None,
+        version_modules=[__name__, "xbrl_parser_for_bs", "xbrl_parser_for_pl",
+                         "xbrl_parser_for_segment", "xbrl_view_facts"],
+        version_options=[TGT_EXTRACTORS],
+        prefilter=prefilter,
+        panel_extractors=[
+            extractor_name for extractor_name in PANEL_EXTRACTORS if extractor_name in TGT_EXTRACTORS
+        ] if UPDATE_PANEL else None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,221 @@
 """
 Arelleを使ったサンプルコード３
 XBRL形式のデータを階層構造で出力する
+
+【備考】
+- 提出書類ごとに1度だけ読み込み、TGT_LINK_ROLES の全てのリンクロールを出力する
+- OUTPUT_COMBINED = False の場合、提出書類ごとに Arelle の ViewFileFactTable でCSVを出力する
+  - リンクロールを複数指定した場合は、リンクロールごとにCSVを出力する
+- OUTPUT_COMBINED = True の場合、全提出書類・全リンクロールの一覧表を1つのファイルに出力する
+  - 表示リンクの親子関係をたどり、1行1factの縦持ちの表（提出書類・リンクロールの列を含む）とする
+    （factのない要素（タイトル項目など）も1行出力し、階層構造を残す）
+  - 取得結果は解析の完了したファイルから順に、一定件数ごとに書き出す（output_writer.py 参照）
+- PARSE_MAX_WORKERS が2以上の場合、プロセスプールで並列に出力する
 """
 
-import glob
 import os
 import re
-import sys
 
 import pandas as pd
 
-from arelle import Cntlr, ModelManager, ViewFileFactTable
-from utils import extract_files_from_zip
+from arelle import ViewFileFactTable, XbrlConst
+from instrumentation import phase
+from label_resolver import get_label_resolver
+from output_writer import FactValue, create_chunked_writer
+from presentation_walker import walk
+from xbrl_batch import find_xbrl_files, load_model, run_extraction
 
 # パス関連
 EDINET_ROOT_DIR = "D:\\EDINET\\120_yuho_test"
 EDINET_XBRL_REGREX = "*\\XBRL\\PublicDoc\\*.xbrl"
+# zipファイル内のXBRLファイルのパス（正規表現）
+EDINET_XBRL_MEMBER_REGREX = r"^XBRL/PublicDoc/[^/]+\.xbrl$"
 OUTPUT_FILE_NAME = "yuho_viewFacts_{fname}.csv"
+# リンクロールを複数指定した場合の、リンクロールごとの出力ファイル名
+# （role はリンクロールのURIの末尾。例: rol_BusinessResultsOfReportingCompany）
+OUTPUT_FILE_NAME_PER_LINK_ROLE = "yuho_viewFacts_{fname}_{role}.csv"
+
+# 取得対象のリンクロールのリスト
+#TGT_LINK_ROLES = None #リンクロール指定しない（全てのリンクロール。空のリストの場合も同じ）
+TGT_LINK_ROLES = [
+    "http://disclosure.edinet-fsa.go.jp/role/jpcrp/rol_BusinessResultsOfReportingCompany",
+]
 
-# 取得対象のリンクロール
-#TGT_LINK_ROLE = None #リンクロール指定しない
-TGT_LINK_ROLE = "http://disclosure.edinet-fsa.go.jp/role/jpcrp/rol_BusinessResultsOfReportingCompany"
+# 全提出書類・全リンクロールの一覧表を1つのファイルに出力するかどうか
+OUTPUT_COMBINED = False
+# 上記の出力ファイル名
+COMBINED_OUTPUT_FILE_NAME = "yuho_viewFacts.csv"
+# 上記の出力形式（"csv": cp932のCSV, "parquet": 型付きのParquet。pyarrowが必要）
+OUTPUT_FORMAT = "csv"
+# 上記の一覧表で走査する表示リンクの階層の深さの上限
+VIEW_MAX_DEPTH = 100
 
 # EDINETからダウンロードしたXBRLを含むzipファイルが解凍済かどうか
 IS_EXTRACTED = True
+# zipファイルを解凍せずに、zip内のXBRLを直接読み込むかどうか
+# （Trueの場合、IS_EXTRACTEDの値によらず解凍しない）
+READ_FROM_ZIP = False
+
+# 解析に使用するプロセス数（2以上の場合、プロセスプールで並列解析）
+PARSE_MAX_WORKERS = 1
+
+# ファイルごとの処理段階の所要時間・件数の出力先（JSON Lines。Noneの場合、表示のみ）
+METRICS_FILE = "parse_metrics_view_facts.jsonl"
+
+# EDINETコードを設定する列
+EDINETCD_COL = "ＥＤＩＮＥＴコード"
+
+
+def get_edinetcd(model_xbrl):
+    """XBRLファイル名からEDINETコードを取得する"""
+
+    # 【備考】zipファイル内のXBRLの場合も、ファイル名部分からEDINETコードを取得する
+    return re.search(r'E\d+', os.path.split(model_xbrl.modelDocument.filepath)[1]).group()
+
+
+def get_link_roles(model_xbrl):
+    """
+    出力するリンクロールのリストを取得する
+    TGT_LINK_ROLES が None（または空のリスト）の場合、表示リンクの全てのリンクロール（定義の順）
+    """
+
+    if TGT_LINK_ROLES:
+        return list(TGT_LINK_ROLES)
+    link_roles = model_xbrl.relationshipSet(XbrlConst.parentChild).linkRoleUris
+    return sorted(link_roles, key=lambda link_role: get_link_role_definition(model_xbrl, link_role))
+
+
+def get_link_role_definition(model_xbrl, link_role):
+    """リンクロールの定義（「010010 有価証券報告書（表紙）」など。ない場合はURI）"""
+
+    role_types = model_xbrl.roleTypes.get(link_role)
+    if role_types and role_types[0].definition:
+        return role_types[0].definition
+    return link_role
+
+
+def export_model_facts(model_xbrl, output_dir):
+    """読み込み済みのXBRLデータを階層構造で出力する（提出書類ごと、リンクロールを複数指定した場合はリンクロールごと）"""
+
+    filename = get_edinetcd(model_xbrl)
+    if (not TGT_LINK_ROLES) or (len(TGT_LINK_ROLES) == 1):
+        # 【備考】リンクロールを指定しない場合（None・空のリスト）、Arelle が全てのリンクロールを1つのCSVに出力する
+        ViewFileFactTable.viewFacts(
+            model_xbrl,
+            os.path.join(output_dir, OUTPUT_FILE_NAME.format(fname=filename)),
+            linkrole=TGT_LINK_ROLES[0] if TGT_LINK_ROLES else None
+        )
+        return
+    for link_role in TGT_LINK_ROLES:
+        ViewFileFactTable.viewFacts(
+            model_xbrl,
+            os.path.join(output_dir, OUTPUT_FILE_NAME_PER_LINK_ROLE.format(
+                fname=filename, role=link_role.rstrip("/").rsplit("/", 1)[-1])),
+            linkrole=link_role
+        )
+
+
+def get_view_facts(model_xbrl):
+    """
+    読み込み済みのXBRLデータから、リンクロールごとの階層構造の一覧表を縦持ちの表で取得する
+    （1行1fact。factのない要素は1行）
+    """
+
+    label_resolver = get_label_resolver(model_xbrl)
+    edinetcd = get_edinetcd(model_xbrl)
+    rows = []
+    with phase("traversal"):
+        for link_role in get_link_roles(model_xbrl):
+            pc_rel_set = model_xbrl.relationshipSet(XbrlConst.parentChild, linkrole=link_role)
+            if not pc_rel_set:
+                continue
+            link_role_definition = get_link_role_definition(model_xbrl, link_role)
+            row_num = 0
+            for root_mcpt in pc_rel_set.rootConcepts:
+                # 【備考】起点の要素自体を階層1とし、子孫を続けて出力する
+                mcpts = [(1, root_mcpt)] + [
+                    (depth + 1, mcpt) for depth, _, mcpt, _ in walk(pc_rel_set, root_mcpt, VIEW_MAX_DEPTH)]
+                for depth, mcpt in mcpts:
+                    row_num += 1
+                    row = {
+                        EDINETCD_COL: edinetcd,
+                        "リンクロール": link_role,
+                        "リンクロールの定義": link_role_definition,
+                        "表示順": row_num,
+                        "階層": depth,
+                        "要素": str(mcpt.qname),
+                        "ラベル": label_resolver.label(mcpt.qname),
+                    }
+                    facts = sorted(model_xbrl.factsByQname.get(mcpt.qname, ()),
+                                   key=lambda fact: fact.objectIndex)
+                    if not facts:
+                        rows.append(row)
+                        continue
+                    for fact in facts:
+                        rows.append({**row, **get_fact_cols(fact)})
+    if not rows:
+        return None
+    # 【備考】factの値（FactValue）を文字列型に変換せずに保持するため、object型で作成する
+    return pd.DataFrame(rows, dtype=object)
+
+
+def get_fact_cols(fact):
+    """一覧表の1factの列（コンテキスト・会計期間・単位・値）"""
+
+    context = fact.context
+    cols = {
+        "コンテキストID": fact.contextID,
+        "会計期間": context.period.stringValue if context is not None else None,
+        "単位": fact.unitID,
+        "値": fact.value,
+    }
+    # 【備考】要素の型の異なるfactが同じ列に入るため、数値のfactのみ数値の列にも設定する
+    # （Parquet の場合、数値の列を数値型で出力する）
+    if fact.isNumeric and (not fact.isNil):
+        cols["数値"] = FactValue(
+            fact.value, qname="", xbrl_type="decimal",
+            decimals=fact.decimals, scale=getattr(fact, "scale", None))
+    return cols
+
+
+def extract_facts(model_xbrl, output_dir=None):
+    """
+    読み込み済みのXBRLデータの階層構造の一覧表を取得・出力する
+    OUTPUT_COMBINED = True の場合、一覧表（DataFrame）を返す
+    OUTPUT_COMBINED = False の場合、提出書類ごとに output_dir（None の場合、EDINET_ROOT_DIR）に出力し、None を返す
+    """
+
+    if OUTPUT_COMBINED:
+        return get_view_facts(model_xbrl)
+    export_model_facts(model_xbrl, EDINET_ROOT_DIR if output_dir is None else output_dir)
+    return None
 
 
 def export_facts(model_manager, xbrl_file):
     """XBRLデータを階層構造で出力する"""
 
-    model_xbrl = model_manager.load(xbrl_file)
-    filename = re.search(r'E\d+', os.path.split(xbrl_file)[1]).group()
-    ViewFileFactTable.viewFacts(
-        model_xbrl,
-        os.path.join(EDINET_ROOT_DIR, OUTPUT_FILE_NAME.format(fname=filename)),
-        linkrole=TGT_LINK_ROLE
-    )
-    model_manager.close()
+    with load_model(model_manager, xbrl_file) as model_xbrl:
+        return extract_facts(model_xbrl)
+
+
+def create_writer(output_path, output_format="csv", merge_existing=False):
+    """全提出書類の一覧表を書き出すライターを作成する（一覧表を提出書類ごとに出力する場合、None）"""
+
+    if not OUTPUT_COMBINED:
+        return None
+    return create_chunked_writer(output_path, output_format, merge_existing=merge_existing)
 
 
 def main():
-    if IS_EXTRACTED:
-        pass
-    else:
-        edinet_zip_dir = os.path.join(EDINET_ROOT_DIR, "zip")
-        extract_files_from_zip(
-            edinet_zip_dir,
-            dest_dir_root=EDINET_ROOT_DIR,
-            unzip_members_regrep="|".join(
-                [f"XBRL/PublicDoc/.*\.{extension}" for extension in ["xbrl", "xsd", "xml"]]
-            )
-        )
+    xbrl_files = find_xbrl_files(
+        EDINET_ROOT_DIR, EDINET_XBRL_REGREX, EDINET_XBRL_MEMBER_REGREX, IS_EXTRACTED, READ_FROM_ZIP)
     # XBRLから情報取得
-    xbrl_file_regrex = os.path.join(EDINET_ROOT_DIR, EDINET_XBRL_REGREX)
-    xbrl_files = glob.glob(xbrl_file_regrex)
-    ctrl = Cntlr.Cntlr()
-    model_manager = ModelManager.initialize(ctrl)
-    for index, xbrl_file in enumerate(xbrl_files):
-        print(xbrl_file, ":", index + 1, "/", len(xbrl_files))
-        export_facts(model_manager, xbrl_file)
-
-    print(f"{'-'*10} XBRL出力　完了 {'-'*10}")
+    # 【備考】一覧表を1つのファイルに出力する場合、解析の完了したファイルから順に、一定件数ごとに書き出す
+    run_extraction(
+        export_facts, xbrl_files, EDINET_ROOT_DIR,
+        {"view_facts": (create_writer, COMBINED_OUTPUT_FILE_NAME)}, OUTPUT_FORMAT,
+        extractor_name="view_facts", max_workers=PARSE_MAX_WORKERS, metrics_file=METRICS_FILE
+    )
 
 
 if __name__ == "__main__":